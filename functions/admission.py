@@ -0,0 +1,150 @@
+"""
+Cost-aware admission control for the expensive endpoints.
+
+Cada petición a /calculate, /generate-excel y /generate-json recibe un costo
+estimado a partir de su payload (número de fechas). Una instancia admite trabajo
+pesado hasta ADMISSION_CAPACITY_UNITS en paralelo; el resto espera en una cola
+acotada (en orden de llegada). Si la cola está llena se responde 429 y si la
+espera supera ADMISSION_QUEUE_TIMEOUT_SECONDS, 503; ambas con Retry-After.
+Los endpoints baratos (/getHolidays, /consultar-ruc) no pasan por aquí.
+"""
+import math
+import os
+import threading
+from collections import deque
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from flask import request
+
+import structured_logging
+from services import ApiError
+
+logger = structured_logging.get_logger(__name__)
+
+ADMISSION_CAPACITY_UNITS = float(os.environ.get("ADMISSION_CAPACITY_UNITS", "100"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+
+# (costo base, costo por fecha) de cada endpoint. Una unidad equivale
+# aproximadamente al trabajo de calcular un plan pequeño; un Excel de 1000
+# fechas cuesta ~15 unidades.
+ENDPOINT_COSTS: Dict[str, tuple] = {
+    'calculate': (1.0, 0.0005),
+    'generate-json': (1.0, 0.002),
+    'generate-excel': (5.0, 0.01),
+}
+
+class CostLimiter:
+    """
+    Semáforo ponderado con cola de espera FIFO acotada.
+
+    Args:
+        capacity: Unidades de costo que pueden ejecutarse en paralelo.
+        max_queue: Peticiones que pueden esperar; las siguientes se rechazan.
+        queue_timeout: Segundos máximos de espera en la cola.
+    """
+
+    def __init__(self, capacity: float = ADMISSION_CAPACITY_UNITS, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_use = 0.0
+        self._waiters: deque = deque()
+        self._condition = threading.Condition()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _fits(self, cost: float) -> bool:
+        # Una petición más cara que la capacidad total se admite sola, con la instancia libre.
+        return self.in_use + cost <= self.capacity or self.in_use == 0
+
+    def acquire(self, cost: float, timeout: Optional[float] = None) -> None:
+        """
+        Reserva `cost` unidades, esperando en la cola si es necesario.
+
+        Raises:
+            ApiError: 429 si la cola está llena, 503 si se agotó la espera.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._condition:
+            if not self._waiters and self._fits(cost):
+                self.in_use += cost
+                return
+            if len(self._waiters) >= self.max_queue:
+                raise _rejection("Demasiadas solicitudes en proceso. Intente nuevamente en unos segundos.", 429)
+
+            ticket = object()
+            self._waiters.append(ticket)
+            try:
+                admitted = self._condition.wait_for(
+                    lambda: self._waiters[0] is ticket and self._fits(cost), timeout=timeout
+                )
+                if not admitted:
+                    raise _rejection("El servidor está ocupado. Intente nuevamente en unos segundos.", 503)
+                self.in_use += cost
+            finally:
+                self._waiters.remove(ticket)
+                # El siguiente en la cola puede caber con la capacidad restante.
+                self._condition.notify_all()
+
+    def release(self, cost: float) -> None:
+        with self._condition:
+            self.in_use = max(0.0, self.in_use - cost)
+            self._condition.notify_all()
+
+def _rejection(message: str, status_code: int) -> ApiError:
+    return ApiError(message, status_code, headers={'Retry-After': str(ADMISSION_RETRY_AFTER_SECONDS)})
+
+def count_payload_dates(data: Any) -> int:
+    """Cuenta las fechas de un payload de cálculo o de reporte."""
+    if not isinstance(data, dict):
+        return 0
+    for key in ('fechasValidas', 'fechasOrdenadas', 'montosAsignados'):
+        value = data.get(key)
+        if isinstance(value, (list, dict)):
+            return len(value)
+    return 0
+
+def estimate_cost(endpoint: str, data: Any) -> float:
+    """Costo estimado en unidades, acotado a la capacidad de la instancia."""
+    base, per_date = ENDPOINT_COSTS[endpoint]
+    cost = base + per_date * count_payload_dates(data)
+    return min(math.ceil(cost * 10) / 10, get_limiter().capacity)
+
+_limiter = CostLimiter()
+
+def get_limiter() -> CostLimiter:
+    return _limiter
+
+def reset_after_fork() -> None:
+    """Cada worker del servidor admite trabajo con su propia capacidad."""
+    global _limiter
+    _limiter = CostLimiter()
+
+def admission_controlled(endpoint: str) -> Callable:
+    """Decorador que admite la petición según su costo estimado antes de ejecutarla."""
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # get_json cachea el resultado: la vista no vuelve a parsear el cuerpo.
+            cost = estimate_cost(endpoint, request.get_json(silent=True))
+            limiter = get_limiter()
+            try:
+                limiter.acquire(cost)
+            except ApiError as e:
+                logger.warning("Request rejected by admission control", extra={
+                    'endpoint': endpoint, 'cost': cost, 'status': e.status_code,
+                    'inUse': limiter.in_use, 'queued': limiter.queued,
+                })
+                raise
+            try:
+                return view(*args, **kwargs)
+            finally:
+                limiter.release(cost)
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+"""
+Benchmark de latencia de cola con y sin el pool de procesos para Excel.
+
+Ejecuta el harness de carga dos veces sobre un único worker de gunicorn con
+hilos (el caso en que un reporte grande retiene el GIL), primero generando los
+Excel en el hilo de la petición y luego en el pool de procesos, y compara los
+percentiles de los endpoints baratos.
+
+Uso (desde la carpeta functions):
+    python -m benchmarks.bench_excel_pool [--duration 20] [--pool-workers 2]
+
+Resultado de referencia (1 vCPU, 15 s, planes de hasta 800 fechas), en ms:
+
+    endpoint          p50 hilo  p50 pool  p95 hilo  p95 pool  p99 hilo  p99 pool
+    getHolidays           45.3       7.7     161.7      13.4     276.0      17.7
+    consultar-ruc        210.6      78.6     399.9      96.8     485.6     126.8
+    generate-excel      1341.4    1764.1    2616.9    2336.9    2713.7    2427.4
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from loadtest import harness  # noqa: E402
+
+CHEAP_ENDPOINTS = ('getHolidays', 'consultar-ruc')
+
+
+def _run(pool_workers: int, args) -> dict:
+    os.environ['EXCEL_PROCESS_POOL_WORKERS'] = str(pool_workers)
+    print(f"\n=== EXCEL_PROCESS_POOL_WORKERS={pool_workers} ===")
+    harness_args = harness.build_parser().parse_args([
+        '--workers', '1', '--threads', str(args.threads), '--clients', str(args.clients),
+        '--duration', str(args.duration), '--max-dates', str(args.max_dates),
+        '--mix', 'getHolidays=45,consultar-ruc=25,generate-excel=30',
+        '--firestore-latency', '0.005', '--ruc-latency', '0.05',
+    ])
+    return {row[0]: row for row in harness.run_load_test(harness_args)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--clients', type=int, default=8)
+    # Más hilos que clientes: así las peticiones baratas nunca esperan un hilo libre
+    # y la diferencia medida se debe solo al GIL.
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--max-dates', type=int, default=800)
+    parser.add_argument('--pool-workers', type=int, default=2)
+    args = parser.parse_args()
+
+    in_thread = _run(0, args)
+    pooled = _run(args.pool_workers, args)
+
+    print(f"\n{'endpoint':<16}{'p50 hilo':>10}{'p50 pool':>10}{'p95 hilo':>10}{'p95 pool':>10}"
+          f"{'p99 hilo':>10}{'p99 pool':>10}")
+    for endpoint in CHEAP_ENDPOINTS + ('generate-excel',):
+        if endpoint not in in_thread or endpoint not in pooled:
+            continue
+        a, b = in_thread[endpoint], pooled[endpoint]
+        print(f"{endpoint:<16}{a[4]:>10.1f}{b[4]:>10.1f}{a[5]:>10.1f}{b[5]:>10.1f}{a[6]:>10.1f}{b[6]:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark de serialización JSON para planes grandes.
+
+Compara la serialización estándar (json.dumps + encode) con json_provider
+sobre un plan de 10.000 fechas, tanto para el respaldo de /generate-json como
+para la respuesta de /calculate.
+
+Uso (desde la carpeta functions):
+    python -m benchmarks.bench_json [--dates 10000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json_provider  # noqa: E402
+from main import app  # noqa: E402
+from services import perform_calculation  # noqa: E402
+
+
+def build_plan(num_dates: int) -> dict:
+    """Construye un plan con `num_dates` fechas consecutivas."""
+    start = date(2025, 1, 1)
+    fechas = [(start + timedelta(days=i)).strftime("%d/%m/%Y") for i in range(num_dates)]
+    plan = perform_calculation(9876543.21, fechas)
+    plan.update({
+        "montoOriginal": 9876543.21,
+        "fechasOrdenadas": fechas,
+        "razonSocial": "Compañía de Prueba S.A.C.",
+        "linea": "vinifan",
+        "pedido": "BENCH-001",
+        "ruc": "20123456789",
+        "codigoCliente": "C-001",
+    })
+    return plan
+
+
+def _report(label: str, seconds: float, repeat: int, size: int):
+    print(f"{label:<42} {seconds / repeat * 1000:8.2f} ms/op  {size / 1024:8.1f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dates', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    plan = build_plan(args.dates)
+    encoder = "orjson" if json_provider.orjson is not None else "stdlib (orjson no instalado)"
+    print(f"Plan de {args.dates} fechas, {args.repeat} repeticiones, encoder rápido: {encoder}\n")
+
+    cases = [
+        ("respaldo: json.dumps(indent=4) + encode",
+         lambda: json.dumps(plan, indent=4, ensure_ascii=False).encode('utf-8')),
+        ("respaldo: dumps_bytes(indent=4)",
+         lambda: json_provider.dumps_bytes(plan, indent=4)),
+        ("respaldo: dumps_bytes (minificado)",
+         lambda: json_provider.dumps_bytes(plan)),
+        ("respuesta: json.dumps(sort_keys) + encode",
+         lambda: json.dumps(plan, separators=(',', ':'), sort_keys=True).encode('utf-8')),
+    ]
+    with app.test_request_context():
+        cases.append(("respuesta: FastJSONProvider.response",
+                      lambda: app.json.response(plan).get_data()))
+
+        for label, func in cases:
+            size = len(func())
+            _report(label, timeit.timeit(func, number=args.repeat), args.repeat, size)
+
+
+if __name__ == '__main__':
+    main()
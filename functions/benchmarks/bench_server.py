@@ -0,0 +1,73 @@
+"""
+Benchmark del servidor independiente (wsgi.py) frente al envoltorio de Cloud Functions.
+
+Ejecuta el harness de carga dos veces con la misma mezcla de tráfico: primero la
+app envuelta por functions-framework como en Cloud Functions (un proceso con
+varios hilos, `main.api` por petición) y luego wsgi.py con gunicorn.conf.py
+(preload en el maestro, varios workers con hilos), y compara throughput y
+percentiles por endpoint.
+
+Uso (desde la carpeta functions):
+    python -m benchmarks.bench_server [--duration 20] [--server-workers 3]
+
+Resultado de referencia (1 vCPU compartida con el generador de carga, 10 s,
+mezcla por defecto), en ms:
+
+    endpoint        req/s fn req/s srv   p50 fn  p50 srv   p95 fn  p95 srv
+    calculate           25.1      23.5    125.5     62.4    236.2    281.3
+    consultar-ruc       25.0      24.6    168.0    156.4    310.6    358.9
+    generate-excel      11.2      10.4    256.0    527.5    439.2    959.6
+    getHolidays         38.7      42.9    126.9     47.5    244.0    244.5
+
+Con una sola CPU los workers compiten entre sí y el throughput total es similar;
+la mediana de los endpoints baratos baja porque un Excel ya no retiene el GIL
+de todas las peticiones. La ganancia de throughput aparece con varias CPU.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from loadtest import harness  # noqa: E402
+
+
+def _run(entry: str, workers: int, threads: int, args) -> dict:
+    print(f"\n=== {entry}: {workers} worker(s) x {threads} hilos ===")
+    harness_args = harness.build_parser().parse_args([
+        '--entry', entry, '--workers', str(workers), '--threads', str(threads),
+        '--clients', str(args.clients), '--duration', str(args.duration),
+        '--max-dates', str(args.max_dates), '--mix', args.mix,
+        '--firestore-latency', '0.005', '--ruc-latency', '0.05',
+    ])
+    return {row[0]: row for row in harness.run_load_test(harness_args)}
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--max-dates', type=int, default=120)
+    parser.add_argument('--mix', default=harness.DEFAULT_MIX)
+    # functions-framework usa un worker con 4 hilos por CPU (THREADS) por defecto.
+    parser.add_argument('--functions-threads', type=int, default=cpus * 4)
+    parser.add_argument('--server-workers', type=int, default=cpus * 2 + 1)
+    parser.add_argument('--server-threads', type=int, default=4)
+    args = parser.parse_args()
+
+    functions = _run('functions', 1, args.functions_threads, args)
+    server = _run('server', args.server_workers, args.server_threads, args)
+
+    print(f"\n{'endpoint':<16}{'req/s fn':>10}{'req/s srv':>10}{'p50 fn':>9}{'p50 srv':>9}"
+          f"{'p95 fn':>9}{'p95 srv':>9}{'p99 fn':>9}{'p99 srv':>9}")
+    for endpoint in sorted(functions):
+        if endpoint not in server:
+            continue
+        a, b = functions[endpoint], server[endpoint]
+        print(f"{endpoint:<16}{a[3]:>10.1f}{b[3]:>10.1f}{a[4]:>9.1f}{b[4]:>9.1f}"
+              f"{a[5]:>9.1f}{b[5]:>9.1f}{a[6]:>9.1f}{b[6]:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""Exceptions shared by the service and data-access layers."""
+
+class ApiError(Exception):
+    """Custom exception for API errors."""
+    def __init__(self, message, status_code=400, headers=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def to_dict(self):
+        """Converts the ApiError object to a dictionary."""
+        return {'message': self.message}
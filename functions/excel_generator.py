@@ -1,15 +1,25 @@
 """Module for generating Excel reports."""
 from datetime import datetime
 from collections import defaultdict
+from io import BytesIO
 from typing import Dict, Any
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.chart import PieChart, Reference
 from openpyxl.chart.label import DataLabelList
+from openpyxl.utils import get_column_letter
 
+import metrics
 from utils import format_month_year_es, parse_date_str, _lighten_color
 
+# Tiempo de generación por tipo de reporte ('plan', 'portfolio') y modo ('full', 'streaming').
+EXCEL_RENDER_SECONDS = metrics.histogram(
+    'excel_render_seconds', 'Tiempo de generación de los libros Excel.', ('report', 'mode'),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
 # Colores para encabezados y totales (más suaves)
 HEADER_TOTAL_COLOR = "D9D9D9"
 
@@ -266,15 +276,11 @@ def _adjust_column_widths(ws):
     """Sets a fixed width for all columns in the worksheet."""
     # Según el requerimiento, se establece un ancho fijo de 17 para todas las columnas
     # para mantener un diseño consistente, en lugar de un auto-ajuste dinámico.
-    for col in ws.columns:
-        column_letter = None
-        for cell in col:
-            if hasattr(cell, 'column_letter'):
-                column_letter = cell.column_letter
-                break
-        if not column_letter:
-            continue
-        ws.column_dimensions[column_letter].width = 17
+    # Se recorren solo los índices de columna: iterar ws.columns crearía una celda
+    # vacía por cada posición del rectángulo usado, lo que dispara la memoria en
+    # planes con muchos meses (muchas columnas en "Detalle por Mes").
+    for col_idx in range(1, ws.max_column + 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = 17
 
 # --- Funciones Principales de Creación de Hojas ---
 def create_full_report_sheet(wb: Workbook, data: dict, color_hex: str):
@@ -354,4 +360,193 @@ def create_payment_detail_sheet(wb: Workbook, data: dict, color_hex: str):
     total_value_cell.border = styles['thin_border']
 
     # --- Ajuste de columnas ---
-    _adjust_column_widths(ws)
\ No newline at end of file
+    _adjust_column_widths(ws)
+
+
+# --- Reporte en Modo Streaming (Baja Memoria) ---
+def _write_only_cell(ws, value, styles: Dict[str, Any], font: str = None, fill: str = None,
+                     number_format: str = None, bordered: bool = True) -> WriteOnlyCell:
+    """Crea una celda para hojas write_only con los estilos indicados por clave."""
+    cell = WriteOnlyCell(ws, value=value)
+    if font:
+        cell.font = styles[font]
+    if fill:
+        cell.fill = styles[fill]
+    if number_format:
+        cell.number_format = styles[number_format]
+    if bordered:
+        cell.border = styles[STYLE_THIN_BORDER]
+    return cell
+
+def create_streaming_report(wb: Workbook, data: dict, color_hex: str):
+    """
+    Crea un reporte compacto en un libro `write_only`.
+
+    Las filas se escriben a disco a medida que se agregan, por lo que la memoria
+    no crece con el número de fechas. A cambio, el reporte usa una sola hoja,
+    sin celdas combinadas ni gráfico.
+    """
+    ws = wb.create_sheet(title="Reporte")
+    styles = _define_styles(color_hex)
+    for column_letter in ('A', 'B', 'C'):
+        ws.column_dimensions[column_letter].width = 17
+
+    def section_title(text):
+        ws.append([_write_only_cell(ws, text, styles, font=STYLE_SECTION_TITLE_FONT,
+                                    fill=STYLE_MAIN_COLOR_FILL, bordered=False)])
+
+    def header_row(headers):
+        ws.append([_write_only_cell(ws, text, styles, font=STYLE_TABLE_HEADER_FONT,
+                                    fill=STYLE_LIGHT_MAIN_COLOR_FILL) for text in headers])
+
+    ws.append([_write_only_cell(ws, "DISTRIBUCION DE MONTOS POR FECHA", styles,
+                                font=STYLE_MAIN_TITLE_FONT, fill=STYLE_MAIN_COLOR_FILL, bordered=False)])
+    ws.append([])
+
+    # --- Información General ---
+    section_title("Información General")
+    fechas_ordenadas = data.get(KEY_FECHAS_ORDENADAS, [])
+    info_data = [
+        ("Cód. Cliente:", data.get(KEY_CODIGO_CLIENTE, ''), None),
+        ("RUC:", data.get(KEY_RUC, ''), None),
+        ("Cliente:", data.get(KEY_RAZON_SOCIAL, ''), None),
+        ("Línea:", data.get(KEY_LINEA, ''), None),
+        ("Cód. Pedido:", data.get(KEY_PEDIDO, ''), None),
+        ("Monto Total:", data.get(KEY_MONTO_ORIGINAL, 0), STYLE_CURRENCY_FORMAT),
+        ("Total Letras:", len(fechas_ordenadas), None),
+    ]
+    if data.get(KEY_IS_RESTORED):
+        info_data.insert(0, ("Origen:", "Restaurado desde respaldo", None))
+    for label, value, number_format in info_data:
+        ws.append([
+            _write_only_cell(ws, label, styles, font=STYLE_BOLD_FONT),
+            _write_only_cell(ws, value, styles, number_format=number_format),
+        ])
+    ws.append([])
+
+    # --- Resumen Mensual ---
+    section_title("Resumen Mensual")
+    header_row(["Mes", "Monto (S/)", "Porcentaje"])
+    resumen_mensual = data.get(KEY_RESUMEN_MENSUAL, {})
+    total_monto_original = data.get(KEY_MONTO_ORIGINAL, 0)
+    for mes_key in sorted(resumen_mensual.keys(), key=lambda x: datetime.strptime(x, "%Y-%m")):
+        monto_mes = resumen_mensual[mes_key]
+        porcentaje = (monto_mes / total_monto_original) if total_monto_original > 0 else 0
+        ws.append([
+            _write_only_cell(ws, format_month_year_es(datetime.strptime(mes_key, "%Y-%m")), styles),
+            _write_only_cell(ws, monto_mes, styles, number_format=STYLE_CURRENCY_FORMAT),
+            _write_only_cell(ws, porcentaje, styles, number_format=STYLE_PERCENTAGE_FORMAT),
+        ])
+    ws.append([])
+
+    # --- Detalle de Vencimientos ---
+    section_title("Detalle de Vencimientos")
+    header_row(["N°", "Fecha de Vencimiento", "Monto (S/)"])
+    montos_asignados = data.get(KEY_MONTOS_ASIGNADOS, {})
+    for i, fecha_str in enumerate(fechas_ordenadas):
+        ws.append([
+            _write_only_cell(ws, i + 1, styles),
+            _write_only_cell(ws, fecha_str, styles),
+            _write_only_cell(ws, montos_asignados.get(fecha_str, 0), styles, number_format=STYLE_CURRENCY_FORMAT),
+        ])
+
+    # Sin acceso a las filas ya escritas, el total se calcula en Python en lugar de con SUM().
+    monto_total = round(sum(montos_asignados.get(fecha_str, 0) for fecha_str in fechas_ordenadas), 2)
+    ws.append([
+        _write_only_cell(ws, "Monto Total", styles, font=STYLE_BOLD_FONT, fill=STYLE_LIGHT_GRAY_FILL),
+        _write_only_cell(ws, None, styles, fill=STYLE_LIGHT_GRAY_FILL),
+        _write_only_cell(ws, monto_total, styles, font=STYLE_BOLD_FONT, fill=STYLE_LIGHT_GRAY_FILL,
+                         number_format=STYLE_CURRENCY_FORMAT),
+    ])
+
+
+def create_portfolio_report(wb: Workbook, summary: dict, line_colors: Dict[str, str], color_hex: str):
+    """
+    Crea la hoja de exposición de la cartera: una fila por mes y una columna por
+    línea (con el color de cada línea), con totales por fila y por columna.
+    """
+    ws = wb.active
+    ws.title = "Cartera"
+    styles = _define_styles(color_hex)
+    lineas = summary.get('lineas', [])
+    last_col = len(lineas) + 2
+
+    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=last_col)
+    cell = ws.cell(row=1, column=1, value="EXPOSICIÓN DE CARTERA POR MES Y LÍNEA")
+    cell.font = styles[STYLE_MAIN_TITLE_FONT]
+    cell.fill = styles[STYLE_MAIN_COLOR_FILL]
+    cell.alignment = styles[STYLE_CENTER_ALIGN]
+    ws.row_dimensions[1].height = 25
+
+    header_row = 3
+    for col_idx, header_text in enumerate(["Mes"] + [linea.capitalize() for linea in lineas] + ["Total"], 1):
+        cell = ws.cell(row=header_row, column=col_idx, value=header_text)
+        cell.font = styles[STYLE_TABLE_HEADER_FONT]
+        cell.fill = styles[STYLE_LIGHT_MAIN_COLOR_FILL]
+        cell.border = styles[STYLE_THIN_BORDER]
+        cell.alignment = styles[STYLE_CENTER_ALIGN]
+    for col_idx, linea in enumerate(lineas, 2):
+        line_color = _lighten_color(line_colors.get(linea, color_hex), 0.7)
+        ws.cell(row=header_row, column=col_idx).fill = PatternFill(
+            start_color=line_color, end_color=line_color, fill_type="solid"
+        )
+
+    current_row = header_row + 1
+    first_data_row = current_row
+    for mes in summary.get('meses', []):
+        ws.cell(row=current_row, column=1,
+                value=format_month_year_es(datetime.strptime(mes['mes'], "%Y-%m"))).border = styles[STYLE_THIN_BORDER]
+        for col_idx, linea in enumerate(lineas, 2):
+            cell = ws.cell(row=current_row, column=col_idx, value=mes['montos'].get(linea, 0))
+            cell.number_format = styles[STYLE_CURRENCY_FORMAT]
+            cell.border = styles[STYLE_THIN_BORDER]
+        cell = ws.cell(row=current_row, column=last_col, value=mes['total'])
+        cell.number_format = styles[STYLE_CURRENCY_FORMAT]
+        cell.font = styles[STYLE_BOLD_FONT]
+        cell.border = styles[STYLE_THIN_BORDER]
+        current_row += 1
+    last_data_row = current_row - 1
+
+    cell = ws.cell(row=current_row, column=1, value="Totales")
+    cell.font = styles[STYLE_BOLD_FONT]
+    cell.border = styles[STYLE_THIN_BORDER]
+    cell.fill = styles[STYLE_LIGHT_GRAY_FILL]
+    for col_idx in range(2, last_col + 1):
+        column = get_column_letter(col_idx)
+        value = f'=SUM({column}{first_data_row}:{column}{last_data_row})' if first_data_row <= last_data_row else 0
+        cell = ws.cell(row=current_row, column=col_idx, value=value)
+        cell.number_format = styles[STYLE_CURRENCY_FORMAT]
+        cell.font = styles[STYLE_BOLD_FONT]
+        cell.border = styles[STYLE_THIN_BORDER]
+        cell.fill = styles[STYLE_LIGHT_GRAY_FILL]
+
+    _adjust_column_widths(ws)
+
+def render_portfolio_workbook(summary: dict, line_colors: Dict[str, str], color_hex: str) -> BytesIO:
+    """Genera el libro del resumen de cartera en un BytesIO posicionado al inicio."""
+    with EXCEL_RENDER_SECONDS.time(report='portfolio', mode='full'):
+        wb = Workbook()
+        create_portfolio_report(wb, summary, line_colors, color_hex)
+        excel_file = BytesIO()
+        wb.save(excel_file)
+    excel_file.seek(0)
+    return excel_file
+
+def render_workbook(data: dict, color_hex: str, streaming: bool = False) -> BytesIO:
+    """
+    Genera el libro completo (o el compacto en modo streaming) y lo devuelve
+    guardado en un BytesIO posicionado al inicio.
+    """
+    with EXCEL_RENDER_SECONDS.time(report='plan', mode='streaming' if streaming else 'full'):
+        if streaming:
+            wb = Workbook(write_only=True)
+            create_streaming_report(wb, data, color_hex)
+        else:
+            wb = Workbook()
+            create_full_report_sheet(wb, data, color_hex)
+            create_payment_detail_sheet(wb, data, color_hex)
+
+        excel_file = BytesIO()
+        wb.save(excel_file)
+    excel_file.seek(0)
+    return excel_file
@@ -0,0 +1,178 @@
+"""
+Optional process pool for CPU-bound Excel rendering.
+
+openpyxl retiene el GIL durante toda la generación; en un servidor con hilos un
+reporte grande bloquea las peticiones baratas (/getHolidays, /consultar-ruc) de
+la misma instancia. Con EXCEL_PROCESS_POOL_WORKERS > 0 los libros se generan en
+procesos pre-calentados (openpyxl y excel_generator ya importados) y el hilo de
+la petición solo espera los bytes resultantes.
+"""
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+import structured_logging
+
+try:
+    import resource
+except ImportError:  # Windows: no hay getrusage.
+    resource = None
+
+logger = structured_logging.get_logger(__name__)
+
+EXCEL_PROCESS_POOL_WORKERS = int(os.environ.get("EXCEL_PROCESS_POOL_WORKERS", "0"))
+EXCEL_RENDER_TIMEOUT_SECONDS = float(os.environ.get("EXCEL_RENDER_TIMEOUT_SECONDS", "60"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.RLock()
+# Trabajos en curso y el pool al que se enviaron, para poder drenar un pool retirado.
+_in_flight: Dict[Future, ProcessPoolExecutor] = {}
+
+class RenderTimeout(Exception):
+    """La generación superó el tiempo máximo y fue cancelada."""
+
+class RenderPoolUnavailable(Exception):
+    """El pool se rompió (ej. un worker murió por falta de memoria) y fue reiniciado."""
+
+def is_enabled() -> bool:
+    """Indica si la generación debe delegarse al pool de procesos."""
+    return EXCEL_PROCESS_POOL_WORKERS > 0
+
+# --- Código que se ejecuta en los procesos del pool ---
+def _warm_worker() -> None:
+    """Inicializador de cada worker: importa y ejercita openpyxl una vez."""
+    import excel_generator
+    excel_generator.render_workbook(
+        {'montoOriginal': 1.0, 'fechasOrdenadas': ['01/01/2025'],
+         'montosAsignados': {'01/01/2025': 1.0}, 'resumenMensual': {'2025-01': 1.0}},
+        "808080",
+    )
+
+def _ping() -> int:
+    return os.getpid()
+
+def _render_in_worker(data: Dict[str, Any], color_hex: str, streaming: bool) -> Tuple[bytes, int]:
+    """Genera el libro y devuelve sus bytes junto con el RSS máximo del worker."""
+    import excel_generator
+    excel_file = excel_generator.render_workbook(data, color_hex, streaming=streaming)
+    if resource is None:
+        return excel_file.getvalue(), 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return excel_file.getvalue(), max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+# --- Gestión del pool en el proceso de la app ---
+def _mp_context():
+    """
+    Usa forkserver donde existe: los workers no heredan hilos ni clientes gRPC
+    del proceso de la app, y el servidor ya tiene excel_generator importado.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['openpyxl', 'excel_generator'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def start_pool() -> ProcessPoolExecutor:
+    """Crea el pool (si no existe) y arranca todos sus workers de inmediato."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXCEL_PROCESS_POOL_WORKERS,
+                mp_context=_mp_context(),
+                initializer=_warm_worker,
+            )
+            # El executor crea procesos bajo demanda; enviar una tarea por worker
+            # obliga a arrancarlos todos ahora y no en la primera petición.
+            for future in [_pool.submit(_ping) for _ in range(EXCEL_PROCESS_POOL_WORKERS)]:
+                future.result()
+        return _pool
+
+def shutdown_pool(kill: bool = False) -> None:
+    """
+    Detiene el pool. Con kill=True termina los workers en curso, lo que hace
+    fallar con RenderPoolUnavailable a los demás trabajos en ejecución.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is None:
+        return
+    if kill:
+        _terminate(pool)
+    else:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _terminate(pool: ProcessPoolExecutor) -> None:
+    for process in list(getattr(pool, '_processes', {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _retire_pool(pool: ProcessPoolExecutor, stuck: Future) -> None:
+    """
+    Saca de servicio un pool con un worker atascado: las peticiones nuevas usan
+    un pool nuevo y este se termina cuando acaban sus demás trabajos en curso
+    (o tras EXCEL_RENDER_TIMEOUT_SECONDS), sin hacerlos fallar.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+        pending = [future for future, owner in _in_flight.items() if owner is pool and future is not stuck]
+
+    def _drain():
+        wait(pending, timeout=EXCEL_RENDER_TIMEOUT_SECONDS)
+        _terminate(pool)
+
+    threading.Thread(target=_drain, name='excel-pool-drain', daemon=True).start()
+
+def _submit(*args) -> Tuple[Future, ProcessPoolExecutor]:
+    # Enviar y registrar bajo el lock evita que un trabajo llegue a un pool ya retirado.
+    with _pool_lock:
+        pool = start_pool()
+        future = pool.submit(*args)
+        _in_flight[future] = pool
+    future.add_done_callback(lambda done: _in_flight.pop(done, None))
+    return future, pool
+
+def reset_after_fork() -> None:
+    """
+    Olvida en un worker recién creado el pool heredado del padre (sus procesos
+    y su hilo de gestión pertenecen al padre); se crea de nuevo bajo demanda.
+    """
+    global _pool, _pool_lock, _in_flight
+    _pool = None
+    _pool_lock = threading.RLock()
+    _in_flight = {}
+
+def render_workbook_bytes(data: Dict[str, Any], color_hex: str, streaming: bool = False,
+                          timeout: Optional[float] = None) -> Tuple[bytes, int]:
+    """
+    Genera el libro en el pool y devuelve (bytes, RSS máximo del worker).
+
+    Si el trabajo no termina en `timeout` segundos se cancela: si aún estaba en
+    cola simplemente se descarta; si ya se estaba ejecutando, se retira el pool
+    (un proceso no puede interrumpirse de otra forma) dejando terminar a los
+    demás trabajos en curso.
+
+    Raises:
+        RenderTimeout: si se superó el tiempo máximo.
+        RenderPoolUnavailable: si el pool se rompió durante la generación.
+    """
+    timeout = EXCEL_RENDER_TIMEOUT_SECONDS if timeout is None else timeout
+    try:
+        future, pool = _submit(_render_in_worker, data, color_hex, streaming)
+        return future.result(timeout=timeout)
+    except FutureTimeoutError as e:
+        if not future.cancel() and not future.done():
+            logger.warning("Excel render exceeded %ss; retiring process pool.", timeout)
+            _retire_pool(pool, future)
+        raise RenderTimeout(f"Excel render exceeded {timeout}s") from e
+    except BrokenProcessPool as e:
+        logger.error("Excel process pool broken, restarting: %s", e)
+        shutdown_pool(kill=True)
+        raise RenderPoolUnavailable(str(e)) from e
@@ -1,38 +1,233 @@
 """Module for managing Firestore interactions and caching."""
-from datetime import datetime, timedelta
-from typing import Dict, List
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, FrozenSet, List, Optional
 
 import firebase_admin
 from firebase_admin import firestore
 
+import local_snapshot
+import metrics
+import structured_logging
+from errors import ApiError
 from shared.date_utils import calcular_feriados_pascuas
 
+logger = structured_logging.get_logger(__name__)
+
 HOLIDAYS_COLLECTION = 'holidays'
 RUC_CACHE_COLLECTION = 'ruc_cache'
 RUC_CACHE_DAYS = 7
+# Antigüedad máxima con la que una entrada vencida aún se sirve de inmediato
+# (stale-while-revalidate). Pasado este límite se consulta la API de forma
+# síncrona y la entrada vieja solo se usa como respaldo si la API falla.
+RUC_CACHE_MAX_STALE_DAYS = 30
+# Antigüedad a partir de la cual el barrido en modo borrado elimina una entrada.
+# Nunca es menor que RUC_CACHE_MAX_STALE_DAYS: las entradas más antiguas siguen
+# sirviendo de respaldo mientras la API está caída.
+RUC_CACHE_RETENTION_DAYS = max(int(os.environ.get("RUC_CACHE_RETENTION_DAYS", "90")), RUC_CACHE_MAX_STALE_DAYS)
 
 DB_CLIENT = None
 
+FIRESTORE_READS = metrics.counter(
+    'firestore_reads_total', 'Documentos leídos de Firestore, por endpoint.', ('endpoint',))
+FIRESTORE_WRITES = metrics.counter(
+    'firestore_writes_total', 'Documentos escritos o eliminados en Firestore, por endpoint.', ('endpoint',))
+HOLIDAY_CACHE_REQUESTS = metrics.counter(
+    'holiday_cache_requests_total', 'Consultas de feriados por año servidas desde el caché (hit) o calculadas (miss).',
+    ('result',))
+HOLIDAY_FIXED_LOADS = metrics.counter(
+    'holiday_fixed_loads_total', 'Cargas de los feriados fijos por origen.', ('source',))
+RUC_CACHE_READS = metrics.counter(
+    'ruc_cache_reads_total', 'Búsquedas en el caché de RUC por origen de la respuesta.', ('source',))
+
+def record_usage(reads: int = 0, writes: int = 0) -> None:
+    """
+    Atribuye lecturas/escrituras de Firestore al endpoint en curso.
+
+    Una consulta sin resultados se factura como una lectura: quien llama debe
+    pasar `max(1, documentos)`.
+    """
+    endpoint = metrics.current_endpoint()
+    if reads:
+        FIRESTORE_READS.inc(reads, endpoint=endpoint)
+    if writes:
+        FIRESTORE_WRITES.inc(writes, endpoint=endpoint)
+
 def get_db():
-    """Obtiene una instancia del cliente de Firestore, inicializándola si es necesario."""
+    """
+    Obtiene una instancia del cliente de Firestore, inicializándola si es necesario.
+
+    El cliente se construye aquí y no con firestore.client(), que lo guarda en la
+    App de firebase_admin: tras el fork cada worker debe abrir su propio canal gRPC
+    en lugar de reutilizar el que haya creado el maestro.
+    """
     global DB_CLIENT
     if DB_CLIENT is None:
         try:
-            firebase_admin.get_app()
+            app = firebase_admin.get_app()
         except ValueError:
-            firebase_admin.initialize_app()
-        DB_CLIENT = firestore.client()
+            app = firebase_admin.initialize_app()
+        DB_CLIENT = firestore.Client(credentials=app.credential.get_credential(), project=app.project_id)
     return DB_CLIENT
 
-yearly_holidays_cache = {}
-GLOBAL_FIXED_HOLIDAYS_CACHE = None
+# --- Caché de feriados ---
+# Rango de años aceptado; fuera de él se responde 400 en lugar de calcular y cachear.
+HOLIDAY_MIN_YEAR = int(os.environ.get("HOLIDAY_MIN_YEAR", "1900"))
+HOLIDAY_MAX_YEAR = int(os.environ.get("HOLIDAY_MAX_YEAR", "2200"))
+# Años precalculados (año actual ± ventana) al cargar los feriados fijos; nunca se desalojan.
+HOLIDAY_PRECOMPUTE_WINDOW = int(os.environ.get("HOLIDAY_PRECOMPUTE_WINDOW", "5"))
+# Máximo de años adicionales (fuera de la ventana) que se mantienen en memoria.
+HOLIDAY_CACHE_MAX_YEARS = int(os.environ.get("HOLIDAY_CACHE_MAX_YEARS", "32"))
+
+_holiday_sync_started = False
+
+class YearHolidays:
+    """Feriados de un año: la lista que devuelve la API y sus fechas como ordinales."""
+    __slots__ = ('year', 'holidays', 'ordinals')
+
+    def __init__(self, year: int, fixed_holidays: Dict[str, str]):
+        # Los feriados de Pascua se calculan para el año específico, ya que varían.
+        # Se combinan los feriados fijos (cíclicos) con los de Pascua (variables),
+        # aplicando el año a cada uno: "01/01" -> "01/01/2025".
+        all_holidays = {**fixed_holidays, **calcular_feriados_pascuas(year)}
+        self.year = year
+        self.holidays: List[Dict[str, str]] = [
+            {'date': f"{date_str}/{year}", 'name': name}
+            for date_str, name in all_holidays.items()
+        ]
+        ordinals = set()
+        for date_str in all_holidays:
+            day, month = date_str.split('/')
+            try:
+                ordinals.add(date(year, int(month), int(day)).toordinal())
+            except ValueError:
+                # Ej. un feriado "29/02" en un año no bisiesto.
+                continue
+        self.ordinals: FrozenSet[int] = frozenset(ordinals)
+
+class HolidayCache:
+    """
+    Caché acotado y seguro entre hilos de los feriados por año.
+
+    Los feriados fijos se cargan una sola vez (desde el snapshot local o desde
+    Firestore) aunque lleguen varias peticiones en frío a la vez. Al cargarlos se
+    precalculan los años de la ventana (año actual ± HOLIDAY_PRECOMPUTE_WINDOW);
+    el resto de años se guarda en un LRU de hasta HOLIDAY_CACHE_MAX_YEARS entradas.
+    """
+
+    def __init__(self, window: int = HOLIDAY_PRECOMPUTE_WINDOW, max_years: int = HOLIDAY_CACHE_MAX_YEARS):
+        self.window = window
+        self.max_years = max_years
+        self._fixed: Optional[Dict[str, str]] = None
+        self._pinned: Dict[int, YearHolidays] = {}
+        self._years: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @property
+    def fixed_holidays(self) -> Optional[Dict[str, str]]:
+        return self._fixed
+
+    def _get_fixed(self) -> Dict[str, str]:
+        fixed = self._fixed
+        if fixed is not None:
+            return fixed
+        with self._load_lock:
+            # Las peticiones que esperaban el lock reutilizan la carga del primer hilo.
+            if self._fixed is None:
+                self._install(_load_fixed_holidays())
+            return self._fixed
+
+    def _install(self, fixed: Dict[str, str]) -> None:
+        current_year = datetime.now(timezone.utc).year
+        pinned = {
+            year: YearHolidays(year, fixed)
+            for year in range(max(HOLIDAY_MIN_YEAR, current_year - self.window),
+                              min(HOLIDAY_MAX_YEAR, current_year + self.window) + 1)
+        }
+        with self._lock:
+            self._fixed = fixed
+            self._pinned = pinned
+            self._years.clear()
+
+    def get(self, year: int) -> YearHolidays:
+        """Feriados del año (ya validado), calculándolos y cacheándolos si es necesario."""
+        entry = self._pinned.get(year)
+        if entry is not None:
+            HOLIDAY_CACHE_REQUESTS.inc(result='hit')
+            return entry
+        with self._lock:
+            entry = self._years.get(year)
+            if entry is not None:
+                self._years.move_to_end(year)
+                HOLIDAY_CACHE_REQUESTS.inc(result='hit')
+                return entry
+        HOLIDAY_CACHE_REQUESTS.inc(result='miss')
+        fixed = self._get_fixed()
+        entry = self._pinned.get(year)
+        if entry is not None:
+            return entry
+        entry = YearHolidays(year, fixed)
+        with self._lock:
+            # Si los feriados fijos cambiaron mientras se calculaba, no se cachea un año obsoleto.
+            if self._fixed is fixed:
+                self._years[year] = entry
+                self._years.move_to_end(year)
+                while len(self._years) > self.max_years:
+                    self._years.popitem(last=False)
+        return entry
+
+    def replace_fixed(self, fixed: Dict[str, str]) -> bool:
+        """Reemplaza los feriados fijos y recalcula la ventana; devuelve False si no cambiaron."""
+        with self._load_lock:
+            if fixed == self._fixed:
+                return False
+            self._install(fixed)
+            return True
+
+    def contains(self, year: int) -> bool:
+        with self._lock:
+            return year in self._pinned or year in self._years
+
+    def years(self) -> List[int]:
+        with self._lock:
+            return sorted({*self._pinned, *self._years})
+
+    def clear(self) -> None:
+        with self._load_lock, self._lock:
+            self._fixed = None
+            self._pinned = {}
+            self._years.clear()
+
+holiday_cache = HolidayCache()
+
+def reset_after_fork() -> None:
+    """
+    Descarta en un worker recién creado el cliente de Firestore (su canal gRPC
+    no puede compartirse entre procesos) y el caché de feriados con sus locks.
+    """
+    global DB_CLIENT, holiday_cache, _holiday_sync_started
+    DB_CLIENT = None
+    holiday_cache = HolidayCache()
+    _holiday_sync_started = False
+
+def validate_year(year: int) -> None:
+    """
+    Raises:
+        ApiError: 400 si el año está fuera de [HOLIDAY_MIN_YEAR, HOLIDAY_MAX_YEAR].
+    """
+    if not HOLIDAY_MIN_YEAR <= year <= HOLIDAY_MAX_YEAR:
+        raise ApiError(f"El año debe estar entre {HOLIDAY_MIN_YEAR} y {HOLIDAY_MAX_YEAR}.", 400)
 
 def _get_fixed_holidays_from_db() -> Dict[str, str]:
     """Lee los feriados fijos de la DB."""
     db_client = get_db()
     global_fixed_holidays: Dict[str, str] = {}
     try:
-        docs = db_client.collection(HOLIDAYS_COLLECTION).stream()
+        docs = list(db_client.collection(HOLIDAYS_COLLECTION).stream())
+        record_usage(reads=max(1, len(docs)))
         for doc in docs:
             data = doc.to_dict()
             if 'day' in data and 'month' in data:
@@ -40,43 +235,141 @@ def _get_fixed_holidays_from_db() -> Dict[str, str]:
                     data.get('name', '')
         return global_fixed_holidays
     except Exception as e:
-        print(f"Error al cargar feriados fijos desde Firestore: {e}")
+        logger.exception("Error al cargar feriados fijos desde Firestore: %s", e)
         raise ApiError("Failed to load fixed holidays from database.", 500) from e
 
+def _sync_fixed_holidays_from_db() -> None:
+    """
+    Sincroniza en segundo plano los feriados servidos desde el snapshot local.
+
+    Si Firestore tiene una versión distinta, se reemplaza el caché en memoria,
+    se recalculan los años ya cacheados y se actualiza el snapshot.
+    """
+    try:
+        fixed_holidays = _get_fixed_holidays_from_db()
+    except Exception as e:
+        logger.warning("Background holiday sync failed, keeping local snapshot: %s", e)
+        return
+    HOLIDAY_FIXED_LOADS.inc(source='sync')
+    if holiday_cache.replace_fixed(fixed_holidays):
+        logger.info("Local holiday snapshot was outdated; refreshed from Firestore.")
+    local_snapshot.save_fixed_holidays(fixed_holidays)
+
+def _load_fixed_holidays() -> Dict[str, str]:
+    """Carga los feriados fijos desde el snapshot local (si es válido) o desde Firestore."""
+    global _holiday_sync_started
+    fixed_holidays = local_snapshot.load_fixed_holidays()
+    if fixed_holidays is not None:
+        logger.info("Feriados fijos cargados desde el snapshot local; sincronizando con Firestore...")
+        HOLIDAY_FIXED_LOADS.inc(source='snapshot')
+        if not _holiday_sync_started:
+            _holiday_sync_started = True
+            threading.Thread(target=_sync_fixed_holidays_from_db, name="holiday-sync", daemon=True).start()
+        return fixed_holidays
+
+    logger.info("Cargando feriados fijos desde Firestore (primera vez)...")
+    fixed_holidays = _get_fixed_holidays_from_db()
+    HOLIDAY_FIXED_LOADS.inc(source='firestore')
+    local_snapshot.save_fixed_holidays(fixed_holidays)
+    return fixed_holidays
+
 def get_all_holidays_for_year(year: int) -> List[Dict[str, str]]:
     """Obtiene todos los feriados para un año, usando caché."""
-    global GLOBAL_FIXED_HOLIDAYS_CACHE
-    
-    if year in yearly_holidays_cache:
-        return yearly_holidays_cache[year]
-
-    # El caché de feriados fijos (ej. "01/01" -> "Año Nuevo") se carga una sola vez
-    # desde Firestore para evitar lecturas repetidas en la misma instancia de la función.
-    if GLOBAL_FIXED_HOLIDAYS_CACHE is None:
-        print("Cargando feriados fijos desde Firestore (primera vez)...")
-        GLOBAL_FIXED_HOLIDAYS_CACHE = _get_fixed_holidays_from_db()
-
-    # Los feriados de Pascua se calculan para el año específico, ya que varían.
-    easter_holidays = calcular_feriados_pascuas(year)
-    # Se combinan los feriados fijos (cíclicos) con los de Pascua (variables).
-    all_holidays = {**GLOBAL_FIXED_HOLIDAYS_CACHE, **easter_holidays}
-    
-    # Se construye la lista final, aplicando el año solicitado a cada feriado.
-    # Esto asegura que "01/01" se convierta en "01/01/2024", "01/01/2025", etc.
-    result = [
-        {'date': f"{date_str}/{year}", 'name': name}
-        for date_str, name in all_holidays.items()
-    ]
-    yearly_holidays_cache[year] = result
-    return result
+    validate_year(year)
+    return holiday_cache.get(year).holidays
+
+def get_holiday_ordinals(year: int) -> FrozenSet[int]:
+    """Fechas feriadas del año como `date.toordinal()`, para validar fechas sin construir strings."""
+    validate_year(year)
+    return holiday_cache.get(year).ordinals
+
+def is_holiday(day: date) -> bool:
+    """Indica si `day` es feriado, consultando las fechas precalculadas de su año."""
+    return day.toordinal() in get_holiday_ordinals(day.year)
 
 def get_ruc_from_cache(ruc_number: str):
-    """Retrieves RUC data from cache if available and not expired."""
+    """
+    Retrieves RUC data from cache, including expired entries.
+
+    Use `is_ruc_cache_fresh` to decide whether the entry must be revalidated.
+    Las entradas vigentes del snapshot local se devuelven sin leer Firestore.
+    """
+    local_data = local_snapshot.get_ruc(ruc_number)
+    if local_data and is_ruc_cache_fresh(local_data):
+        RUC_CACHE_READS.inc(source='local_snapshot')
+        return local_data
+
     cached_doc = get_db().collection(RUC_CACHE_COLLECTION).document(ruc_number).get()
+    record_usage(reads=1)
     if cached_doc.exists:
+        RUC_CACHE_READS.inc(source='firestore')
         cached_data = cached_doc.to_dict()
-        timestamp = cached_data.get('timestamp')
-        if (timestamp and isinstance(timestamp, datetime) and
-                (datetime.now(timestamp.tzinfo) - timestamp) < timedelta(days=RUC_CACHE_DAYS)):
-            return cached_data
-    return None
+        # Una entrada vencida que Firestore aún no renovó no se vuelve a escribir en el snapshot.
+        if not local_data or local_data.get('timestamp') != cached_data.get('timestamp'):
+            local_snapshot.save_ruc(ruc_number, cached_data)
+        return cached_data
+    RUC_CACHE_READS.inc(source='local_snapshot' if local_data else 'not_found')
+    return local_data
+
+def get_ruc_cache_age(cached_data: Dict[str, Any]) -> Optional[timedelta]:
+    """Devuelve la antigüedad de una entrada del caché, o None si no tiene timestamp válido."""
+    timestamp = cached_data.get('timestamp')
+    if not isinstance(timestamp, datetime):
+        return None
+    return datetime.now(timestamp.tzinfo) - timestamp
+
+def is_ruc_cache_fresh(cached_data: Dict[str, Any]) -> bool:
+    """Indica si la entrada del caché es más reciente que RUC_CACHE_DAYS."""
+    age = get_ruc_cache_age(cached_data)
+    return age is not None and age < timedelta(days=RUC_CACHE_DAYS)
+
+def is_ruc_cache_servable(cached_data: Dict[str, Any]) -> bool:
+    """Indica si una entrada vencida todavía puede servirse mientras se revalida."""
+    age = get_ruc_cache_age(cached_data)
+    return age is not None and age < timedelta(days=RUC_CACHE_MAX_STALE_DAYS)
+
+def save_ruc_to_cache(ruc_number: str, data: Dict[str, Any]) -> None:
+    """Guarda (o reemplaza) la entrada de un RUC en el caché."""
+    get_db().collection(RUC_CACHE_COLLECTION).document(ruc_number).set(data)
+    record_usage(writes=1)
+    # En el snapshot local se guarda la hora local en lugar del centinela SERVER_TIMESTAMP.
+    local_snapshot.save_ruc(ruc_number, {**data, 'timestamp': datetime.now(timezone.utc)})
+
+def get_expired_ruc_cache_page(page_size: int, start_after=None,
+                               older_than_days: int = RUC_CACHE_DAYS) -> List[Any]:
+    """
+    Obtiene una página de documentos vencidos del caché de RUC, ordenados por timestamp.
+
+    Los documentos sin `timestamp` no coinciden con el filtro y nunca se barren;
+    tampoco se sirven desde el caché (su antigüedad es desconocida), así que la
+    primera consulta a la API los reescribe con timestamp.
+
+    Args:
+        page_size: Número máximo de documentos a devolver.
+        start_after: Último snapshot de la página anterior (cursor), o None.
+        older_than_days: Antigüedad mínima, en días, de los documentos devueltos.
+    """
+    cutoff = datetime.now().astimezone() - timedelta(days=older_than_days)
+    query = (
+        get_db().collection(RUC_CACHE_COLLECTION)
+        .where(filter=firestore.FieldFilter('timestamp', '<', cutoff))
+        .order_by('timestamp')
+        .limit(page_size)
+    )
+    if start_after is not None:
+        query = query.start_after(start_after)
+    docs = list(query.stream())
+    record_usage(reads=max(1, len(docs)))
+    return docs
+
+def delete_ruc_cache_entries(ruc_numbers: List[str]) -> None:
+    """Elimina en un único batch las entradas indicadas del caché de RUC."""
+    if not ruc_numbers:
+        return
+    db_client = get_db()
+    batch = db_client.batch()
+    for ruc_number in ruc_numbers:
+        batch.delete(db_client.collection(RUC_CACHE_COLLECTION).document(ruc_number))
+    batch.commit()
+    record_usage(writes=len(ruc_numbers))
+    local_snapshot.delete_rucs(ruc_numbers)
@@ -0,0 +1,35 @@
+"""
+Gunicorn configuration for the standalone server (wsgi.py).
+
+Todas las opciones se pueden ajustar con variables de entorno (ver .env.example).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("SERVER_BIND", f"0.0.0.0:{os.environ.get('PORT', '8080')}")
+workers = int(os.environ.get("SERVER_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Hilos por worker: las peticiones pasan la mayor parte del tiempo esperando a
+# Firestore o a la API de RUC, así que cada worker atiende varias a la vez.
+threads = int(os.environ.get("SERVER_THREADS", "4"))
+worker_class = 'gthread'
+timeout = int(os.environ.get("SERVER_TIMEOUT_SECONDS", "120"))
+graceful_timeout = 30
+keepalive = 5
+# Reciclar workers acota el crecimiento de memoria (openpyxl); el jitter evita reinicios simultáneos.
+max_requests = int(os.environ.get("SERVER_MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+
+# La app se importa una vez en el maestro y los workers la heredan (copy-on-write).
+preload_app = True
+
+# La app escribe sus propios logs estructurados; gunicorn solo informa errores.
+loglevel = os.environ.get("SERVER_LOG_LEVEL", "warning")
+accesslog = None
+
+def on_starting(server):
+    import wsgi
+    wsgi.init_master()
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.init_worker()
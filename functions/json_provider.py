@@ -0,0 +1,120 @@
+"""Fast JSON serialization for API responses and reports."""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Optional
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa la librería estándar.
+    orjson = None
+
+def _default(obj: Any) -> Any:
+    """
+    Convierte los tipos que aparecen en los planes y no son JSON nativos.
+
+    Las fechas se serializan en ISO 8601. Se incluyen las subclases de datetime
+    (ej. DatetimeWithNanoseconds de Firestore), que orjson no reconoce por sí mismo.
+    """
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _flask_default(obj: Any) -> Any:
+    """
+    Mismo formato que el proveedor por defecto de Flask, para que las respuestas
+    de la API no cambien: fechas en formato HTTP (RFC 822) y Decimal como texto.
+    """
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    return _default(obj)
+
+def _stdlib_dumps_bytes(obj: Any, indent: Optional[int], sort_keys: bool, default: Callable) -> bytes:
+    """Serializa con la librería estándar, con el mismo formato que orjson."""
+    if indent:
+        content = json.dumps(obj, default=default, ensure_ascii=False, indent=indent, sort_keys=sort_keys)
+    else:
+        content = json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':'),
+                             sort_keys=sort_keys)
+    return content.encode('utf-8')
+
+def _widen_indent(content: bytes, factor: int) -> bytes:
+    """Multiplica la indentación de cada línea (las cadenas JSON no contienen saltos de línea)."""
+    lines = content.split(b'\n')
+    return b'\n'.join([b' ' * ((len(line) - len(line.lstrip(b' '))) * (factor - 1)) + line for line in lines])
+
+def dumps_bytes(obj: Any, indent: Optional[int] = None, sort_keys: bool = False,
+                default: Callable = _default) -> bytes:
+    """
+    Serializa un objeto directamente a JSON en UTF-8.
+
+    Args:
+        obj: Objeto a serializar.
+        indent: Espacios de indentación; None genera JSON compacto.
+        sort_keys: Si es True, ordena las claves de los diccionarios.
+        default: Conversión de los tipos no nativos (por defecto, fechas en ISO 8601).
+    """
+    # orjson solo indenta con 2 espacios; las indentaciones pares se obtienen ensanchándola.
+    if orjson is not None and (not indent or indent % 2 == 0):
+        # Las fechas también pasan por `default` para que ambos caminos coincidan.
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            content = orjson.dumps(obj, default=default, option=option)
+        except TypeError:
+            # orjson rechaza algunos valores que la librería estándar acepta
+            # (ej. enteros de más de 64 bits); se reintenta con ella.
+            pass
+        else:
+            return _widen_indent(content, indent // 2) if indent and indent > 2 else content
+    return _stdlib_dumps_bytes(obj, indent, sort_keys, default)
+
+def loads(s: Any) -> Any:
+    """Deserializa JSON desde str o bytes."""
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de Flask que usa orjson cuando está instalado.
+
+    Las claves no se ordenan: los planes conservan el orden cronológico de
+    `montosAsignados` y se evita el coste de ordenar. Fechas y Decimal se
+    serializan igual que con el proveedor por defecto de Flask.
+    """
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        """Serializa a str; con argumentos extra se delega a la librería estándar."""
+        if kwargs:
+            kwargs.setdefault("default", _flask_default)
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj, sort_keys=self.sort_keys, default=_flask_default).decode('utf-8')
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        """Deserializa JSON; con argumentos extra se delega a la librería estándar."""
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        """Crea la respuesta serializando directamente a bytes."""
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        body = dumps_bytes(obj, indent=2 if pretty else None, sort_keys=self.sort_keys,
+                           default=_flask_default) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
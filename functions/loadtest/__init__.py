@@ -0,0 +1 @@
+# Herramientas de prueba de carga (no se despliegan)
@@ -0,0 +1,411 @@
+"""
+In-memory stand-in for the Firestore client.
+
+Implementa el subconjunto de la API de `google.cloud.firestore` que usa el
+backend (documentos, consultas con filtros, orden, límite y cursores, batches,
+transacciones optimistas compatibles con `firestore.transactional` y los
+centinelas SERVER_TIMESTAMP / Increment), con inyección de latencia por
+operación para simular el coste de red.
+"""
+import copy
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from firebase_admin import firestore
+from google.api_core import exceptions as google_exceptions
+
+Latency = Union[float, Callable[[], float]]
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'not-in': lambda a, b: a not in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+_MISSING = object()
+
+def jittered_latency(mean: float, jitter: float = 0.25) -> Callable[[], float]:
+    """Devuelve una función de latencia uniforme en mean ± jitter*mean."""
+    return lambda: max(0.0, random.uniform(mean * (1 - jitter), mean * (1 + jitter)))
+
+class FakeDocumentSnapshot:
+    """Snapshot inmutable de un documento."""
+
+    def __init__(self, reference: 'FakeDocumentReference', data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self._data = data
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str) -> Any:
+        return _get_field(self._data or {}, field_path)
+
+class FakeDocumentReference:
+    """Referencia a un documento de FakeFirestore."""
+
+    def __init__(self, client: 'FakeFirestore', collection_path: str, doc_id: str):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection_path}/{self.id}"
+
+    def collection(self, name: str) -> 'FakeCollectionReference':
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, transaction: Optional['FakeTransaction'] = None) -> FakeDocumentSnapshot:
+        if transaction is not None:
+            return transaction.get(self)
+        self._client._simulate_rpc(None)
+        return self._client._read(self)
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        self._client._simulate_rpc('write')
+        self._client._apply([('set', self, data, merge)])
+
+    def update(self, data: Dict[str, Any]) -> None:
+        self._client._simulate_rpc('write')
+        self._client._apply([('update', self, data, False)])
+
+    def delete(self) -> None:
+        self._client._simulate_rpc('write')
+        self._client._apply([('delete', self, None, False)])
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+class FakeQuery:
+    """Consulta inmutable sobre una colección."""
+
+    def __init__(self, client: 'FakeFirestore', collection_path: str, filters=(), orders=(),
+                 limit_count: Optional[int] = None, cursor=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes) -> 'FakeQuery':
+        params = {
+            'filters': self._filters, 'orders': self._orders,
+            'limit_count': self._limit, 'cursor': self._cursor,
+        }
+        params.update(changes)
+        return FakeQuery(self._client, self._collection_path, **params)
+
+    def where(self, field_path: str = None, op_string: str = None, value: Any = None, *, filter=None) -> 'FakeQuery':
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _OPERATORS:
+            raise ValueError(f"Operador no soportado por FakeFirestore: {op_string}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = firestore.Query.ASCENDING) -> 'FakeQuery':
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> 'FakeQuery':
+        return self._copy(limit_count=count)
+
+    def start_after(self, document_fields_or_snapshot) -> 'FakeQuery':
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def _cursor_key(self):
+        cursor = self._cursor
+        if isinstance(cursor, FakeDocumentSnapshot):
+            data = cursor._data or {}
+            return tuple(_doc_value(cursor.id, data, field) for field, _ in self._orders) + (cursor.id,)
+        if isinstance(cursor, dict):
+            return tuple(cursor.get(field) for field, _ in self._orders)
+        return tuple(cursor)
+
+    def _matches(self, data: Dict[str, Any]) -> bool:
+        for field, op, value in self._filters:
+            field_value = _get_field(data, field, _MISSING)
+            if field_value is _MISSING:
+                return False
+            try:
+                if not _OPERATORS[op](field_value, value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def _run(self) -> List[FakeDocumentSnapshot]:
+        with self._client._lock:
+            items = [
+                (doc_id, copy.deepcopy(data))
+                for doc_id, data in self._client._collections.get(self._collection_path, {}).items()
+                if self._matches(data)
+            ]
+
+        # Ordenación estable: se aplica cada criterio de menor a mayor prioridad.
+        items.sort(key=lambda item: item[0])
+        for index in range(len(self._orders) - 1, -1, -1):
+            field, direction = self._orders[index]
+            items.sort(key=lambda item: _orderable(_doc_value(item[0], item[1], field)),
+                       reverse=direction == firestore.Query.DESCENDING)
+
+        if self._cursor is not None:
+            cursor_key = self._cursor_key()
+            items = [item for item in items if self._is_after(item, cursor_key)]
+        if self._limit is not None:
+            items = items[:self._limit]
+        # Como en Firestore, se factura un documento por resultado (mínimo uno por consulta).
+        self._client._record('read', max(1, len(items)))
+
+        return [
+            FakeDocumentSnapshot(FakeDocumentReference(self._client, self._collection_path, doc_id), data)
+            for doc_id, data in items
+        ]
+
+    def _is_after(self, item, cursor_key) -> bool:
+        doc_id, data = item
+        values = tuple(_doc_value(doc_id, data, field) for field, _ in self._orders) + (doc_id,)
+        for index, cursor_value in enumerate(cursor_key):
+            value = values[index]
+            descending = index < len(self._orders) and self._orders[index][1] == firestore.Query.DESCENDING
+            if _orderable(value) == _orderable(cursor_value):
+                continue
+            greater = _orderable(value) > _orderable(cursor_value)
+            return greater != descending
+        return False
+
+    def stream(self):
+        self._client._simulate_rpc(None)
+        return iter(self._run())
+
+    def get(self) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+class FakeCollectionReference(FakeQuery):
+    """Referencia a una colección; también actúa como consulta sin filtros."""
+
+    def __init__(self, client: 'FakeFirestore', path: str):
+        super().__init__(client, path)
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        if doc_id is None:
+            doc_id = f"{random.getrandbits(80):020x}"
+        return FakeDocumentReference(self._client, self._collection_path, doc_id)
+
+    def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+class FakeWriteBatch:
+    """Batch de escrituras que se aplican atómicamente en commit()."""
+
+    def __init__(self, client: 'FakeFirestore'):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge: bool = False):
+        self._writes.append(('set', reference, data, merge))
+
+    def update(self, reference, data):
+        self._writes.append(('update', reference, data, False))
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, False))
+
+    def commit(self):
+        self._client._simulate_rpc('write', len(self._writes))
+        self._client._apply(self._writes)
+        self._writes = []
+
+class FakeTransaction:
+    """
+    Transacción optimista: registra la versión de cada documento leído y en el
+    commit aborta (google.api_core.exceptions.Aborted) si alguno cambió, para
+    que `firestore.transactional` reintente como con el Firestore real.
+    """
+
+    def __init__(self, client: 'FakeFirestore', max_attempts: int = 5):
+        self._client = client
+        self._max_attempts = max_attempts
+        self._read_only = False
+        self._id = None
+        self._read_versions: Dict[str, int] = {}
+        self._writes = []
+
+    # --- Protocolo usado por firestore.transactional ---
+    def _clean_up(self) -> None:
+        self._id = None
+        self._read_versions = {}
+        self._writes = []
+
+    def _begin(self, retry_id=None) -> None:
+        self._id = random.getrandbits(64).to_bytes(8, 'big')
+
+    def _commit(self) -> list:
+        self._client._simulate_rpc('write', len(self._writes))
+        with self._client._lock:
+            for path, version in self._read_versions.items():
+                if self._client._versions.get(path, 0) != version:
+                    self._clean_up()
+                    raise google_exceptions.Aborted("Transaction contention on " + path)
+            self._client._apply(self._writes)
+        self._clean_up()
+        return []
+
+    def _rollback(self) -> None:
+        self._clean_up()
+
+    # --- API pública ---
+    def get(self, reference: FakeDocumentReference) -> FakeDocumentSnapshot:
+        self._client._simulate_rpc(None)
+        with self._client._lock:
+            self._read_versions[reference.path] = self._client._versions.get(reference.path, 0)
+            return self._client._read(reference)
+
+    def set(self, reference, data, merge: bool = False):
+        self._writes.append(('set', reference, data, merge))
+
+    def update(self, reference, data):
+        self._writes.append(('update', reference, data, False))
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, False))
+
+class FakeFirestore:
+    """
+    Cliente Firestore en memoria, seguro entre hilos.
+
+    Args:
+        latency: Segundos (o función que los devuelve) añadidos a cada RPC.
+    """
+
+    def __init__(self, latency: Latency = 0.0):
+        self.latency = latency
+        self._collections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.RLock()
+        # Versión de cada documento (por ruta), usada para detectar conflictos en transacciones.
+        self._versions: Dict[str, int] = {}
+        self.reads = 0
+        self.writes = 0
+
+    # --- API pública compatible con firestore.Client ---
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts: int = 5) -> FakeTransaction:
+        return FakeTransaction(self, max_attempts=max_attempts)
+
+    def get_all(self, references):
+        self._simulate_rpc(None)
+        return [self._read(ref) for ref in references]
+
+    # --- Utilidades para tests y para el harness ---
+    def seed(self, collection_path: str, documents: Dict[str, Dict[str, Any]]) -> None:
+        """Carga documentos directamente, sin latencia ni contadores."""
+        with self._lock:
+            self._collections.setdefault(collection_path, {}).update(copy.deepcopy(documents))
+
+    def dump(self, collection_path: str) -> Dict[str, Dict[str, Any]]:
+        """Devuelve una copia del contenido de una colección."""
+        with self._lock:
+            return copy.deepcopy(self._collections.get(collection_path, {}))
+
+    # --- Internos ---
+    def _simulate_rpc(self, kind: Optional[str], count: int = 1) -> None:
+        delay = self.latency() if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+        if kind:
+            self._record(kind, count)
+
+    def _record(self, kind: str, count: int) -> None:
+        with self._lock:
+            if kind == 'read':
+                self.reads += count
+            else:
+                self.writes += count
+
+    def _read(self, reference: FakeDocumentReference) -> FakeDocumentSnapshot:
+        self._record('read', 1)
+        with self._lock:
+            data = self._collections.get(reference._collection_path, {}).get(reference.id)
+            return FakeDocumentSnapshot(reference, copy.deepcopy(data))
+
+    def _apply(self, writes) -> None:
+        with self._lock:
+            for action, reference, data, merge in writes:
+                self._versions[reference.path] = self._versions.get(reference.path, 0) + 1
+                collection = self._collections.setdefault(reference._collection_path, {})
+                current = collection.get(reference.id)
+                if action == 'delete':
+                    collection.pop(reference.id, None)
+                    continue
+                if action == 'update' and current is None:
+                    raise KeyError(f"No document to update: {reference.path}")
+                base = copy.deepcopy(current) if (current is not None and (merge or action == 'update')) else {}
+                for field_path, value in data.items():
+                    _set_field(base, field_path, _resolve(value, _get_field(base, field_path)))
+                collection[reference.id] = base
+
+def _resolve(value: Any, current: Any) -> Any:
+    """Resuelve centinelas de escritura (SERVER_TIMESTAMP, Increment, DELETE_FIELD)."""
+    if value is firestore.DELETE_FIELD:
+        return value
+    if value is firestore.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, firestore.Increment):
+        return (current or 0) + value.value
+    if isinstance(value, dict):
+        return {key: _resolve(val, (current or {}).get(key) if isinstance(current, dict) else None)
+                for key, val in value.items()}
+    return copy.deepcopy(value)
+
+def _get_field(data: Dict[str, Any], field_path: str, default: Any = None) -> Any:
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return default
+        value = value[part]
+    return value
+
+def _doc_value(doc_id: str, data: Dict[str, Any], field_path: str) -> Any:
+    """Valor de un campo para ordenar; `__name__` (FieldPath.document_id()) es el id del documento."""
+    return doc_id if field_path == '__name__' else _get_field(data, field_path)
+
+def _set_field(data: Dict[str, Any], field_path: str, value: Any) -> None:
+    parts = field_path.split('.')
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    if value is firestore.DELETE_FIELD:
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = value
+
+def _orderable(value: Any):
+    """Clave de ordenación que permite comparar None con otros valores."""
+    return (value is not None, value)
@@ -0,0 +1,116 @@
+"""
+Local fake of the apis.net.pe RUC endpoint.
+
+Responde a `GET /v2/ruc/?numero=<ruc>` con el mismo formato que la API real y
+permite inyectar latencia, errores 5xx y RUCs inexistentes.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Set, Union
+from urllib.parse import parse_qs, urlparse
+
+Latency = Union[float, Callable[[], float]]
+
+class FakeRucConfig:
+    """
+    Comportamiento configurable del servidor; puede modificarse en caliente.
+
+    Args:
+        latency: Segundos (o función que los devuelve) antes de responder.
+        error_rate: Probabilidad (0-1) de responder 503.
+        not_found: RUCs para los que se responde 404.
+        fail_next: Número de peticiones siguientes que responden 503 (deterministas).
+    """
+
+    def __init__(self, latency: Latency = 0.0, error_rate: float = 0.0,
+                 not_found: Optional[Set[str]] = None, fail_next: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.not_found = set(not_found or ())
+        self.fail_next = fail_next
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def next_delay(self) -> float:
+        return self.latency() if callable(self.latency) else self.latency
+
+    def count_request(self) -> bool:
+        """Cuenta la petición e indica si debe fallar por `fail_next`."""
+        with self._lock:
+            self.requests += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+            return False
+
+class _RucHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: FakeRucConfig = None
+
+    def do_GET(self):
+        config = self.config
+        forced_failure = config.count_request()
+        parsed = urlparse(self.path)
+        ruc_number = parse_qs(parsed.query).get('numero', [''])[0]
+
+        delay = config.next_delay()
+        if delay:
+            time.sleep(delay)
+
+        if not parsed.path.rstrip('/').endswith('/ruc'):
+            self._send(404, {'message': 'Not found'})
+        elif forced_failure or (config.error_rate and random.random() < config.error_rate):
+            self._send(503, {'message': 'Service unavailable'})
+        elif not ruc_number or ruc_number in config.not_found:
+            self._send(404, {'message': 'RUC no encontrado'})
+        else:
+            self._send(200, {
+                'numeroDocumento': ruc_number,
+                'razonSocial': f'EMPRESA {ruc_number} S.A.C.',
+                'estado': 'ACTIVO',
+                'condicion': 'HABIDO',
+            })
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Silencia el log de acceso por petición."""
+
+class FakeRucServer:
+    """Servidor HTTP en un hilo de fondo. Usar como context manager o con start()/stop()."""
+
+    def __init__(self, config: Optional[FakeRucConfig] = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config or FakeRucConfig()
+        handler = type('RucHandler', (_RucHandler,), {'config': self.config})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url_template(self) -> str:
+        """Plantilla compatible con services.RUC_API_URL."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v2/ruc/?numero={{}}"
+
+    def start(self) -> 'FakeRucServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeRucServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,300 @@
+"""
+Load-test harness for the Flask API.
+
+Levanta `main.app` bajo gunicorn (varios workers con hilos) contra un Firestore
+en memoria y un servidor RUC simulado, ambos con latencia configurable, genera
+tráfico mixto sobre /getHolidays, /consultar-ruc, /calculate y /generate-excel
+e informa throughput y percentiles p50/p95/p99 por endpoint.
+
+Uso (desde la carpeta functions):
+    python -m loadtest.harness --workers 4 --clients 32 --duration 30 \\
+        --firestore-latency 0.02 --ruc-latency 0.3
+"""
+import argparse
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+import requests
+
+FUNCTIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if FUNCTIONS_DIR not in sys.path:
+    sys.path.insert(0, FUNCTIONS_DIR)
+
+from loadtest.fake_ruc_server import FakeRucConfig, FakeRucServer  # noqa: E402
+
+DEFAULT_MIX = "getHolidays=40,consultar-ruc=25,calculate=25,generate-excel=10"
+
+# Feriados fijos con el mismo formato que la colección 'holidays' de producción.
+FIXED_HOLIDAYS = {
+    'anio_nuevo': {'day': 1, 'month': 1, 'name': 'Año Nuevo'},
+    'dia_trabajo': {'day': 1, 'month': 5, 'name': 'Día del Trabajo'},
+    'san_pedro': {'day': 29, 'month': 6, 'name': 'San Pedro y San Pablo'},
+    'fuerza_aerea': {'day': 23, 'month': 7, 'name': 'Día de la Fuerza Aérea'},
+    'fiestas_patrias_1': {'day': 28, 'month': 7, 'name': 'Fiestas Patrias'},
+    'fiestas_patrias_2': {'day': 29, 'month': 7, 'name': 'Fiestas Patrias'},
+    'junin': {'day': 6, 'month': 8, 'name': 'Batalla de Junín'},
+    'santa_rosa': {'day': 30, 'month': 8, 'name': 'Santa Rosa de Lima'},
+    'angamos': {'day': 8, 'month': 10, 'name': 'Combate de Angamos'},
+    'todos_santos': {'day': 1, 'month': 11, 'name': 'Todos los Santos'},
+    'inmaculada': {'day': 8, 'month': 12, 'name': 'Inmaculada Concepción'},
+    'ayacucho': {'day': 9, 'month': 12, 'name': 'Batalla de Ayacucho'},
+    'navidad': {'day': 25, 'month': 12, 'name': 'Navidad'},
+}
+
+# --- Servidor (proceso gunicorn) ---
+def install_fakes(firestore_latency: float) -> None:
+    """Sustituye el cliente de Firestore por el fake y desactiva el rate limiter."""
+    import firestore_manager
+    import main
+    from loadtest.fake_firestore import FakeFirestore, jittered_latency
+
+    db_client = FakeFirestore(latency=jittered_latency(firestore_latency) if firestore_latency else 0.0)
+    db_client.seed(firestore_manager.HOLIDAYS_COLLECTION, FIXED_HOLIDAYS)
+    firestore_manager.DB_CLIENT = db_client
+    # Los límites por IP harían que todo el tráfico del harness terminara en 429.
+    main.limiter.enabled = False
+
+def _functions_app(firestore_latency: float):
+    """La app envuelta como en Cloud Functions: functions-framework llama a `main.api` por petición."""
+    import functions_framework
+
+    ff_app = functions_framework.create_app(
+        target='api', source=os.path.join(FUNCTIONS_DIR, 'main.py'), signature_type='http'
+    )
+    # functions-framework carga su propia copia del módulo main; los fakes se instalan después.
+    install_fakes(firestore_latency)
+    return ff_app
+
+def serve(bind: str, workers: int, threads: int, firestore_latency: float, entry: str = 'app') -> None:
+    """
+    Ejecuta la app bajo gunicorn; cada worker carga su propio Firestore en memoria.
+
+    entry: 'app' (main.app directamente), 'functions' (envoltorio de Cloud Functions)
+    o 'server' (wsgi.py con gunicorn.conf.py: preload en el maestro y post_fork por worker).
+    """
+    if entry == 'server':
+        import wsgi
+
+        def post_fork(server, worker):
+            wsgi.init_worker()
+            install_fakes(firestore_latency)
+
+        wsgi.run({'bind': bind, 'workers': workers, 'threads': threads,
+                  'loglevel': 'warning', 'post_fork': post_fork})
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class LoadTestApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread' if threads > 1 else 'sync')
+            self.cfg.set('loglevel', 'warning')
+            self.cfg.set('timeout', 120)
+
+        def load(self):
+            if entry == 'functions':
+                return _functions_app(firestore_latency)
+            install_fakes(firestore_latency)
+            from main import app
+            return app
+
+    LoadTestApplication().run()
+
+# --- Generación de tráfico ---
+def _build_plan(num_dates: int) -> Dict:
+    start = date(2025, 1, 2)
+    fechas = [(start + timedelta(days=i * 3)).strftime("%d/%m/%Y") for i in range(num_dates)]
+    monto = round(random.uniform(1000, 500000), 2)
+    return {'montoTotal': monto, 'fechasValidas': fechas}
+
+def _build_report(plan: Dict) -> Dict:
+    from services import perform_calculation
+    result = perform_calculation(plan['montoTotal'], plan['fechasValidas'])
+    return {
+        **result,
+        'montoOriginal': plan['montoTotal'],
+        'fechasOrdenadas': plan['fechasValidas'],
+        'razonSocial': 'EMPRESA DE CARGA S.A.C.',
+        'linea': random.choice(['viniball', 'vinifan', 'otros']),
+        'pedido': f'LT-{random.randint(1, 9999)}',
+        'ruc': '20123456789',
+    }
+
+class TrafficGenerator:
+    """Genera peticiones según la mezcla configurada y registra latencias por endpoint."""
+
+    def __init__(self, base_url: str, mix: Dict[str, int], ruc_pool: int, max_dates: int):
+        self.base_url = base_url.rstrip('/')
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.rucs = [f"20{random.randint(100000000, 999999999)}" for _ in range(ruc_pool)]
+        plans = [_build_plan(random.randint(6, max_dates)) for _ in range(20)]
+        self.plans = plans
+        self.reports = [_build_report(plan) for plan in plans]
+        self.years = list(range(2024, 2031))
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _request(self, session: requests.Session, endpoint: str) -> requests.Response:
+        url = f"{self.base_url}/api/{endpoint}"
+        if endpoint == 'getHolidays':
+            return session.get(url, params={'year': random.choice(self.years)}, timeout=60)
+        if endpoint == 'consultar-ruc':
+            return session.get(url, params={'numero': random.choice(self.rucs)}, timeout=60)
+        if endpoint == 'calculate':
+            return session.post(url, json=random.choice(self.plans), timeout=60)
+        if endpoint == 'generate-excel':
+            return session.post(url, json=random.choice(self.reports), timeout=120)
+        raise ValueError(f"Endpoint desconocido: {endpoint}")
+
+    def run_client(self, deadline: float) -> None:
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            endpoint = random.choices(self.endpoints, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                response = self._request(session, endpoint)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.samples[endpoint].append(elapsed)
+                if not ok:
+                    self.errors[endpoint] += 1
+
+    def run(self, clients: int, duration: float) -> float:
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=self.run_client, args=(deadline,)) for _ in range(clients)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - started
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Percentil por rango más cercano sobre una lista de muestras."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def summarize(samples: Dict[str, List[float]], errors: Dict[str, int],
+              elapsed: float) -> List[Tuple[str, int, int, float, float, float, float]]:
+    """Devuelve filas (endpoint, n, errores, rps, p50, p95, p99) con latencias en ms."""
+    rows = []
+    for endpoint in sorted(samples):
+        values = samples[endpoint]
+        rows.append((
+            endpoint, len(values), errors.get(endpoint, 0), len(values) / elapsed,
+            percentile(values, 50) * 1000, percentile(values, 95) * 1000, percentile(values, 99) * 1000,
+        ))
+    return rows
+
+def print_report(rows, elapsed: float) -> None:
+    print(f"\n{'endpoint':<16}{'reqs':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, count, errs, rps, p50, p95, p99 in rows:
+        print(f"{endpoint:<16}{count:>8}{errs:>8}{rps:>9.1f}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+    total = sum(row[1] for row in rows)
+    print(f"\nTotal: {total} peticiones en {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _wait_until_ready(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/api/getHolidays", params={'year': 2025}, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("El servidor de carga no respondió a tiempo.")
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """Convierte 'a=1,b=2' en {'a': 1, 'b': 2}."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Prueba de carga local del API.")
+    parser.add_argument('--workers', type=int, default=2, help="Workers de gunicorn.")
+    parser.add_argument('--threads', type=int, default=4, help="Hilos por worker.")
+    parser.add_argument('--clients', type=int, default=16, help="Clientes concurrentes.")
+    parser.add_argument('--duration', type=float, default=20.0, help="Duración en segundos.")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Pesos por endpoint.")
+    parser.add_argument('--firestore-latency', type=float, default=0.01, help="Latencia media por RPC (s).")
+    parser.add_argument('--ruc-latency', type=float, default=0.2, help="Latencia del RUC simulado (s).")
+    parser.add_argument('--ruc-error-rate', type=float, default=0.0, help="Proporción de 503 del RUC simulado.")
+    parser.add_argument('--ruc-pool', type=int, default=200, help="Número de RUCs distintos consultados.")
+    parser.add_argument('--max-dates', type=int, default=120, help="Máximo de fechas por plan.")
+    parser.add_argument('--entry', choices=('app', 'functions', 'server'), default='app',
+                        help="Punto de entrada: main.app, el envoltorio de Functions o wsgi.py.")
+    parser.add_argument('--serve', metavar='BIND', help=argparse.SUPPRESS)
+    return parser
+
+def run_load_test(args) -> List[Tuple]:
+    """Arranca servidores simulados y gunicorn, ejecuta la carga y devuelve el resumen."""
+    from loadtest.fake_firestore import jittered_latency
+
+    ruc_config = FakeRucConfig(
+        latency=jittered_latency(args.ruc_latency) if args.ruc_latency else 0.0,
+        error_rate=args.ruc_error_rate,
+    )
+    with FakeRucServer(ruc_config) as ruc_server:
+        bind = f"127.0.0.1:{_free_port()}"
+        env = {
+            **os.environ,
+            'RUC_API_URL': ruc_server.url_template,
+            'SUNAT_API_TOKEN': 'loadtest-token',
+        }
+        command = [
+            sys.executable, '-m', 'loadtest.harness', '--serve', bind,
+            '--workers', str(args.workers), '--threads', str(args.threads),
+            '--firestore-latency', str(args.firestore_latency), '--entry', args.entry,
+        ]
+        # La salida estándar de la app (un mensaje por consulta) se descarta para
+        # no mezclarla con el informe; los errores de gunicorn siguen en stderr.
+        server = subprocess.Popen(command, cwd=FUNCTIONS_DIR, env=env, stdout=subprocess.DEVNULL)
+        try:
+            base_url = f"http://{bind}"
+            _wait_until_ready(base_url)
+            generator = TrafficGenerator(base_url, parse_mix(args.mix), args.ruc_pool, args.max_dates)
+            elapsed = generator.run(args.clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        rows = summarize(generator.samples, generator.errors, elapsed)
+        print_report(rows, elapsed)
+        print(f"Peticiones al RUC simulado: {ruc_config.requests}")
+        return rows
+
+def main():
+    args = build_parser().parse_args()
+    if args.serve:
+        serve(args.serve, args.workers, args.threads, args.firestore_latency, args.entry)
+    else:
+        run_load_test(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+Local on-disk snapshot of the fixed holidays and the hottest RUC cache entries.
+
+Permite que una instancia nueva responda /getHolidays y consultas de RUC
+frecuentes desde un SQLite local (en /tmp, o empaquetado en el despliegue)
+mientras Firestore se sincroniza en segundo plano.
+
+Para empaquetar un snapshot en el despliegue (desde la carpeta functions):
+    python local_snapshot.py export
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import json_provider
+import structured_logging
+
+logger = structured_logging.get_logger(__name__)
+
+# Se incrementa cuando cambia el esquema; los snapshots con otra versión se ignoran.
+SNAPSHOT_SCHEMA_VERSION = 1
+LOCAL_SNAPSHOT_ENABLED = os.environ.get("LOCAL_SNAPSHOT_ENABLED", "").lower() in ("1", "true")
+LOCAL_SNAPSHOT_PATH = os.environ.get(
+    "LOCAL_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "planificador_snapshot.sqlite3")
+)
+PACKAGED_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshot.sqlite3")
+# Si se define (ej. en el despliegue), el snapshot solo es válido si sus feriados
+# tienen exactamente esta versión.
+EXPECTED_HOLIDAYS_VERSION = os.environ.get("LOCAL_SNAPSHOT_HOLIDAYS_VERSION")
+LOCAL_SNAPSHOT_MAX_RUC = int(os.environ.get("LOCAL_SNAPSHOT_MAX_RUC", "500"))
+# Cada cuántas escrituras de RUC se recorta la tabla a las LOCAL_SNAPSHOT_MAX_RUC más consultadas.
+_RUC_PRUNE_INTERVAL = 50
+# Los aciertos se cuentan en memoria y se escriben en SQLite en lotes de este tamaño
+# (y antes de cada recorte), no con una transacción por consulta.
+_RUC_HITS_FLUSH_INTERVAL = 50
+# Espera máxima por el lock de escritura, compartido entre los workers que usan el mismo archivo.
+_BUSY_TIMEOUT_SECONDS = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS fixed_holidays (day_month TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS ruc_cache (
+    ruc TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_local = threading.local()
+_ruc_writes = 0
+_pending_hits: Dict[str, int] = {}
+# Reentrante: save_ruc recorta la tabla con el lock ya tomado.
+_ruc_writes_lock = threading.RLock()
+_disabled_reason: Optional[str] = None
+
+def is_enabled() -> bool:
+    """Indica si la capa de snapshot está activa y no se desactivó por un error."""
+    return LOCAL_SNAPSHOT_ENABLED and _disabled_reason is None
+
+def _disable(error: Exception) -> None:
+    """
+    Desactiva el snapshot en esta instancia tras un error de SQLite; la app sigue con Firestore.
+
+    Un archivo bloqueado por otro worker (database is locked/busy) es transitorio:
+    la operación se omite sin desactivar el snapshot.
+    """
+    global _disabled_reason
+    if isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error)):
+        logger.warning("Local snapshot busy, skipping operation: %s", error)
+        return
+    _disabled_reason = str(error)
+    logger.error("Local snapshot disabled after error: %s", error)
+
+def compute_holidays_version(fixed_holidays: Dict[str, str]) -> str:
+    """Calcula una versión estable a partir del contenido de los feriados fijos."""
+    content = json_provider.dumps_bytes(fixed_holidays, sort_keys=True)
+    return hashlib.sha256(content).hexdigest()[:16]
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=_BUSY_TIMEOUT_SECONDS)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # Con WAL, NORMAL no hace fsync en cada commit; el snapshot es un caché reconstruible.
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(_SCHEMA)
+    return connection
+
+def _get_connection() -> sqlite3.Connection:
+    """Devuelve una conexión por hilo, copiando el snapshot empaquetado si aún no existe el local."""
+    connection = getattr(_local, 'connection', None)
+    if connection is None or getattr(_local, 'path', None) != LOCAL_SNAPSHOT_PATH:
+        if not os.path.exists(LOCAL_SNAPSHOT_PATH) and os.path.exists(PACKAGED_SNAPSHOT_PATH):
+            shutil.copyfile(PACKAGED_SNAPSHOT_PATH, LOCAL_SNAPSHOT_PATH)
+        connection = _connect(LOCAL_SNAPSHOT_PATH)
+        _local.connection = connection
+        _local.path = LOCAL_SNAPSHOT_PATH
+    return connection
+
+def _get_meta(connection: sqlite3.Connection, key: str) -> Optional[str]:
+    row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _is_valid(connection: sqlite3.Connection) -> bool:
+    """Valida la versión de esquema y, si está configurada, la versión de los feriados."""
+    if _get_meta(connection, 'schema_version') != str(SNAPSHOT_SCHEMA_VERSION):
+        return False
+    if EXPECTED_HOLIDAYS_VERSION and _get_meta(connection, 'holidays_version') != EXPECTED_HOLIDAYS_VERSION:
+        return False
+    return True
+
+# --- Feriados fijos ---
+def load_fixed_holidays() -> Optional[Dict[str, str]]:
+    """Devuelve los feriados fijos del snapshot, o None si no hay un snapshot válido."""
+    if not is_enabled():
+        return None
+    try:
+        connection = _get_connection()
+        if not _is_valid(connection) or _get_meta(connection, 'holidays_version') is None:
+            return None
+        rows = connection.execute("SELECT day_month, name FROM fixed_holidays").fetchall()
+        return dict(rows)
+    except sqlite3.Error as e:
+        _disable(e)
+        return None
+
+def save_fixed_holidays(fixed_holidays: Dict[str, str]) -> None:
+    """Reemplaza los feriados fijos del snapshot y actualiza su versión."""
+    if not is_enabled():
+        return
+    try:
+        connection = _get_connection()
+        with connection:
+            connection.execute("DELETE FROM fixed_holidays")
+            connection.executemany(
+                "INSERT INTO fixed_holidays (day_month, name) VALUES (?, ?)", fixed_holidays.items()
+            )
+            connection.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                ('schema_version', str(SNAPSHOT_SCHEMA_VERSION)),
+                ('holidays_version', compute_holidays_version(fixed_holidays)),
+                ('updated_at', datetime.now().astimezone().isoformat()),
+            ])
+    except sqlite3.Error as e:
+        _disable(e)
+
+# --- Caché de RUC ---
+def _decode_ruc(raw: str) -> Dict[str, Any]:
+    data = json_provider.loads(raw)
+    if isinstance(data.get('timestamp'), str):
+        data['timestamp'] = datetime.fromisoformat(data['timestamp'])
+    return data
+
+def get_ruc(ruc_number: str) -> Optional[Dict[str, Any]]:
+    """Devuelve la entrada local de un RUC (con su timestamp original) y cuenta el acceso en memoria."""
+    if not is_enabled():
+        return None
+    try:
+        connection = _get_connection()
+        if not _is_valid(connection):
+            return None
+        row = connection.execute("SELECT data FROM ruc_cache WHERE ruc = ?", (ruc_number,)).fetchone()
+        if row is None:
+            return None
+        with _ruc_writes_lock:
+            _pending_hits[ruc_number] = _pending_hits.get(ruc_number, 0) + 1
+            if sum(_pending_hits.values()) >= _RUC_HITS_FLUSH_INTERVAL:
+                _flush_hits(connection)
+        return _decode_ruc(row[0])
+    except sqlite3.Error as e:
+        _disable(e)
+        return None
+
+def save_ruc(ruc_number: str, data: Dict[str, Any]) -> None:
+    """
+    Guarda o actualiza una entrada de RUC conservando su contador de accesos.
+
+    Periódicamente se recorta la tabla para quedarse con las más consultadas.
+    """
+    global _ruc_writes
+    if not is_enabled() or not isinstance(data.get('timestamp'), datetime):
+        return
+    try:
+        connection = _get_connection()
+        with connection:
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)",
+                               ('schema_version', str(SNAPSHOT_SCHEMA_VERSION)))
+            connection.execute(
+                "INSERT INTO ruc_cache (ruc, data, hits) VALUES (?, ?, 1) "
+                "ON CONFLICT(ruc) DO UPDATE SET data = excluded.data, hits = hits + 1",
+                (ruc_number, json_provider.dumps_bytes(data).decode('utf-8')),
+            )
+        # El recorte se hace bajo el lock para que dos hilos no lo ejecuten a la vez.
+        with _ruc_writes_lock:
+            _ruc_writes += 1
+            if _ruc_writes % _RUC_PRUNE_INTERVAL == 0:
+                prune_ruc_cache()
+    except sqlite3.Error as e:
+        _disable(e)
+
+def delete_rucs(ruc_numbers: List[str]) -> None:
+    """Elimina las entradas locales de los RUC indicados (ej. borrados del caché de Firestore)."""
+    if not is_enabled() or not ruc_numbers:
+        return
+    try:
+        connection = _get_connection()
+        with connection:
+            connection.executemany("DELETE FROM ruc_cache WHERE ruc = ?", [(ruc,) for ruc in ruc_numbers])
+    except sqlite3.Error as e:
+        _disable(e)
+
+def _flush_hits(connection: sqlite3.Connection) -> None:
+    """Escribe en un lote los aciertos acumulados en memoria. Se llama con _ruc_writes_lock tomado."""
+    global _pending_hits
+    if not _pending_hits:
+        return
+    pending, _pending_hits = _pending_hits, {}
+    with connection:
+        connection.executemany("UPDATE ruc_cache SET hits = hits + ? WHERE ruc = ?",
+                               [(hits, ruc) for ruc, hits in pending.items()])
+
+def prune_ruc_cache(max_entries: Optional[int] = None) -> None:
+    """Elimina las entradas menos consultadas por encima de `max_entries`."""
+    max_entries = LOCAL_SNAPSHOT_MAX_RUC if max_entries is None else max_entries
+    connection = _get_connection()
+    with _ruc_writes_lock:
+        _flush_hits(connection)
+        with connection:
+            connection.execute(
+                "DELETE FROM ruc_cache WHERE ruc NOT IN "
+                "(SELECT ruc FROM ruc_cache ORDER BY hits DESC, ruc LIMIT ?)",
+                (max_entries,),
+            )
+
+# --- Exportación en el despliegue ---
+def export_snapshot(path: str = PACKAGED_SNAPSHOT_PATH, max_ruc: int = LOCAL_SNAPSHOT_MAX_RUC) -> str:
+    """
+    Genera un snapshot desde Firestore para empaquetarlo con la función.
+
+    Incluye los feriados fijos y las `max_ruc` entradas de RUC más recientes.
+
+    Returns:
+        La versión de los feriados exportados.
+    """
+    global LOCAL_SNAPSHOT_ENABLED, LOCAL_SNAPSHOT_PATH
+    from firebase_admin import firestore
+
+    import firestore_manager
+
+    if os.path.exists(path):
+        os.remove(path)
+    LOCAL_SNAPSHOT_ENABLED, LOCAL_SNAPSHOT_PATH = True, path
+    _local.connection = None
+
+    fixed_holidays = firestore_manager._get_fixed_holidays_from_db()
+    save_fixed_holidays(fixed_holidays)
+    recent = (
+        firestore_manager.get_db().collection(firestore_manager.RUC_CACHE_COLLECTION)
+        .order_by('timestamp', direction=firestore.Query.DESCENDING)
+        .limit(max_ruc)
+        .stream()
+    )
+    for doc in recent:
+        save_ruc(doc.id, doc.to_dict())
+    _local.connection.close()
+    _local.connection = None
+    return compute_holidays_version(fixed_holidays)
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['export']:
+        sys.exit("Uso: python local_snapshot.py export")
+    structured_logging.configure_logging()
+    version = export_snapshot()
+    print(f"Snapshot exportado en {PACKAGED_SNAPSHOT_PATH} (holidays_version={version}).")
@@ -1,23 +1,42 @@
 """Main application file for the Flask API."""
+import hmac
 import json
-import traceback
+import os
 from datetime import datetime
+from functools import wraps
 from io import BytesIO
 
-from flask import Flask, request, jsonify, Blueprint, Response
+from flask import Flask, request, jsonify, Blueprint, Response, send_file, g
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from firebase_functions import https_fn
+from firebase_functions import https_fn, scheduler_fn
+from werkzeug.exceptions import HTTPException
 
+import admission
+import excel_pool
+import metrics
 import services
+import structured_logging
+import warmup
 from services import ApiError, COLOR_PALETTE, DEFAULT_COLOR, _sanitize_filename
+from json_provider import FastJSONProvider
+from response_utils import optimized_response
 from utils import parse_date_str
 
 import openpyxl
 
+structured_logging.configure_logging()
+logger = structured_logging.get_logger(__name__)
+
+# Lo define wsgi.py antes de importar la app (ver gunicorn.conf.py).
+PREFORK_SERVER = os.environ.get("PREFORK_SERVER", "").lower() in ('1', 'true')
+
 # --- Configuración de la Aplicación Flask ---
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+# Los cuerpos más grandes se rechazan con 413 antes de parsear el JSON.
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_REQUEST_BODY_MB", "16")) * 1024 * 1024
 CORS(app)
 
 # --- Configuración de Rate Limiter ---
@@ -33,24 +52,94 @@ limiter = Limiter(
 
 api_blueprint = Blueprint('api', __name__)
 
+# --- Correlación de logs ---
+def _incoming_request_id():
+    """Reutiliza el id del cliente o el trace de Cloud Run ("TRACE_ID/SPAN_ID;o=1") si existen."""
+    request_id = request.headers.get('X-Request-Id')
+    if not request_id:
+        request_id = request.headers.get('X-Cloud-Trace-Context', '').split('/', 1)[0]
+    return request_id[:128] if request_id else structured_logging.new_request_id()
+
+HTTP_REQUESTS = metrics.counter('http_requests_total', 'Peticiones atendidas por endpoint y código HTTP.',
+                                ('endpoint', 'status'))
+
+@app.before_request
+def bind_request_id():
+    g.request_id = _incoming_request_id()
+    g.request_id_token = structured_logging.set_request_id(g.request_id)
+    # Las métricas (ej. lecturas de Firestore) se atribuyen al endpoint de la petición.
+    g.metrics_token = metrics.set_endpoint(request.endpoint or 'unmatched')
+
+@app.after_request
+def add_request_id_header(response):
+    if 'request_id' in g:
+        response.headers['X-Request-Id'] = g.request_id
+    HTTP_REQUESTS.inc(endpoint=request.endpoint or 'unmatched', status=response.status_code)
+    return response
+
+@app.teardown_request
+def unbind_request_id(exc):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        structured_logging.reset_request_id(token)
+    metrics_token = g.pop('metrics_token', None)
+    if metrics_token is not None:
+        metrics.reset_endpoint(metrics_token)
+
+# --- Autorización ---
+def _insecure_endpoints_allowed() -> bool:
+    """En el emulador de Firebase o con ALLOW_INSECURE_ENDPOINTS=true los endpoints sin token quedan abiertos."""
+    return any(
+        os.environ.get(flag, '').lower() in ('1', 'true')
+        for flag in ('FUNCTIONS_EMULATOR', 'ALLOW_INSECURE_ENDPOINTS')
+    )
+
+def token_required(env_var: str, header: str = 'X-Api-Token'):
+    """
+    Exige el token configurado en la variable de entorno `env_var` en la cabecera `header`.
+
+    Si la variable no está definida el endpoint responde 503 (falla cerrado), salvo
+    en desarrollo local (ver _insecure_endpoints_allowed).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            expected_token = os.environ.get(env_var)
+            if not expected_token:
+                if not _insecure_endpoints_allowed():
+                    logger.warning("Rejected request to %s: %s is not configured", request.path, env_var)
+                    raise ApiError("Endpoint no disponible: falta configurar el token de acceso.", 503)
+            elif not hmac.compare_digest(request.headers.get(header, ''), expected_token):
+                raise ApiError("No autorizado.", 403)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # --- Manejadores de Errores ---
 @app.errorhandler(ApiError)
 def handle_api_error(error):
     """Maneja errores controlados de la API."""
     response = jsonify(error.to_dict())
     response.status_code = error.status_code
+    response.headers.update(error.headers)
     return response
 
 @app.errorhandler(Exception)
 def handle_exception(e):
     """Maneja errores inesperados y no controlados."""
-    traceback.print_exc()
+    if isinstance(e, HTTPException):
+        # Errores HTTP de Flask/Werkzeug (404, 405, 413...) conservan su código.
+        response = jsonify({'message': e.description})
+        response.status_code = e.code
+        return response
+    logger.exception("Unhandled error: %s", e)
     response = jsonify({'message': 'Ocurrió un error interno en el servidor.'})
     response.status_code = 500
     return response
 
 @api_blueprint.route('/getHolidays', methods=['GET'])
 @limiter.limit("30 per minute") # Límite más suave para feriados
+@optimized_response
 def get_holidays():
     """API endpoint to get holidays for a given year."""
     year_str = request.args.get('year')
@@ -72,6 +161,8 @@ def consultar_ruc():
     return jsonify(ruc_data)
 
 @api_blueprint.route('/calculate', methods=['POST'])
+@admission.admission_controlled('calculate')
+@optimized_response
 def calculate_distribution():
     """API endpoint to calculate distribution."""
     try:
@@ -89,10 +180,11 @@ def calculate_distribution():
         result = services.perform_calculation(monto_total, fechas_str)
         return jsonify(result)
     except Exception as e:
-        print(f"Error detallado en calculate_distribution: {e}")
+        logger.exception("Error detallado en calculate_distribution: %s", e)
         raise ApiError("Error interno en el servidor durante el cálculo.", 500) from e
 
 @api_blueprint.route('/generate-excel', methods=['POST'])
+@admission.admission_controlled('generate-excel')
 def generate_excel_report():
     """Genera el reporte Excel desde los datos enviados."""
     try:
@@ -106,21 +198,28 @@ def generate_excel_report():
         # Esto corrige el bug que llamaba a una función inexistente y centraliza la lógica.
         excel_file_io, filename = services.generate_excel_service(data)
 
-        return Response(
-            excel_file_io.getvalue(),
+        # send_file transmite el BytesIO por bloques en lugar de hacer una copia completa con getvalue().
+        return send_file(
+            excel_file_io,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={
-                'Content-Disposition': f'attachment; filename="{filename}"'
-            }
+            as_attachment=True,
+            download_name=filename
         )
+    except ApiError:
+        raise
     except Exception as e:
-        print(f"Error en generate_excel_report: {e}")
-        traceback.print_exc()
+        logger.exception("Error en generate_excel_report: %s", e)
         raise ApiError("Error interno al generar el reporte Excel.", 500) from e
 
 @api_blueprint.route('/generate-json', methods=['POST'])
+@admission.admission_controlled('generate-json')
+@optimized_response
 def generate_json_report():
-    """Genera el reporte/respaldo JSON desde los datos enviados."""
+    """
+    Genera el reporte/respaldo JSON desde los datos enviados.
+
+    Con `?minify=1` el respaldo se genera sin indentación.
+    """
     try:
         data = request.get_json()
         if not data or not all(k in data for k in [
@@ -130,7 +229,8 @@ def generate_json_report():
             raise ApiError("Faltan datos necesarios para generar el reporte JSON.", 400)
 
         # La lógica de negocio se delega completamente al servicio.
-        json_content_bytes, filename = services.generate_json_service(data)
+        minify = request.args.get('minify', '').lower() in ('1', 'true')
+        json_content_bytes, filename = services.generate_json_service(data, minify=minify)
 
         return Response(
             json_content_bytes,
@@ -140,14 +240,116 @@ def generate_json_report():
             }
         )
     except Exception as e:
-        print(f"Error en generate_json_report: {e}")
+        logger.exception("Error en generate_json_report: %s", e)
         raise ApiError("Error interno al generar el reporte JSON.", 500) from e
 
+@api_blueprint.route('/plans', methods=['POST'])
+@token_required('PLANS_API_TOKEN')
+def save_plan():
+    """Guarda (o actualiza) un plan con sus cuotas para consultar sus vencimientos."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ApiError("Se esperaba un cuerpo JSON.", 400)
+    return jsonify(services.save_plan_service(data)), 201
+
+@api_blueprint.route('/plans/<plan_id>', methods=['DELETE'])
+@token_required('PLANS_API_TOKEN')
+def delete_plan(plan_id):
+    """Elimina un plan guardado y sus cuotas."""
+    services.delete_plan_service(plan_id)
+    return '', 204
+
+@api_blueprint.route('/due-dates', methods=['GET'])
+@token_required('PLANS_API_TOKEN')
+@optimized_response
+def get_due_dates():
+    """
+    Cuotas que vencen entre `desde` y `hasta` (DD/MM/AAAA), filtrables por `ruc` y `linea`.
+
+    Paginado: `limit` (máx. 200) y `cursor` (el `nextCursor` de la página anterior).
+    """
+    args = request.args
+    return jsonify(services.get_due_dates_service(
+        args.get('desde'), args.get('hasta'), ruc=args.get('ruc'), linea=args.get('linea'),
+        limit_str=args.get('limit'), cursor=args.get('cursor'),
+    ))
+
+@api_blueprint.route('/portfolio-summary', methods=['GET'])
+@token_required('PLANS_API_TOKEN')
+@optimized_response
+def get_portfolio_summary():
+    """
+    Exposición de la cartera por mes y línea, opcionalmente entre `desde` y `hasta` (AAAA-MM).
+
+    Con `format=xlsx` se descarga como Excel.
+    """
+    summary = services.get_portfolio_summary_service(request.args.get('desde'), request.args.get('hasta'))
+    if request.args.get('format') == 'xlsx':
+        excel_file_io, filename = services.generate_portfolio_excel_service(summary)
+        return send_file(
+            excel_file_io,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=filename
+        )
+    return jsonify(summary)
+
+@api_blueprint.route('/warmup', methods=['GET'])
+@limiter.limit("6 per minute")
+@token_required('WARMUP_TOKEN', header='X-Warmup-Token')
+def warmup_instance():
+    """
+    Prepara la instancia (Firestore, feriados, conexión RUC) y devuelve cuánto tardó cada paso.
+
+    Exige WARMUP_TOKEN en la cabecera X-Warmup-Token (503 si no está configurado).
+    """
+    return jsonify(warmup.run_warmup())
+
+@api_blueprint.route('/metrics', methods=['GET'])
+@limiter.exempt
+@token_required('METRICS_TOKEN')
+def get_metrics():
+    """
+    Métricas de la instancia (caché de feriados y RUC, lecturas/escrituras de
+    Firestore por endpoint, tiempos de generación de Excel) en formato Prometheus.
+    Bajo wsgi.py incluye la suma de todos los workers.
+
+    Exige METRICS_TOKEN en la cabecera X-Api-Token (503 si no está configurado).
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # --- Registro y Punto de Entrada ---
 app.register_blueprint(api_blueprint, url_prefix='/api')
 
+def start_instance_services() -> None:
+    """Arranca los recursos propios de cada instancia (o de cada worker del servidor)."""
+    # El pool de procesos para Excel (opcional) se arranca al cargar la instancia
+    # para que la primera petición no pague el arranque de los workers.
+    if excel_pool.is_enabled():
+        excel_pool.start_pool()
+    # Con min-instances, cada instancia nueva puede prepararse antes de su primera petición.
+    if warmup.WARMUP_ON_STARTUP:
+        warmup.start_background_warmup()
+
+# Bajo el servidor con preforking (wsgi.py) la app se carga en el proceso maestro
+# y estos recursos se crean en cada worker después del fork.
+if not PREFORK_SERVER:
+    start_instance_services()
+
 @https_fn.on_request()
 def api(req: https_fn.Request):
     """Main entry point for Firebase Functions HTTP requests."""
     with app.request_context(req.environ):
-        return app.full_dispatch_request()
\ No newline at end of file
+        return app.full_dispatch_request()
+
+@scheduler_fn.on_schedule(schedule="every day 03:00", timezone=scheduler_fn.Timezone("America/Lima"))
+def sweep_ruc_cache(event: scheduler_fn.ScheduledEvent) -> None:
+    """
+    Tarea programada que limpia las entradas vencidas del caché de RUC.
+
+    Por defecto elimina las que superan RUC_CACHE_RETENTION_DAYS. Con
+    RUC_CACHE_SWEEP_MODE=refresh las entradas vencidas se revalidan contra la
+    API en lugar de eliminarse.
+    """
+    refresh = os.environ.get("RUC_CACHE_SWEEP_MODE", "delete").lower() == "refresh"
+    services.sweep_expired_ruc_cache(refresh=refresh)
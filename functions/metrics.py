@@ -0,0 +1,315 @@
+"""
+In-process metrics registry (counters and histograms) in Prometheus text format.
+
+Cada proceso lleva sus propias métricas en memoria; GET /api/metrics las expone
+en el formato de texto de Prometheus (versión 0.0.4). Bajo el servidor con
+preforking (wsgi.py) cada scrape llega a un solo worker, así que en modo
+multiproceso (enable_multiprocess) cada worker vuelca periódicamente sus valores
+a un archivo propio en un directorio compartido y render() suma los de todos,
+incluidos los de workers ya reciclados, como el modo multiproceso de
+prometheus_client. Los valores de los demás workers llegan con hasta
+METRICS_FLUSH_SECONDS de retraso.
+
+Las métricas se declaran a nivel de módulo en el código que instrumentan:
+
+    RUC_LOOKUPS = metrics.counter('ruc_lookups_total', 'Consultas de RUC.', ('result',))
+    RUC_LOOKUPS.inc(result='fresh')
+
+El endpoint de la petición en curso se guarda en un ContextVar (ver main.py) para
+poder atribuir, por ejemplo, las lecturas de Firestore sin pasarlo como argumento;
+el trabajo en segundo plano se atribuye a BACKGROUND_ENDPOINT.
+"""
+import atexit
+import contextvars
+import copy
+import glob
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BACKGROUND_ENDPOINT = 'background'
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+
+endpoint_var: contextvars.ContextVar = contextvars.ContextVar('metrics_endpoint', default=BACKGROUND_ENDPOINT)
+
+def set_endpoint(endpoint: str) -> contextvars.Token:
+    return endpoint_var.set(endpoint)
+
+def reset_endpoint(token: contextvars.Token) -> None:
+    endpoint_var.reset(token)
+
+def current_endpoint() -> str:
+    return endpoint_var.get()
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames) or any(name not in labels for name in self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}, recibió {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for sample_name, labels, value in self._samples():
+            lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+    def reset(self) -> None:
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def empty_copy(self) -> '_Metric':
+        return type(self)(self.name, self.documentation, self.labelnames)
+
+    def dump(self) -> List[list]:
+        """Valores actuales serializables en JSON: [[etiquetas...], valor]."""
+        with self._lock:
+            return [[list(key), copy.deepcopy(value)] for key, value in self._values.items()]
+
+    def merge(self, values: List[list]) -> None:
+        """Suma a esta métrica los valores volcados por otro proceso."""
+        with self._lock:
+            for key, value in values:
+                key = tuple(key)
+                current = self._values.get(key)
+                self._values[key] = value if current is None else self._add(current, value)
+
+    @staticmethod
+    def _add(current, value):
+        return current + value
+
+class Counter(_Metric):
+    """Contador monotónico, opcionalmente con etiquetas."""
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Un contador no puede decrementarse.")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+class Histogram(_Metric):
+    """Histograma con buckets acumulativos, suma y número de observaciones."""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def empty_copy(self) -> 'Histogram':
+        return Histogram(self.name, self.documentation, self.labelnames, buckets=self.buckets[:-1])
+
+    @staticmethod
+    def _add(current, value):
+        return [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2]]
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa la duración (en segundos) del bloque."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", labels + [('le', _format_value(bound))], cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+class Registry:
+    """Conjunto de métricas del proceso, en orden de registro."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, *args, **kwargs) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                # Un módulo recargado (ej. main bajo functions-framework) reutiliza su métrica.
+                if not isinstance(existing, metric_class):
+                    raise ValueError(f"La métrica {name} ya está registrada como {existing.type_name}.")
+                return existing
+            metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        """Vacía los valores de todas las métricas, conservando su registro."""
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def dump(self) -> Dict[str, List[list]]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.dump() for metric in metrics}
+
+    def merged(self, dumps: List[Dict[str, List[list]]]) -> 'Registry':
+        """Registro nuevo con la suma de los volcados, para las métricas registradas aquí."""
+        merged = Registry()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            total = merged._metrics[metric.name] = metric.empty_copy()
+            for dump in dumps:
+                total.merge(dump.get(metric.name, []))
+        return merged
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.counter(name, documentation, labelnames)
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
+
+# --- Modo multiproceso (servidor con preforking) ---
+_multiprocess_dir: Optional[str] = None
+_dump_path: Optional[str] = None
+
+def enable_multiprocess(directory: str) -> None:
+    """
+    Activa la agregación entre workers. Se llama en el proceso maestro antes de
+    crear los workers; descarta los volcados de una ejecución anterior.
+    """
+    global _multiprocess_dir
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+    _multiprocess_dir = directory
+
+def flush() -> None:
+    """Vuelca los valores de este proceso a su archivo (reemplazo atómico)."""
+    if _dump_path is None:
+        return
+    temporary = f"{_dump_path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as handle:
+        json.dump(REGISTRY.dump(), handle)
+    os.replace(temporary, _dump_path)
+
+def _flush_periodically() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        flush()
+
+def reset_after_fork() -> None:
+    """
+    En un worker recién creado descarta los valores heredados del maestro (y sus
+    locks) y, en modo multiproceso, empieza a volcarlos a un archivo propio.
+
+    El nombre del archivo no es solo el pid: un pid reutilizado por un worker
+    nuevo no debe pisar los contadores de uno ya reciclado.
+    """
+    global _dump_path
+    REGISTRY.reset()
+    if _multiprocess_dir is None:
+        return
+    _dump_path = os.path.join(_multiprocess_dir, f"{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+    threading.Thread(target=_flush_periodically, name="metrics-flush", daemon=True).start()
+    atexit.register(flush)
+
+def render() -> str:
+    """Todas las métricas (de todos los workers en modo multiproceso) en formato de texto de Prometheus."""
+    if _multiprocess_dir is None or _dump_path is None:
+        return REGISTRY.render()
+    flush()
+    dumps = []
+    for path in glob.glob(os.path.join(_multiprocess_dir, '*.json')):
+        try:
+            with open(path, encoding='utf-8') as handle:
+                dumps.append(json.load(handle))
+        except (OSError, ValueError):
+            # Archivo de un worker que terminó a medio escribir; se ignora.
+            continue
+    return REGISTRY.merged(dumps).render()
@@ -0,0 +1,333 @@
+"""
+Firestore persistence for saved plans and their installments.
+
+Cada plan guarda su cabecera en `plans/{planId}` y una fila por cuota en
+`plan_installments/{planId}_{AAAAMMDD}` con la fecha de vencimiento, el RUC y la
+línea desnormalizados. Las consultas de vencimientos filtran e indexan sobre esa
+colección (ver firestore.indexes.json), de modo que su costo depende del número
+de cuotas devueltas y no del número de planes guardados.
+
+La exposición de la cartera por mes y línea se mantiene en `portfolio_rollups`
+como contadores fragmentados (PORTFOLIO_ROLLUP_SHARDS documentos por mes y
+línea, para repartir las escrituras concurrentes). Se actualizan en la misma
+transacción que la cabecera del plan, a partir de la diferencia entre los
+totales mensuales anteriores (guardados en la cabecera) y los nuevos.
+
+Un plan guardado antes de que existieran los contadores no tiene `monthlyTotals`
+y no está sumado en la cartera: al actualizarlo o eliminarlo no se descuenta
+nada. Para incorporarlos, una vez tras desplegar (desde la carpeta functions):
+    python plan_store.py backfill-rollups
+"""
+import base64
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+import firestore_manager
+import json_provider
+import structured_logging
+
+logger = structured_logging.get_logger(__name__)
+
+PLANS_COLLECTION = 'plans'
+INSTALLMENTS_COLLECTION = 'plan_installments'
+ROLLUPS_COLLECTION = 'portfolio_rollups'
+PORTFOLIO_ROLLUP_SHARDS = int(os.environ.get("PORTFOLIO_ROLLUP_SHARDS", "4"))
+# Firestore admite hasta 500 operaciones por batch o transacción.
+MAX_BATCH_WRITES = 450
+# Un plan actualiza como máximo dos contadores por mes (línea anterior y nueva)
+# más su cabecera, todo en una transacción: se limita su duración en meses.
+MAX_PLAN_MONTHS = 240
+
+def due_date_to_timestamp(due_date: date) -> datetime:
+    """Las fechas de vencimiento se guardan como medianoche UTC para poder consultarlas por rango."""
+    return datetime(due_date.year, due_date.month, due_date.day, tzinfo=timezone.utc)
+
+def installment_id(plan_id: str, due_date: date) -> str:
+    return f"{plan_id}_{due_date.strftime('%Y%m%d')}"
+
+def _commit_in_chunks(operations: List[Tuple[str, Any, Optional[Dict[str, Any]]]]) -> None:
+    """Aplica las operaciones ('set'/'delete', referencia, datos) en batches de MAX_BATCH_WRITES."""
+    db_client = firestore_manager.get_db()
+    for start in range(0, len(operations), MAX_BATCH_WRITES):
+        batch = db_client.batch()
+        for action, reference, data in operations[start:start + MAX_BATCH_WRITES]:
+            if action == 'set':
+                batch.set(reference, data)
+            else:
+                batch.delete(reference)
+        batch.commit()
+        firestore_manager.record_usage(writes=len(operations[start:start + MAX_BATCH_WRITES]))
+
+def _installments_query(plan_id: str):
+    return (
+        firestore_manager.get_db().collection(INSTALLMENTS_COLLECTION)
+        .where(filter=firestore.FieldFilter('planId', '==', plan_id))
+    )
+
+def _existing_installment_ids(plan_id: str) -> List[str]:
+    ids = [doc.id for doc in _installments_query(plan_id).stream()]
+    firestore_manager.record_usage(reads=max(1, len(ids)))
+    return ids
+
+def to_centavos(monto: float) -> int:
+    """Los totales se acumulan en centavos enteros para que los incrementos no arrastren error de redondeo."""
+    return int(round(monto * 100))
+
+def monthly_totals(installments: Dict[date, float]) -> Dict[str, int]:
+    """Totales por mes ('AAAA-MM') en centavos."""
+    totals: Dict[str, int] = defaultdict(int)
+    for due_date, monto in installments.items():
+        totals[due_date.strftime('%Y-%m')] += to_centavos(monto)
+    return dict(totals)
+
+def _rollup_deltas(old_plan: Optional[Dict[str, Any]], new_linea: Optional[str],
+                   new_totals: Dict[str, int]) -> Dict[Tuple[str, str], int]:
+    """
+    Diferencia por (mes, línea) entre la versión guardada del plan y la nueva.
+
+    Una cabecera sin `monthlyTotals` (plan anterior a los contadores y aún no
+    incorporado por backfill_portfolio_rollups) no resta nada.
+    """
+    deltas: Dict[Tuple[str, str], int] = defaultdict(int)
+    if old_plan:
+        for month, centavos in old_plan.get('monthlyTotals', {}).items():
+            deltas[(month, old_plan.get('linea'))] -= centavos
+    for month, centavos in new_totals.items():
+        deltas[(month, new_linea)] += centavos
+    return {key: delta for key, delta in deltas.items() if delta}
+
+def _apply_rollup_deltas(transaction, deltas: Dict[Tuple[str, str], int]) -> None:
+    """Suma los deltas en un fragmento aleatorio de cada contador (mes, línea)."""
+    rollups_ref = firestore_manager.get_db().collection(ROLLUPS_COLLECTION)
+    for (month, linea), delta in deltas.items():
+        shard = random.randrange(PORTFOLIO_ROLLUP_SHARDS)
+        transaction.set(rollups_ref.document(f"{month}_{linea}_{shard}"), {
+            'month': month,
+            'linea': linea,
+            'shard': shard,
+            'totalCentavos': firestore.Increment(delta),
+            'updatedAt': firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+
+def _write_plan_header(plan_id: str, header: Optional[Dict[str, Any]],
+                       new_totals: Dict[str, int]) -> Optional[Dict[str, Any]]:
+    """
+    Escribe (o elimina, con header=None) la cabecera del plan y actualiza los
+    contadores de la cartera en una sola transacción.
+
+    Returns:
+        La cabecera anterior, o None si el plan no existía.
+    """
+    db_client = firestore_manager.get_db()
+    plan_ref = db_client.collection(PLANS_COLLECTION).document(plan_id)
+
+    @firestore.transactional
+    def _update(transaction):
+        # En una transacción todas las lecturas deben ir antes que las escrituras.
+        snapshot = plan_ref.get(transaction=transaction)
+        old_plan = snapshot.to_dict() if snapshot.exists else None
+        if header is None and old_plan is None:
+            return None, 0
+        new_linea = header.get('linea') if header else None
+        deltas = _rollup_deltas(old_plan, new_linea, new_totals)
+        _apply_rollup_deltas(transaction, deltas)
+        if header is None:
+            transaction.delete(plan_ref)
+        else:
+            transaction.set(plan_ref, {**header, 'monthlyTotals': new_totals})
+        return old_plan, len(deltas) + 1
+
+    old_plan, writes = _update(db_client.transaction())
+    # Se registra una vez tras el commit: los reintentos por contención no cuentan.
+    firestore_manager.record_usage(reads=1, writes=writes)
+    return old_plan
+
+def save_plan(plan_id: str, header: Dict[str, Any], installments: Dict[date, float]) -> None:
+    """
+    Crea o reemplaza un plan y sus cuotas.
+
+    La cabecera y los contadores de la cartera se actualizan en una transacción;
+    después se escriben las cuotas (en batches de MAX_BATCH_WRITES) y se eliminan
+    las que ya no forman parte del plan. Las cuotas son un índice derivado de la
+    cabecera: si su escritura falla, volver a guardar el plan las repara.
+    """
+    db_client = firestore_manager.get_db()
+    installments_ref = db_client.collection(INSTALLMENTS_COLLECTION)
+    denormalized = {key: header.get(key) for key in ('ruc', 'razonSocial', 'linea', 'pedido')}
+
+    _write_plan_header(plan_id, {
+        **header,
+        'numCuotas': len(installments),
+        'firstDueDate': due_date_to_timestamp(min(installments)),
+        'lastDueDate': due_date_to_timestamp(max(installments)),
+        'updatedAt': firestore.SERVER_TIMESTAMP,
+    }, monthly_totals(installments))
+
+    operations = []
+    new_ids = set()
+    for due_date, monto in sorted(installments.items()):
+        doc_id = installment_id(plan_id, due_date)
+        new_ids.add(doc_id)
+        operations.append(('set', installments_ref.document(doc_id), {
+            **denormalized,
+            'planId': plan_id,
+            'dueDate': due_date_to_timestamp(due_date),
+            'month': due_date.strftime('%Y-%m'),
+            'monto': monto,
+        }))
+    for doc_id in _existing_installment_ids(plan_id):
+        if doc_id not in new_ids:
+            operations.append(('delete', installments_ref.document(doc_id), None))
+    _commit_in_chunks(operations)
+
+def delete_plan(plan_id: str) -> bool:
+    """Elimina un plan y sus cuotas, descontándolo de la cartera; devuelve False si no existía."""
+    if _write_plan_header(plan_id, None, {}) is None:
+        return False
+    installments_ref = firestore_manager.get_db().collection(INSTALLMENTS_COLLECTION)
+    _commit_in_chunks([('delete', installments_ref.document(doc_id), None)
+                       for doc_id in _existing_installment_ids(plan_id)])
+    return True
+
+def _installment_totals(plan_id: str) -> Dict[str, int]:
+    """Totales por mes en centavos a partir de las cuotas guardadas de un plan."""
+    docs = list(_installments_query(plan_id).stream())
+    firestore_manager.record_usage(reads=max(1, len(docs)))
+    totals: Dict[str, int] = defaultdict(int)
+    for doc in docs:
+        installment = doc.to_dict()
+        totals[installment['month']] += to_centavos(installment['monto'])
+    return dict(totals)
+
+def _add_legacy_plan(plan_id: str, totals: Dict[str, int]) -> bool:
+    """Suma a la cartera un plan sin `monthlyTotals` y se los guarda, en una transacción."""
+    db_client = firestore_manager.get_db()
+    plan_ref = db_client.collection(PLANS_COLLECTION).document(plan_id)
+
+    @firestore.transactional
+    def _update(transaction):
+        snapshot = plan_ref.get(transaction=transaction)
+        plan = snapshot.to_dict() if snapshot.exists else None
+        # Eliminado o vuelto a guardar (ya contado) desde que se leyeron sus cuotas.
+        if plan is None or 'monthlyTotals' in plan:
+            return 0
+        deltas = _rollup_deltas(None, plan.get('linea'), totals)
+        _apply_rollup_deltas(transaction, deltas)
+        transaction.set(plan_ref, {'monthlyTotals': totals}, merge=True)
+        return len(deltas) + 1
+
+    writes = _update(db_client.transaction())
+    firestore_manager.record_usage(reads=1, writes=writes)
+    return writes > 0
+
+def backfill_portfolio_rollups() -> int:
+    """
+    Incorpora a la cartera los planes guardados antes de los contadores, a partir
+    de sus cuotas. Puede ejecutarse más de una vez: los planes ya contados se omiten.
+
+    Returns:
+        El número de planes incorporados.
+    """
+    plans = list(firestore_manager.get_db().collection(PLANS_COLLECTION).stream())
+    firestore_manager.record_usage(reads=max(1, len(plans)))
+    added = 0
+    for doc in plans:
+        if 'monthlyTotals' in doc.to_dict():
+            continue
+        if _add_legacy_plan(doc.id, _installment_totals(doc.id)):
+            added += 1
+    logger.info("Portfolio rollups backfilled", extra={'plans': added})
+    return added
+
+# --- Resumen de cartera ---
+def get_portfolio_rollups(month_from: Optional[str] = None,
+                          month_to: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Lee solo los contadores de la cartera y suma sus fragmentos.
+
+    Returns:
+        {'AAAA-MM': {linea: centavos}} con los meses entre `month_from` y `month_to` (inclusive).
+    """
+    query = firestore_manager.get_db().collection(ROLLUPS_COLLECTION)
+    if month_from:
+        query = query.where(filter=firestore.FieldFilter('month', '>=', month_from))
+    if month_to:
+        query = query.where(filter=firestore.FieldFilter('month', '<=', month_to))
+
+    totals: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    docs = list(query.stream())
+    firestore_manager.record_usage(reads=max(1, len(docs)))
+    for doc in docs:
+        data = doc.to_dict()
+        totals[data['month']][data['linea']] += data.get('totalCentavos', 0)
+    return {
+        month: {linea: centavos for linea, centavos in lineas.items() if centavos}
+        for month, lineas in sorted(totals.items())
+        if any(lineas.values())
+    }
+
+# --- Consultas de vencimientos ---
+def encode_cursor(due_date: datetime, doc_id: str) -> str:
+    """Cursor opaco (fecha de vencimiento, id) de la última cuota devuelta."""
+    raw = json_provider.dumps_bytes([due_date.isoformat(), doc_id])
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    Raises:
+        ValueError: si el cursor no es válido.
+    """
+    try:
+        due_date_iso, doc_id = json_provider.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(due_date_iso), str(doc_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+def query_due_installments(date_from: date, date_to: date, ruc: Optional[str] = None,
+                           linea: Optional[str] = None, limit: int = 50,
+                           cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Devuelve una página de cuotas con vencimiento entre `date_from` y `date_to` (inclusive).
+
+    Se ordena por fecha de vencimiento y id, y se pagina con un cursor: cada página
+    lee como máximo `limit` documentos.
+
+    Returns:
+        (cuotas, cursor de la página siguiente o None si no hay más).
+    """
+    query = firestore_manager.get_db().collection(INSTALLMENTS_COLLECTION)
+    if ruc:
+        query = query.where(filter=firestore.FieldFilter('ruc', '==', ruc))
+    if linea:
+        query = query.where(filter=firestore.FieldFilter('linea', '==', linea))
+    query = (
+        query
+        .where(filter=firestore.FieldFilter('dueDate', '>=', due_date_to_timestamp(date_from)))
+        .where(filter=firestore.FieldFilter('dueDate', '<=', due_date_to_timestamp(date_to)))
+        .order_by('dueDate')
+        .order_by('__name__')
+        .limit(limit)
+    )
+    if cursor:
+        last_due_date, last_id = decode_cursor(cursor)
+        query = query.start_after({'dueDate': last_due_date, '__name__': last_id})
+
+    docs = list(query.stream())
+    firestore_manager.record_usage(reads=max(1, len(docs)))
+    items = [{'id': doc.id, **doc.to_dict()} for doc in docs]
+    next_cursor = None
+    if len(docs) == limit:
+        next_cursor = encode_cursor(items[-1]['dueDate'], items[-1]['id'])
+    return items, next_cursor
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['backfill-rollups']:
+        sys.exit("Uso: python plan_store.py backfill-rollups")
+    structured_logging.configure_logging()
+    print(f"Planes incorporados a la cartera: {backfill_portfolio_rollups()}")
@@ -0,0 +1,209 @@
+"""
+Memory estimation and budgeting for Excel report generation.
+
+El consumo de openpyxl crece con el número de celdas del libro. Antes de generar
+un reporte se estima su pico de memoria a partir del tamaño del payload y se
+elige el modo de generación:
+
+- 'full': reporte completo (dashboard con gráfico + detalle de pagos).
+- 'streaming': libro write_only compacto, con memoria casi constante.
+
+Si ni siquiera el modo streaming cabe en el presupuesto, el llamador debe
+rechazar la petición (413).
+"""
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows: no hay getrusage, el RSS se informa como 0.
+    resource = None
+
+MODE_FULL = 'full'
+MODE_STREAMING = 'streaming'
+
+_MB = 1024 * 1024
+REPORT_MEMORY_BUDGET_BYTES = int(float(os.environ.get("REPORT_MEMORY_BUDGET_MB", "128")) * _MB)
+# Proporción de reportes cuyo pico se mide con tracemalloc. El trazado hace la
+# generación unas 5 veces más lenta, por eso por defecto solo se registra el RSS.
+REPORT_MEMORY_TRACE_RATE = float(os.environ.get("REPORT_MEMORY_TRACE_RATE", "0"))
+
+# Coeficientes medidos con tracemalloc sobre openpyxl 3.1, con margen (ver calibrate()).
+# Incluyen el guardado del libro en memoria.
+FULL_BASE_BYTES = 1 * _MB
+FULL_BYTES_PER_CELL = 480
+STREAMING_BASE_BYTES = 1 * _MB
+STREAMING_BYTES_PER_DATE = 120
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+def count_report_cells(data: Dict[str, Any]) -> int:
+    """
+    Estima las celdas del reporte completo.
+
+    Por fecha: 2 celdas en "Detalle por Mes" y 3 en "Detalle de Pagos".
+    Por mes: 3 en el resumen, 4 de cabecera y 2 de totales en el detalle.
+    """
+    num_fechas = len(data.get('fechasOrdenadas') or data.get('montosAsignados') or [])
+    num_meses = len(data.get('resumenMensual') or {})
+    return 5 * num_fechas + 9 * num_meses
+
+def estimate_report_memory(data: Dict[str, Any]) -> Dict[str, int]:
+    """Devuelve el pico estimado en bytes para cada modo de generación."""
+    num_fechas = len(data.get('fechasOrdenadas') or data.get('montosAsignados') or [])
+    return {
+        MODE_FULL: FULL_BASE_BYTES + FULL_BYTES_PER_CELL * count_report_cells(data),
+        MODE_STREAMING: STREAMING_BASE_BYTES + STREAMING_BYTES_PER_DATE * num_fechas,
+    }
+
+def choose_report_mode(data: Dict[str, Any],
+                       budget_bytes: Optional[int] = None) -> Tuple[Optional[str], int]:
+    """
+    Elige el modo de generación que cabe en el presupuesto de memoria.
+
+    Returns:
+        (modo, estimación en bytes). El modo es None si ninguno cabe; en ese
+        caso la estimación corresponde al modo streaming.
+    """
+    budget = REPORT_MEMORY_BUDGET_BYTES if budget_bytes is None else budget_bytes
+    estimates = estimate_report_memory(data)
+    for mode in (MODE_FULL, MODE_STREAMING):
+        if estimates[mode] <= budget:
+            return mode, estimates[mode]
+    return None, estimates[MODE_STREAMING]
+
+def _current_rss_bytes() -> int:
+    """Memoria residente actual del proceso según /proc/self/statm (0 donde no existe, ej. macOS)."""
+    try:
+        with open('/proc/self/statm', 'rb') as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+def _max_rss_bytes() -> int:
+    """Máximo de memoria residente del proceso (ru_maxrss está en KB en Linux y en bytes en macOS)."""
+    if resource is None:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+class MemoryUsage:
+    """Resultado de track_peak_memory."""
+
+    def __init__(self):
+        self.traced_peak: Optional[int] = None
+        # RSS actual antes y después del bloque: lo que el bloque dejó retenido.
+        self.rss_before: int = 0
+        self.rss_after: int = 0
+        # Máximo histórico del proceso (ru_maxrss); no es un pico por petición.
+        self.process_max_rss: int = 0
+        self.elapsed: float = 0.0
+
+    @property
+    def rss_delta(self) -> int:
+        return self.rss_after - self.rss_before
+
+    def describe(self) -> str:
+        traced = f"{self.traced_peak / _MB:.1f} MB" if self.traced_peak is not None else "no medido"
+        return (f"pico tracemalloc={traced}, RSS {self.rss_before / _MB:.1f} -> {self.rss_after / _MB:.1f} MB, "
+                f"RSS máx. proceso={self.process_max_rss / _MB:.1f} MB, {self.elapsed:.2f}s")
+
+@contextmanager
+def track_peak_memory(trace: Optional[bool] = None):
+    """
+    Mide la memoria usada por el bloque.
+
+    Siempre registra el RSS actual antes y después del bloque (por petición,
+    barato de leer) y el RSS máximo histórico del proceso. Si `trace` es True (o por muestreo según REPORT_MEMORY_TRACE_RATE), mide además
+    el pico de asignaciones con tracemalloc. El pico de tracemalloc es global del
+    proceso, así que con reportes concurrentes incluye las asignaciones de todos.
+    """
+    global _tracing_users
+    if trace is None:
+        trace = REPORT_MEMORY_TRACE_RATE > 0 and random.random() < REPORT_MEMORY_TRACE_RATE
+
+    usage = MemoryUsage()
+    usage.rss_before = _current_rss_bytes()
+    started_tracing = False
+    baseline = 0
+    if trace:
+        with _tracing_lock:
+            if _tracing_users == 0:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    started_tracing = True
+                tracemalloc.reset_peak()
+            _tracing_users += 1
+            baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        yield usage
+    finally:
+        usage.elapsed = time.perf_counter() - started
+        if trace:
+            with _tracing_lock:
+                usage.traced_peak = max(0, tracemalloc.get_traced_memory()[1] - baseline)
+                _tracing_users -= 1
+                if started_tracing and _tracing_users == 0:
+                    tracemalloc.stop()
+        usage.rss_after = _current_rss_bytes()
+        usage.process_max_rss = _max_rss_bytes()
+
+def _synthetic_report(num_fechas: int, step_days: int) -> Dict[str, Any]:
+    start = date(2025, 1, 1)
+    fechas = [(start + timedelta(days=i * step_days)).strftime("%d/%m/%Y") for i in range(num_fechas)]
+    resumen = {}
+    for fecha in fechas:
+        mes_key = f"{fecha[6:]}-{fecha[3:5]}"
+        resumen[mes_key] = resumen.get(mes_key, 0) + 1.0
+    return {
+        'montoOriginal': float(num_fechas),
+        'fechasOrdenadas': fechas,
+        'montosAsignados': {fecha: 1.0 for fecha in fechas},
+        'resumenMensual': resumen,
+        'linea': 'otros',
+    }
+
+def calibrate(sizes: Tuple[int, int] = (200, 1200)) -> Dict[str, float]:
+    """
+    Recalcula los coeficientes midiendo con tracemalloc dos reportes sintéticos.
+
+    Útil al actualizar openpyxl o desde el warm-up de una instancia.
+
+    Returns:
+        Los coeficientes resultantes.
+    """
+    global FULL_BASE_BYTES, FULL_BYTES_PER_CELL, STREAMING_BASE_BYTES, STREAMING_BYTES_PER_DATE
+    import excel_generator
+
+    measurements = {MODE_FULL: [], MODE_STREAMING: []}
+    for size in sizes:
+        data = _synthetic_report(size, step_days=2)
+        for mode in (MODE_FULL, MODE_STREAMING):
+            with track_peak_memory(trace=True) as usage:
+                excel_generator.render_workbook(data, "808080", streaming=mode == MODE_STREAMING)
+            units = count_report_cells(data) if mode == MODE_FULL else size
+            measurements[mode].append((units, usage.traced_peak))
+
+    def fit(points):
+        (x1, y1), (x2, y2) = points
+        slope = max(1.0, (y2 - y1) / (x2 - x1))
+        return max(0.0, y1 - slope * x1), slope
+
+    FULL_BASE_BYTES, FULL_BYTES_PER_CELL = fit(measurements[MODE_FULL])
+    STREAMING_BASE_BYTES, STREAMING_BYTES_PER_DATE = fit(measurements[MODE_STREAMING])
+    return {
+        'full_base_bytes': FULL_BASE_BYTES,
+        'full_bytes_per_cell': FULL_BYTES_PER_CELL,
+        'streaming_base_bytes': STREAMING_BASE_BYTES,
+        'streaming_bytes_per_date': STREAMING_BYTES_PER_DATE,
+    }
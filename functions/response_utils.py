@@ -0,0 +1,98 @@
+"""Utilities for response compression and conditional (ETag) responses."""
+import gzip
+import hashlib
+from functools import wraps
+
+from flask import request, make_response
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin él solo se ofrece gzip.
+    brotli = None
+
+# Respuestas más pequeñas que esto no se comprimen: el ahorro no compensa el coste de CPU.
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = {'application/json'}
+
+def negotiate_encoding(accept_encodings) -> str:
+    """
+    Elige la codificación de contenido a partir de la cabecera Accept-Encoding.
+
+    Returns:
+        'br', 'gzip' o 'identity'.
+    """
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return 'identity'
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    """Comprime el cuerpo con la codificación indicada."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 hace la salida determinista para un mismo cuerpo.
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+# Métodos para los que un If-None-Match coincidente puede responder 304 (RFC 9110, 13.1.2).
+CONDITIONAL_METHODS = {'GET', 'HEAD'}
+
+def _compute_etag(body: bytes, content_disposition: str = '') -> str:
+    """
+    Calcula un ETag a partir del cuerpo sin comprimir y del nombre de archivo
+    (Content-Disposition): el mismo contenido descargado con otro nombre es
+    otra representación.
+    """
+    digest = hashlib.blake2b(body, digest_size=16)
+    digest.update(b'\0' + content_disposition.encode('utf-8'))
+    return digest.hexdigest()
+
+def finalize_response(response):
+    """
+    Aplica ETag/If-None-Match y compresión a una respuesta determinista.
+
+    El ETag es débil (W/"...") porque identifica el contenido sin comprimir y
+    es válido para cualquiera de sus codificaciones. Solo GET y HEAD pueden
+    responder 304; en POST el ETag se envía pero la respuesta es completa.
+    """
+    if response.status_code != 200 or response.direct_passthrough:
+        return response
+
+    body = response.get_data()
+    etag = _compute_etag(body, response.headers.get('Content-Disposition', ''))
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+
+    if request.method in CONDITIONAL_METHODS and request.if_none_match.contains_weak(etag):
+        response.status_code = 304
+        response.set_data(b'')
+        # Werkzeug recalcula Content-Length; un 304 no lleva cuerpo ni tipo.
+        response.headers.pop('Content-Type', None)
+        return response
+
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or len(body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding == 'identity':
+        return response
+
+    response.set_data(compress_body(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def optimized_response(view):
+    """
+    Decorador para endpoints cuya respuesta depende solo de la petición.
+
+    Añade ETag y compresión; en los endpoints GET un If-None-Match coincidente
+    devuelve 304.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return finalize_response(make_response(view(*args, **kwargs)))
+    return wrapper
@@ -0,0 +1,235 @@
+"""
+Resilient HTTP calls to the external RUC API: circuit breaker and hedged requests.
+
+- El circuit breaker observa el resultado de las últimas consultas; si la tasa de
+  error supera el umbral se abre y las consultas fallan de inmediato (el servicio
+  devuelve el caché si existe) en lugar de esperar el timeout completo. Tras
+  RUC_BREAKER_OPEN_SECONDS deja pasar una sola consulta de prueba (half-open).
+- Cada intento tiene su propio timeout corto y la consulta completa un plazo
+  total. Con RUC_HEDGE_AFTER_SECONDS > 0, si el primer intento tarda más que eso
+  se lanza un segundo en paralelo y se usa la primera respuesta válida.
+- Un intento que falla se reintenta tras una espera corta con jitter
+  (RUC_RETRY_BACKOFF_SECONDS) para no duplicar de golpe la carga sobre una API
+  que ya está fallando.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+import structured_logging
+
+logger = structured_logging.get_logger(__name__)
+
+RUC_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("RUC_CONNECT_TIMEOUT_SECONDS", "3"))
+RUC_ATTEMPT_TIMEOUT_SECONDS = float(os.environ.get("RUC_ATTEMPT_TIMEOUT_SECONDS", "5"))
+RUC_DEADLINE_SECONDS = float(os.environ.get("RUC_DEADLINE_SECONDS", "10"))
+RUC_MAX_ATTEMPTS = int(os.environ.get("RUC_MAX_ATTEMPTS", "2"))
+# 0 desactiva el hedging: el segundo intento solo se lanza si el primero falla.
+RUC_HEDGE_AFTER_SECONDS = float(os.environ.get("RUC_HEDGE_AFTER_SECONDS", "0"))
+# Espera media antes de reintentar un intento fallido; se aplica entre 0.5x y 1.5x.
+RUC_RETRY_BACKOFF_SECONDS = float(os.environ.get("RUC_RETRY_BACKOFF_SECONDS", "0.2"))
+
+RUC_BREAKER_WINDOW = int(os.environ.get("RUC_BREAKER_WINDOW", "20"))
+RUC_BREAKER_MIN_CALLS = int(os.environ.get("RUC_BREAKER_MIN_CALLS", "5"))
+RUC_BREAKER_FAILURE_RATIO = float(os.environ.get("RUC_BREAKER_FAILURE_RATIO", "0.5"))
+RUC_BREAKER_OPEN_SECONDS = float(os.environ.get("RUC_BREAKER_OPEN_SECONDS", "30"))
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# Los intentos paralelos se ejecutan en un pool propio; el hilo de la petición solo espera.
+_attempt_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ruc-attempt")
+
+class CircuitBreaker:
+    """
+    Circuit breaker con ventana deslizante de resultados.
+
+    Args:
+        window: Número de resultados recientes considerados.
+        min_calls: Resultados mínimos en la ventana antes de poder abrir el circuito.
+        failure_ratio: Fracción de fallos (0-1) que abre el circuito.
+        open_seconds: Tiempo que el circuito permanece abierto antes de probar de nuevo.
+        clock: Fuente de tiempo monotónica (inyectable en pruebas).
+    """
+
+    def __init__(self, window: int = RUC_BREAKER_WINDOW, min_calls: int = RUC_BREAKER_MIN_CALLS,
+                 failure_ratio: float = RUC_BREAKER_FAILURE_RATIO,
+                 open_seconds: float = RUC_BREAKER_OPEN_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._outcomes: deque = deque(maxlen=window)
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == STATE_OPEN and self._clock() - self._opened_at >= self.open_seconds:
+                return STATE_HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        """Segundos que faltan para que el circuito abierto admita una consulta de prueba."""
+        with self._lock:
+            if self._state != STATE_OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (self._clock() - self._opened_at))
+
+    def allow_request(self) -> bool:
+        """Indica si se puede llamar a la API; en half-open solo admite una consulta a la vez."""
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_OPEN:
+                if self._clock() - self._opened_at < self.open_seconds:
+                    return False
+                self._state = STATE_HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                logger.info("RUC circuit breaker closed after a successful probe.")
+                self._state = STATE_CLOSED
+                self._outcomes.clear()
+                self._probe_in_flight = False
+            self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if (self._state == STATE_CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_ratio):
+                self._open()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._outcomes.clear()
+            self._probe_in_flight = False
+
+    def _open(self) -> None:
+        logger.warning("RUC circuit breaker opened for %ss.", self.open_seconds,
+                       extra={'outcomes': list(self._outcomes)[-self.min_calls:]})
+        self._state = STATE_OPEN
+        self._opened_at = self._clock()
+        self._probe_in_flight = False
+
+def _is_failure(result) -> bool:
+    """Un fallo es una excepción de red o un 5xx; un 4xx indica que la API está sana."""
+    return isinstance(result, Exception) or result.status_code >= 500
+
+def _close_quietly(future: Future) -> None:
+    """Libera la conexión de un intento descartado cuando termine."""
+    def _close(done: Future):
+        if not done.cancelled() and done.exception() is None:
+            done.result().close()
+    future.add_done_callback(_close)
+
+def hedged_get(session: requests.Session, url: str, headers: Optional[Dict[str, str]] = None,
+               attempt_timeout: float = None, deadline: float = None,
+               max_attempts: int = None, hedge_after: float = None) -> requests.Response:
+    """
+    GET con timeout por intento, reintentos y hedging dentro de un plazo total.
+
+    Se lanza un intento nuevo cuando el anterior falla (tras una espera con
+    jitter) o, si `hedge_after` > 0, cuando lleva más de `hedge_after` segundos
+    sin responder. Se devuelve la
+    primera respuesta que no sea 5xx.
+
+    Returns:
+        La respuesta ganadora, o la última respuesta 5xx si todos los intentos fallaron.
+
+    Raises:
+        requests.exceptions.RequestException: si ningún intento obtuvo respuesta;
+            requests.exceptions.Timeout si se agotó el plazo total.
+    """
+    attempt_timeout = RUC_ATTEMPT_TIMEOUT_SECONDS if attempt_timeout is None else attempt_timeout
+    deadline = RUC_DEADLINE_SECONDS if deadline is None else deadline
+    max_attempts = RUC_MAX_ATTEMPTS if max_attempts is None else max_attempts
+    hedge_after = RUC_HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+    timeout = (min(RUC_CONNECT_TIMEOUT_SECONDS, attempt_timeout), attempt_timeout)
+
+    def _attempt():
+        return session.get(url, headers=headers, timeout=timeout)
+
+    if max_attempts <= 1 and not hedge_after:
+        # Caso simple: un solo intento en el hilo de la petición.
+        return _attempt()
+
+    started = time.monotonic()
+    pending: List[Future] = []
+    attempts = 0
+    last_result = None
+
+    def _launch():
+        nonlocal attempts
+        attempts += 1
+        pending.append(_attempt_executor.submit(_attempt))
+
+    _launch()
+    while pending:
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        wait_for = min(remaining, hedge_after) if hedge_after and attempts < max_attempts else remaining
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        if not done:
+            # El intento en curso es lento: se lanza uno en paralelo (hedging).
+            if hedge_after and attempts < max_attempts:
+                _launch()
+            continue
+        for future in done:
+            pending.remove(future)
+            error = future.exception()
+            result = error if error is not None else future.result()
+            if not _is_failure(result):
+                for other in pending:
+                    other.cancel()
+                    _close_quietly(other)
+                return result
+            if last_result is not None and not isinstance(last_result, Exception):
+                last_result.close()
+            last_result = result
+        if not pending and attempts < max_attempts:
+            remaining = deadline - (time.monotonic() - started)
+            time.sleep(min(max(remaining, 0.0), RUC_RETRY_BACKOFF_SECONDS * random.uniform(0.5, 1.5)))
+            _launch()
+
+    for other in pending:
+        other.cancel()
+        _close_quietly(other)
+    if pending or last_result is None:
+        raise requests.exceptions.Timeout(f"RUC API did not answer within {deadline}s")
+    if isinstance(last_result, Exception):
+        raise last_result
+    return last_result
+
+# Breaker compartido por todas las consultas de la instancia.
+breaker = CircuitBreaker()
+
+def reset_after_fork() -> None:
+    """Crea de nuevo el pool de intentos y el circuit breaker en un worker recién creado."""
+    global _attempt_executor, breaker
+    _attempt_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ruc-attempt")
+    breaker = CircuitBreaker()
@@ -1,21 +1,37 @@
 """Service layer for handling business logic and data interactions."""
-import json
+import math
 import os
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from collections import defaultdict
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from io import BytesIO
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
 from firebase_admin import firestore
-from openpyxl import Workbook
 
 import excel_generator
+import excel_pool
 import firestore_manager
+import json_provider
+import metrics
+import plan_store
+import report_memory
+import ruc_client
+import structured_logging
+from errors import ApiError
 from utils import parse_date_str, format_date_to_ddmmyyyy, _sanitize_filename
 
+logger = structured_logging.get_logger(__name__)
+sampled_logger = structured_logging.get_sampled_logger(__name__)
+
 # --- Constantes ---
-RUC_API_URL = "https://api.apis.net.pe/v2/ruc/?numero={}"
+# Configurable para apuntar a un servidor simulado en pruebas de carga.
+RUC_API_URL = os.environ.get("RUC_API_URL", "https://api.apis.net.pe/v2/ruc/?numero={}")
 COLOR_PALETTE = {
     "viniball": "C00000",
     "vinifan": "0070C0",
@@ -23,43 +39,107 @@ COLOR_PALETTE = {
 }
 DEFAULT_COLOR = "808080"
 
-class ApiError(Exception):
-    """Custom exception for API errors."""
-    def __init__(self, message, status_code=400):
-        super().__init__(message)
-        self.message = message
-        self.status_code = status_code
-
-    def to_dict(self):
-        """Converts the ApiError object to a dictionary."""
-        return {'message': self.message}
-
 # --- Holiday Service ---
 def get_holidays_for_year(year: int) -> List[Dict[str, str]]:
     """Service to get all holidays for a given year."""
     try:
         return firestore_manager.get_all_holidays_for_year(year)
+    except ApiError:
+        raise
     except Exception as e:
-        print(f"Error in holiday service: {e}")
+        logger.exception("Error in holiday service: %s", e)
         raise ApiError("Failed to retrieve holiday data.", 500) from e
 
 # --- RUC Service ---
-def get_ruc_data(ruc_number: str) -> Dict[str, Any]:
-    """Service to consult RUC, using cache first."""
-    cached_data = firestore_manager.get_ruc_from_cache(ruc_number)
-    if cached_data:
-        print(f"Returning RUC {ruc_number} from cache.")
-        return cached_data
+RUC_SWEEP_PAGE_SIZE = 200
+RUC_HTTP_POOL_SIZE = 10
+
+RUC_LOOKUPS = metrics.counter(
+    'ruc_lookups_total',
+    'Consultas de RUC por resultado: vigente en caché (fresh), vencida servida (stale), '
+    'consulta a la API (miss) o caché de respaldo tras un fallo de la API (stale_fallback).',
+    ('result',))
+RUC_API_REQUESTS = metrics.counter(
+    'ruc_api_requests_total', 'Llamadas a la API externa de RUC por código HTTP (error, circuit_open).',
+    ('status',))
+RUC_API_SECONDS = metrics.histogram('ruc_api_request_seconds', 'Duración de las llamadas a la API de RUC.')
+
+# Sesión HTTP compartida: reutiliza conexiones (keep-alive) hacia la API de RUC
+# en lugar de hacer un handshake TCP+TLS nuevo en cada consulta.
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+# Las revalidaciones en segundo plano usan un pool pequeño y se deduplican por RUC
+# para que varias consultas simultáneas de una entrada vencida generen una sola llamada.
+_ruc_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ruc-refresh")
+_ruc_refresh_in_flight = set()
+_ruc_refresh_lock = threading.Lock()
+
+def reset_after_fork() -> None:
+    """Crea de nuevo la sesión HTTP y el pool de revalidaciones en un worker recién creado."""
+    global _http_session, _http_session_lock, _ruc_refresh_executor, _ruc_refresh_in_flight, _ruc_refresh_lock
+    _http_session = None
+    _http_session_lock = threading.Lock()
+    _ruc_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ruc-refresh")
+    _ruc_refresh_in_flight = set()
+    _ruc_refresh_lock = threading.Lock()
 
-    print(f"RUC {ruc_number} not in cache. Calling external API.")
+def _get_http_session() -> requests.Session:
+    """Devuelve la sesión HTTP del módulo, creándola si es necesario."""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=RUC_HTTP_POOL_SIZE
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+def warm_ruc_connection(timeout: float = 5) -> int:
+    """
+    Abre (y deja en el pool) una conexión hacia la API de RUC.
+
+    Returns:
+        El código HTTP recibido; cualquier respuesta sirve para establecer la conexión.
+    """
+    parsed = urlparse(RUC_API_URL)
+    response = _get_http_session().head(f"{parsed.scheme}://{parsed.netloc}/", timeout=timeout)
+    return response.status_code
+
+def _fetch_ruc_from_api(ruc_number: str) -> Dict[str, Any]:
+    """Consulta el RUC en la API externa y guarda el resultado en el caché."""
     try:
         api_token = os.environ.get("SUNAT_API_TOKEN")
         if not api_token:
             raise ApiError("API token not configured on the server.", 500)
-        
+
+        # Con el circuito abierto se falla de inmediato; get_ruc_data sirve el caché si existe.
+        if not ruc_client.breaker.allow_request():
+            RUC_API_REQUESTS.inc(status='circuit_open')
+            retry_after = max(1, math.ceil(ruc_client.breaker.retry_after()))
+            raise ApiError("RUC consultation service temporarily unavailable.", 503,
+                           headers={'Retry-After': str(retry_after)})
+
         url = RUC_API_URL.format(ruc_number)
         headers = {"Authorization": f"Bearer {api_token}"}
-        response = requests.get(url, headers=headers, timeout=10)
+        response = None
+        started = time.perf_counter()
+        try:
+            response = ruc_client.hedged_get(_get_http_session(), url, headers=headers)
+        finally:
+            RUC_API_SECONDS.observe(time.perf_counter() - started)
+            RUC_API_REQUESTS.inc(status=response.status_code if response is not None else 'error')
+            if response is not None and response.status_code < 500:
+                ruc_client.breaker.record_success()
+            else:
+                ruc_client.breaker.record_failure()
+        # La API responde 404 para un RUC inexistente: no es un fallo de conexión.
+        if response.status_code == 404:
+            raise ApiError("RUC not found.", 404)
         response.raise_for_status()
         api_data = response.json()
 
@@ -71,18 +151,148 @@ def get_ruc_data(ruc_number: str) -> Dict[str, Any]:
                 'condicion': api_data.get('condicion'),
                 'timestamp': firestore.SERVER_TIMESTAMP
             }
-            db = firestore_manager.get_db()
-            db.collection(firestore_manager.RUC_CACHE_COLLECTION).document(ruc_number).set(data_to_cache)
-            return data_to_cache
+            firestore_manager.save_ruc_to_cache(ruc_number, data_to_cache)
+            # SERVER_TIMESTAMP es un centinela de Firestore y no es serializable;
+            # al cliente se le devuelve la hora local equivalente.
+            return {**data_to_cache, 'timestamp': datetime.now(timezone.utc)}
         else:
             raise ApiError("RUC not found.", 404)
+    except ApiError:
+        raise
     except requests.exceptions.RequestException as e:
-        print(f"Connection error with RUC API: {e}")
+        logger.warning("Connection error with RUC API: %s", e, extra={'ruc': ruc_number})
         raise ApiError("Could not connect to the RUC consultation service.", 503) from e
     except Exception as e:
-        print(f"Unexpected error in get_ruc_data: {e}")
+        logger.exception("Unexpected error in get_ruc_data: %s", e, extra={'ruc': ruc_number})
         raise ApiError("An internal error occurred while consulting the RUC.", 500) from e
 
+def _forget_ruc(ruc_number: str) -> None:
+    """Elimina del caché un RUC que la API ya no reconoce, para no seguir sirviéndolo vencido."""
+    logger.info("RUC %s no longer exists upstream; removing it from cache.", ruc_number, extra={'ruc': ruc_number})
+    firestore_manager.delete_ruc_cache_entries([ruc_number])
+
+def _refresh_ruc_in_background(ruc_number: str) -> bool:
+    """
+    Programa la revalidación de un RUC vencido sin bloquear la petición actual.
+
+    Returns:
+        True si se programó una revalidación nueva, False si ya había una en curso.
+    """
+    with _ruc_refresh_lock:
+        if ruc_number in _ruc_refresh_in_flight:
+            return False
+        _ruc_refresh_in_flight.add(ruc_number)
+
+    def _refresh():
+        try:
+            _fetch_ruc_from_api(ruc_number)
+        except ApiError as e:
+            if e.status_code == 404:
+                _forget_ruc(ruc_number)
+            else:
+                logger.warning("Background refresh of RUC %s failed: %s", ruc_number, e.message,
+                               extra={'ruc': ruc_number})
+        except Exception as e:
+            # El cliente ya recibió la entrada vencida; el error solo se registra.
+            logger.warning("Background refresh of RUC %s failed: %s", ruc_number, e, extra={'ruc': ruc_number})
+        finally:
+            with _ruc_refresh_lock:
+                _ruc_refresh_in_flight.discard(ruc_number)
+
+    _ruc_refresh_executor.submit(_refresh)
+    return True
+
+def get_ruc_data(ruc_number: str) -> Dict[str, Any]:
+    """
+    Service to consult RUC, using cache first.
+
+    - Entrada vigente: se devuelve directamente.
+    - Entrada vencida (hasta RUC_CACHE_MAX_STALE_DAYS): se devuelve de inmediato
+      y se revalida en segundo plano (stale-while-revalidate).
+    - Entrada demasiado antigua o inexistente: se consulta la API; si la API
+      falla y existe una entrada antigua, se devuelve como respaldo.
+    """
+    cached_data = firestore_manager.get_ruc_from_cache(ruc_number)
+    if cached_data:
+        if firestore_manager.is_ruc_cache_fresh(cached_data):
+            # Mensaje de alto volumen: en DEBUG y sujeto a muestreo (LOG_SAMPLE_RATES).
+            sampled_logger.debug("Returning RUC %s from cache.", ruc_number, extra={'ruc': ruc_number, 'cache': 'hit'})
+            RUC_LOOKUPS.inc(result='fresh')
+            return cached_data
+        if firestore_manager.is_ruc_cache_servable(cached_data):
+            logger.info("Returning stale RUC %s from cache and revalidating.", ruc_number,
+                        extra={'ruc': ruc_number, 'cache': 'stale'})
+            RUC_LOOKUPS.inc(result='stale')
+            _refresh_ruc_in_background(ruc_number)
+            return cached_data
+
+    logger.info("RUC %s not in cache. Calling external API.", ruc_number, extra={'ruc': ruc_number, 'cache': 'miss'})
+    RUC_LOOKUPS.inc(result='miss')
+    try:
+        return _fetch_ruc_from_api(ruc_number)
+    except ApiError as e:
+        if cached_data and e.status_code == 404:
+            _forget_ruc(ruc_number)
+        if cached_data and e.status_code >= 500:
+            logger.warning("RUC API unavailable, returning stale RUC %s: %s", ruc_number, e.message,
+                           extra={'ruc': ruc_number, 'cache': 'stale_fallback'})
+            RUC_LOOKUPS.inc(result='stale_fallback')
+            return cached_data
+        raise
+
+def sweep_expired_ruc_cache(page_size: int = RUC_SWEEP_PAGE_SIZE, refresh: bool = False,
+                            max_pages: Optional[int] = None) -> Dict[str, int]:
+    """
+    Recorre por páginas las entradas vencidas del caché de RUC.
+
+    En modo borrado solo se eliminan las entradas con más de
+    RUC_CACHE_RETENTION_DAYS días, para no perder las que get_ruc_data aún sirve
+    (stale-while-revalidate o respaldo con la API caída). En modo refresh se
+    revalidan todas las que superan RUC_CACHE_DAYS.
+
+    Args:
+        page_size: Documentos por página (y por batch de borrado).
+        refresh: Si es True, revalida cada entrada contra la API en lugar de borrarla.
+                 Las que la API ya no reconoce (404) se eliminan.
+        max_pages: Límite opcional de páginas a procesar en una ejecución.
+
+    Returns:
+        Contadores de documentos procesados, borrados, refrescados y fallidos.
+    """
+    stats = {'scanned': 0, 'deleted': 0, 'refreshed': 0, 'failed': 0}
+    older_than_days = firestore_manager.RUC_CACHE_DAYS if refresh else firestore_manager.RUC_CACHE_RETENTION_DAYS
+    last_doc = None
+    pages = 0
+    while max_pages is None or pages < max_pages:
+        docs = firestore_manager.get_expired_ruc_cache_page(page_size, start_after=last_doc,
+                                                            older_than_days=older_than_days)
+        if not docs:
+            break
+        pages += 1
+        stats['scanned'] += len(docs)
+        last_doc = docs[-1]
+
+        to_delete = []
+        for doc in docs:
+            if not refresh:
+                to_delete.append(doc.id)
+                continue
+            try:
+                _fetch_ruc_from_api(doc.id)
+                stats['refreshed'] += 1
+            except ApiError as e:
+                if e.status_code == 404:
+                    to_delete.append(doc.id)
+                else:
+                    stats['failed'] += 1
+        firestore_manager.delete_ruc_cache_entries(to_delete)
+        stats['deleted'] += len(to_delete)
+
+        if len(docs) < page_size:
+            break
+    logger.info("RUC cache sweep finished", extra={'sweep': stats})
+    return stats
+
 # --- Calculation Service ---
 def perform_calculation(monto_total: float, fechas_str: List[str]) -> Dict[str, Any]:
     """Pure logic to calculate the distribution of amounts."""
@@ -134,24 +344,62 @@ def _generate_report_filename(data: Dict[str, Any], use_restored_date: bool) ->
 
 # --- Report Generation Service ---
 def generate_excel_service(data: Dict[str, Any]) -> Tuple[BytesIO, str]:
-    """Service to generate the Excel report."""
+    """
+    Service to generate the Excel report.
+
+    Según la memoria estimada se genera el reporte completo o el compacto en
+    modo streaming; si ninguno cabe en el presupuesto se rechaza con 413.
+    """
     linea = data.get("linea", "otros").lower()
     color_hex = COLOR_PALETTE.get(linea, DEFAULT_COLOR)
 
-    wb = Workbook()
-    excel_generator.create_full_report_sheet(wb, data, color_hex)
-    excel_generator.create_payment_detail_sheet(wb, data, color_hex)
+    mode, estimate = report_memory.choose_report_mode(data)
+    if mode is None:
+        raise ApiError(
+            "El reporte es demasiado grande para generarse. Reduzca el número de fechas.", 413
+        )
 
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
+    streaming = mode == report_memory.MODE_STREAMING
+    num_fechas = len(data.get('fechasOrdenadas') or data.get('montosAsignados') or [])
+    if excel_pool.is_enabled():
+        # La generación ocurre en otro proceso; el hilo de la petición no retiene el GIL.
+        try:
+            with report_memory.track_peak_memory(trace=False) as usage:
+                excel_bytes, worker_max_rss = excel_pool.render_workbook_bytes(data, color_hex, streaming)
+        except excel_pool.RenderTimeout as e:
+            raise ApiError("La generación del reporte tardó demasiado y fue cancelada.", 504) from e
+        except excel_pool.RenderPoolUnavailable as e:
+            raise ApiError("El servicio de reportes no está disponible. Intente nuevamente.", 503) from e
+        excel_file = BytesIO(excel_bytes)
+        # El worker del pool registra sus métricas en su propio proceso: aquí se
+        # observa el tiempo completo, incluida la transferencia de los bytes.
+        excel_generator.EXCEL_RENDER_SECONDS.observe(usage.elapsed, report='plan', mode=mode)
+        logger.info("Excel report generated in process pool", extra={
+            'fechas': num_fechas, 'mode': mode, 'estimatedBytes': estimate,
+            'workerMaxRssBytes': worker_max_rss, 'seconds': round(usage.elapsed, 3),
+        })
+    else:
+        with report_memory.track_peak_memory() as usage:
+            excel_file = excel_generator.render_workbook(data, color_hex, streaming=streaming)
+        logger.info("Excel report generated", extra={
+            'fechas': num_fechas, 'mode': mode, 'estimatedBytes': estimate,
+            'tracedPeakBytes': usage.traced_peak, 'rssBeforeBytes': usage.rss_before,
+            'rssDeltaBytes': usage.rss_delta, 'processMaxRssBytes': usage.process_max_rss,
+            'seconds': round(usage.elapsed, 3),
+        })
 
     base_name = _generate_report_filename(data, use_restored_date=True)
     filename = f"reporte_{base_name}.xlsx"
     return excel_file, filename
 
-def generate_json_service(data: Dict[str, Any]) -> Tuple[bytes, str]:
-    """Service to generate the JSON backup report."""
+def generate_json_service(data: Dict[str, Any], minify: bool = False) -> Tuple[bytes, str]:
+    """
+    Service to generate the JSON backup report.
+
+    Args:
+        data: Datos del reporte.
+        minify: Si es True, el JSON se genera sin indentación ni espacios.
+    """
     # Esta lógica se mueve desde main.py para asegurar un formato de respaldo consistente.
     json_data_to_save = {
         "montoOriginal": data.get('montoOriginal'),
@@ -165,9 +413,154 @@ def generate_json_service(data: Dict[str, Any]) -> Tuple[bytes, str]:
         "codigoCliente": data.get('codigoCliente', '')
     }
 
-    json_content = json.dumps(json_data_to_save, indent=4, ensure_ascii=False).encode('utf-8')
+    # Se serializa directamente a bytes UTF-8, sin pasar por un str intermedio.
+    json_content = json_provider.dumps_bytes(json_data_to_save, indent=None if minify else 4)
 
     # Los respaldos JSON siempre usan la fecha actual para el versionado.
     base_name = _generate_report_filename(data, use_restored_date=False)
     filename = f"respaldo_{base_name}.json"
-    return json_content, filename
\ No newline at end of file
+    return json_content, filename
+
+# --- Plan Service ---
+DUE_DATES_DEFAULT_PAGE_SIZE = 50
+DUE_DATES_MAX_PAGE_SIZE = 200
+
+def build_plan_id(ruc: str, linea: str, pedido: str) -> str:
+    """Id estable del plan: guardar dos veces el mismo pedido lo actualiza en lugar de duplicarlo."""
+    return f"{_sanitize_filename(ruc)}_{linea}_{_sanitize_filename(pedido)}"
+
+def save_plan_service(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida y guarda un plan con una cuota por fecha de `montosAsignados`.
+
+    Returns:
+        El id del plan y el número de cuotas guardadas.
+    """
+    ruc = str(data.get('ruc') or '').strip()
+    linea = str(data.get('linea') or '').lower()
+    pedido = str(data.get('pedido') or '').strip()
+    montos_asignados = data.get('montosAsignados')
+    if not ruc or not pedido or not _sanitize_filename(pedido):
+        raise ApiError("Los campos 'ruc' y 'pedido' son requeridos.", 400)
+    if linea not in COLOR_PALETTE:
+        raise ApiError(f"Línea inválida. Valores permitidos: {', '.join(COLOR_PALETTE)}.", 400)
+    if not isinstance(montos_asignados, dict) or not montos_asignados:
+        raise ApiError("El plan debe incluir 'montosAsignados'.", 400)
+
+    try:
+        installments = {parse_date_str(fecha): float(monto) for fecha, monto in montos_asignados.items()}
+    except (TypeError, ValueError) as e:
+        raise ApiError("Fechas o montos inválidos en 'montosAsignados'.", 400) from e
+    feriados = sorted(fecha for fecha in installments if firestore_manager.is_holiday(fecha))
+    if feriados:
+        raise ApiError(f"Las cuotas no pueden caer en feriado: {', '.join(map(format_date_to_ddmmyyyy, feriados))}.", 400)
+
+    if len(plan_store.monthly_totals(installments)) > plan_store.MAX_PLAN_MONTHS:
+        raise ApiError(f"El plan no puede abarcar más de {plan_store.MAX_PLAN_MONTHS} meses.", 400)
+
+    plan_id = build_plan_id(ruc, linea, pedido)
+    header = {
+        'ruc': ruc,
+        'razonSocial': data.get('razonSocial', ''),
+        'linea': linea,
+        'pedido': pedido,
+        'codigoCliente': data.get('codigoCliente', ''),
+        'montoOriginal': data.get('montoOriginal'),
+    }
+    plan_store.save_plan(plan_id, header, installments)
+    logger.info("Plan saved", extra={'planId': plan_id, 'cuotas': len(installments)})
+    return {'id': plan_id, 'numCuotas': len(installments)}
+
+def delete_plan_service(plan_id: str) -> None:
+    """Elimina el plan y sus cuotas; 404 si no existe."""
+    if not plan_store.delete_plan(plan_id):
+        raise ApiError("Plan no encontrado.", 404)
+
+def get_due_dates_service(date_from_str: Optional[str], date_to_str: Optional[str],
+                          ruc: Optional[str] = None, linea: Optional[str] = None,
+                          limit_str: Optional[str] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Lista las cuotas que vencen en un rango de fechas, opcionalmente por cliente (RUC) o línea.
+
+    Returns:
+        {'items': [...], 'nextCursor': str | None}
+    """
+    try:
+        date_from = parse_date_str(date_from_str)
+        date_to = parse_date_str(date_to_str)
+    except (TypeError, ValueError) as e:
+        raise ApiError("Los parámetros 'desde' y 'hasta' son requeridos con formato DD/MM/AAAA.", 400) from e
+    if date_to < date_from:
+        raise ApiError("'hasta' debe ser posterior a 'desde'.", 400)
+    if linea and linea not in COLOR_PALETTE:
+        raise ApiError(f"Línea inválida. Valores permitidos: {', '.join(COLOR_PALETTE)}.", 400)
+
+    limit = DUE_DATES_DEFAULT_PAGE_SIZE
+    if limit_str:
+        if not limit_str.isdigit() or int(limit_str) == 0:
+            raise ApiError("'limit' debe ser un número positivo.", 400)
+        limit = min(int(limit_str), DUE_DATES_MAX_PAGE_SIZE)
+
+    try:
+        installments, next_cursor = plan_store.query_due_installments(
+            date_from, date_to, ruc=ruc or None, linea=linea or None, limit=limit, cursor=cursor or None
+        )
+    except ValueError as e:
+        raise ApiError("Cursor inválido.", 400) from e
+
+    items = [{
+        'planId': item['planId'],
+        'ruc': item.get('ruc'),
+        'razonSocial': item.get('razonSocial'),
+        'linea': item.get('linea'),
+        'pedido': item.get('pedido'),
+        'fecha': format_date_to_ddmmyyyy(item['dueDate']),
+        'monto': item['monto'],
+    } for item in installments]
+    return {'items': items, 'nextCursor': next_cursor}
+
+# --- Portfolio Service ---
+def _parse_month(month_str: Optional[str], name: str) -> Optional[str]:
+    if not month_str:
+        return None
+    try:
+        return datetime.strptime(month_str, "%Y-%m").strftime("%Y-%m")
+    except ValueError as e:
+        raise ApiError(f"'{name}' debe tener el formato AAAA-MM.", 400) from e
+
+def get_portfolio_summary_service(month_from_str: Optional[str] = None,
+                                  month_to_str: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Exposición total de la cartera por mes y línea, leída de los contadores pre-agregados.
+
+    Returns:
+        {'lineas': [...], 'meses': [{'mes', 'montos': {linea: monto}, 'total'}],
+         'totalesPorLinea': {linea: monto}, 'total': monto}
+    """
+    rollups = plan_store.get_portfolio_rollups(
+        _parse_month(month_from_str, 'desde'), _parse_month(month_to_str, 'hasta')
+    )
+    lineas = list(COLOR_PALETTE)
+    lineas += sorted({linea for montos in rollups.values() for linea in montos} - set(lineas))
+
+    totales_por_linea = {linea: 0 for linea in lineas}
+    meses = []
+    for month, centavos_por_linea in rollups.items():
+        for linea, centavos in centavos_por_linea.items():
+            totales_por_linea[linea] += centavos
+        meses.append({
+            'mes': month,
+            'montos': {linea: centavos / 100 for linea, centavos in centavos_por_linea.items()},
+            'total': sum(centavos_por_linea.values()) / 100,
+        })
+    return {
+        'lineas': lineas,
+        'meses': meses,
+        'totalesPorLinea': {linea: centavos / 100 for linea, centavos in totales_por_linea.items()},
+        'total': sum(totales_por_linea.values()) / 100,
+    }
+
+def generate_portfolio_excel_service(summary: Dict[str, Any]) -> Tuple[BytesIO, str]:
+    """Exporta el resumen de cartera con los estilos de los reportes Excel."""
+    excel_file = excel_generator.render_portfolio_workbook(summary, COLOR_PALETTE, DEFAULT_COLOR)
+    return excel_file, f"cartera_{datetime.now().strftime('%m_%y')}.xlsx"
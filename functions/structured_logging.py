@@ -0,0 +1,224 @@
+"""
+Non-blocking structured logging.
+
+Los registros se encolan desde el hilo de la petición (QueueHandler) y un hilo
+de fondo (QueueListener) los serializa como JSON de una línea y los escribe en
+stdout, donde Cloud Logging los interpreta (campo `severity`).
+
+- Correlación: cada registro lleva el `requestId` de la petición en curso.
+- Muestreo por nivel (LOG_SAMPLE_RATES, ej. "DEBUG=0.01"): los mensajes de alto
+  volumen, como los aciertos de caché, se registran en DEBUG con un logger de
+  get_sampled_logger() y se muestrean. Ese logger acepta los niveles muestreados
+  aunque LOG_LEVEL sea INFO; el muestreo no afecta a los demás loggers (ej. el
+  DEBUG de urllib3 con LOG_LEVEL=DEBUG).
+- Si la cola se llena, los registros se descartan en lugar de bloquear y se
+  cuentan en la métrica log_records_dropped_total.
+
+La configuración se instala explícitamente desde el punto de entrada con
+configure_logging(); importar este módulo no toca el logger raíz.
+"""
+import atexit
+import contextvars
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import json_provider
+import metrics
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+DEFAULT_SAMPLE_RATES = "DEBUG=0.05"
+# Raíz de los loggers muestreados (ver get_sampled_logger).
+SAMPLED_LOGGER = 'sampled'
+
+LOG_RECORDS_DROPPED = metrics.counter(
+    'log_records_dropped_total', 'Registros de log descartados porque la cola estaba llena.')
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('request_id', default=None)
+
+# Atributos estándar de LogRecord; el resto se considera un campo estructurado (extra=...).
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'request_id'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+def parse_sample_rates(value: str) -> Dict[int, float]:
+    """Convierte 'DEBUG=0.01,INFO=0.5' en {logging.DEBUG: 0.01, logging.INFO: 0.5}."""
+    rates = {}
+    for part in filter(None, (item.strip() for item in value.split(','))):
+        level_name, _, rate = part.partition('=')
+        level = logging.getLevelName(level_name.strip().upper())
+        if isinstance(level, int):
+            rates[level] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+def set_request_id(request_id: Optional[str]) -> contextvars.Token:
+    """Asocia un request id al contexto actual; devuelve el token para restaurarlo."""
+    return request_id_var.set(request_id)
+
+def reset_request_id(token: contextvars.Token) -> None:
+    request_id_var.reset(token)
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los registros de los loggers muestreados en los niveles configurados."""
+
+    def __init__(self, rates: Dict[int, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.name != SAMPLED_LOGGER and not record.name.startswith(SAMPLED_LOGGER + '.'):
+            return True
+        rate = self.rates.get(record.levelno)
+        if rate is None or rate >= 1.0:
+            return True
+        if random.random() < rate:
+            record.sample_rate = rate
+            return True
+        return False
+
+class JsonFormatter(logging.Formatter):
+    """Formatea cada registro como un objeto JSON de una línea."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'severity': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['requestId'] = request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json_provider.dumps_bytes(entry).decode('utf-8')
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que prepara el registro con el mínimo trabajo en el hilo llamador.
+
+    Se resuelve el mensaje (sus argumentos podrían cambiar después) y el request id,
+    y se formatea la excepción mientras el traceback sigue vivo; la serialización
+    JSON y la escritura quedan para el hilo de fondo.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = request_id_var.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+class _StdoutHandler(logging.StreamHandler):
+    """StreamHandler que resuelve sys.stdout al escribir (sobrevive a redirecciones, ej. pytest)."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+def configure_logging(level: str = None, sample_rates: str = None) -> logging.Logger:
+    """
+    Instala el QueueHandler en el logger raíz y arranca el hilo de escritura.
+
+    Es idempotente; las llamadas posteriores no hacen nada.
+    """
+    global _listener
+    with _configure_lock:
+        root = logging.getLogger()
+        if _listener is not None:
+            return root
+
+        rates = parse_sample_rates(
+            sample_rates if sample_rates is not None
+            else os.environ.get("LOG_SAMPLE_RATES", DEFAULT_SAMPLE_RATES)
+        )
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(rates))
+
+        output_handler = _StdoutHandler()
+        output_handler.setFormatter(JsonFormatter())
+
+        root.addHandler(queue_handler)
+        root.setLevel(level or LOG_LEVEL)
+        # Los loggers muestreados emiten sus niveles configurados sin depender de LOG_LEVEL.
+        logging.getLogger(SAMPLED_LOGGER).setLevel(min([root.level, *rates]))
+        _listener = logging.handlers.QueueListener(log_queue, output_handler, respect_handler_level=False)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return root
+
+def reset_after_fork() -> None:
+    """
+    Reinstala la cola y el hilo de escritura en un proceso hijo tras un fork.
+
+    El hilo del padre no existe en el hijo y la cola pudo quedar bloqueada a medio
+    uso, así que se descartan sin detenerlos y se configuran de nuevo.
+    """
+    global _listener, _configure_lock
+    _configure_lock = threading.Lock()
+    _listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    configure_logging()
+
+def shutdown_logging() -> None:
+    """Detiene el hilo de escritura vaciando antes la cola."""
+    global _listener
+    with _configure_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+def get_sampled_logger(name: str) -> logging.Logger:
+    """
+    Logger para mensajes de alto volumen: sus registros en los niveles de
+    LOG_SAMPLE_RATES se emiten aunque LOG_LEVEL sea más alto, y se muestrean.
+    """
+    return logging.getLogger(f"{SAMPLED_LOGGER}.{name}")
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Devuelve un logger. No configura nada: importar un módulo no modifica el
+    logger raíz; el punto de entrada (main.py, wsgi.py o un script) llama a
+    configure_logging() al arrancar.
+    """
+    return logging.getLogger(name)
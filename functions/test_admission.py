@@ -0,0 +1,82 @@
+"""Tests for cost-aware admission control."""
+import threading
+import time
+
+import pytest
+
+import admission
+from main import app
+from services import ApiError
+
+
+def test_estimate_cost_grows_with_dates_and_endpoint():
+    """Prueba que un Excel grande cueste más que un cálculo con las mismas fechas."""
+    fechas = [f"{day:02d}/01/2025" for day in range(1, 29)] * 40
+    small = admission.estimate_cost('generate-excel', {'fechasOrdenadas': fechas[:10]})
+    large = admission.estimate_cost('generate-excel', {'fechasOrdenadas': fechas})
+    calculation = admission.estimate_cost('calculate', {'fechasValidas': fechas})
+
+    assert small < large
+    assert calculation < large
+    assert admission.estimate_cost('generate-excel', {'fechasOrdenadas': fechas * 1000}) == \
+        admission.get_limiter().capacity
+
+
+def test_full_queue_is_rejected_with_429():
+    """Prueba que sin lugar en la cola se rechace de inmediato con Retry-After."""
+    limiter = admission.CostLimiter(capacity=10, max_queue=0, queue_timeout=1)
+    limiter.acquire(10)
+
+    with pytest.raises(ApiError) as exc_info:
+        limiter.acquire(1)
+
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.headers['Retry-After'] == str(admission.ADMISSION_RETRY_AFTER_SECONDS)
+
+
+def test_queue_timeout_is_rejected_with_503():
+    """Prueba que una espera mayor al máximo termine en 503."""
+    limiter = admission.CostLimiter(capacity=10, max_queue=1, queue_timeout=0.05)
+    limiter.acquire(8)
+
+    with pytest.raises(ApiError) as exc_info:
+        limiter.acquire(5)
+
+    assert exc_info.value.status_code == 503
+    assert limiter.queued == 0
+
+
+def test_queued_request_is_admitted_when_capacity_frees_up():
+    """Prueba que una petición en cola se admita al liberarse capacidad."""
+    limiter = admission.CostLimiter(capacity=10, max_queue=1, queue_timeout=2)
+    limiter.acquire(8)
+    admitted = threading.Event()
+
+    def _waiter():
+        limiter.acquire(5)
+        admitted.set()
+
+    thread = threading.Thread(target=_waiter)
+    thread.start()
+    time.sleep(0.05)
+    assert not admitted.is_set()
+
+    limiter.release(8)
+    thread.join(timeout=1)
+
+    assert admitted.is_set()
+    assert limiter.in_use == 5
+
+
+def test_endpoint_returns_429_with_retry_after(monkeypatch):
+    """Prueba que el endpoint responda 429 con Retry-After cuando la instancia está saturada."""
+    limiter = admission.CostLimiter(capacity=1, max_queue=0, queue_timeout=0.1)
+    limiter.acquire(1)
+    monkeypatch.setattr(admission, '_limiter', limiter)
+
+    response = app.test_client().post('/api/calculate', json={
+        'montoTotal': 100, 'fechasValidas': ['01/01/2025'],
+    })
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(admission.ADMISSION_RETRY_AFTER_SECONDS)
@@ -0,0 +1,76 @@
+"""Tests for the Excel rendering process pool."""
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+from openpyxl import load_workbook
+
+import excel_pool
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Arranca un pool de un worker y lo detiene al terminar."""
+    monkeypatch.setattr(excel_pool, 'EXCEL_PROCESS_POOL_WORKERS', 1)
+    excel_pool.start_pool()
+    yield excel_pool
+    excel_pool.shutdown_pool(kill=True)
+
+
+def _slow_render(*args):
+    import time
+    time.sleep(5)
+
+
+def test_render_in_pool_returns_workbook_bytes(pool):
+    """Prueba que el pool devuelva un libro válido generado en otro proceso."""
+    data = {
+        'montoOriginal': 300.0,
+        'fechasOrdenadas': ['01/02/2025', '01/03/2025'],
+        'montosAsignados': {'01/02/2025': 150.0, '01/03/2025': 150.0},
+        'resumenMensual': {'2025-02': 150.0, '2025-03': 150.0},
+    }
+    excel_bytes, worker_max_rss = pool.render_workbook_bytes(data, "C00000")
+
+    workbook = load_workbook(BytesIO(excel_bytes))
+    assert workbook.sheetnames == ["Reporte Dashboard", "Detalle de Pagos"]
+    assert worker_max_rss > 0
+
+
+def test_render_timeout_cancels_and_restarts_pool(pool):
+    """Prueba que un trabajo que excede el tiempo se cancele y el pool se reinicie."""
+    original_pool = pool.start_pool()
+    with patch('excel_pool._render_in_worker', _slow_render):
+        with pytest.raises(excel_pool.RenderTimeout):
+            pool.render_workbook_bytes({}, "C00000", timeout=0.5)
+
+    assert pool.start_pool() is not original_pool
+
+
+def _sleeping_render(data, color_hex, streaming):
+    import time
+    time.sleep(data['sleep'])
+    return b'ok', 1
+
+
+def test_render_timeout_lets_other_in_flight_renders_finish(pool, monkeypatch):
+    """Prueba que un trabajo atascado no haga fallar a los demás trabajos del mismo pool."""
+    import threading
+
+    monkeypatch.setattr(excel_pool, 'EXCEL_PROCESS_POOL_WORKERS', 2)
+    excel_pool.shutdown_pool(kill=True)
+    original_pool = pool.start_pool()
+    results = {}
+
+    def _render_other():
+        results['other'] = pool.render_workbook_bytes({'sleep': 2}, "C00000", timeout=10)
+
+    with patch('excel_pool._render_in_worker', _sleeping_render):
+        other = threading.Thread(target=_render_other)
+        other.start()
+        with pytest.raises(excel_pool.RenderTimeout):
+            pool.render_workbook_bytes({'sleep': 10}, "C00000", timeout=0.5)
+        other.join()
+
+    assert results['other'] == (b'ok', 1)
+    assert pool.start_pool() is not original_pool
@@ -0,0 +1,86 @@
+"""Tests for the bounded holiday cache."""
+import threading
+from datetime import date, datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+import firestore_manager
+from loadtest.fake_firestore import FakeFirestore
+from loadtest.harness import FIXED_HOLIDAYS
+from main import app
+
+
+@pytest.fixture
+def db_client(monkeypatch):
+    """Firestore en memoria con los feriados fijos y un caché vacío (sin snapshot local)."""
+    client = FakeFirestore()
+    client.seed(firestore_manager.HOLIDAYS_COLLECTION, FIXED_HOLIDAYS)
+    monkeypatch.setattr(firestore_manager, 'DB_CLIENT', client)
+    monkeypatch.setattr(firestore_manager, 'holiday_cache', firestore_manager.HolidayCache(window=1, max_years=3))
+    monkeypatch.setattr(firestore_manager.local_snapshot, 'load_fixed_holidays', lambda: None)
+    monkeypatch.setattr(firestore_manager.local_snapshot, 'save_fixed_holidays', lambda fixed: None)
+    return client
+
+
+def test_first_load_precomputes_window(db_client):
+    """Prueba que la primera carga precalcule el año actual ± la ventana."""
+    current_year = datetime.now(timezone.utc).year
+
+    firestore_manager.get_all_holidays_for_year(current_year)
+
+    assert firestore_manager.holiday_cache.years() == [current_year - 1, current_year, current_year + 1]
+
+
+def test_years_outside_window_are_evicted_lru(db_client):
+    """Prueba que los años fuera de la ventana no superen el máximo configurado."""
+    for year in range(2000, 2010):
+        firestore_manager.get_all_holidays_for_year(year)
+
+    cache = firestore_manager.holiday_cache
+    assert all(cache.contains(year) for year in (2007, 2008, 2009))
+    assert not cache.contains(2000)
+    assert len(cache.years()) == 3 + 3
+
+
+def test_concurrent_cold_requests_read_firestore_once(db_client):
+    """Prueba que varias peticiones en frío simultáneas lean los feriados fijos una sola vez."""
+    loads = []
+    barrier = threading.Barrier(8)
+    original = firestore_manager._get_fixed_holidays_from_db
+
+    def counted_load():
+        loads.append(1)
+        return original()
+
+    def request_year(year):
+        barrier.wait()
+        firestore_manager.get_all_holidays_for_year(year)
+
+    with patch('firestore_manager._get_fixed_holidays_from_db', side_effect=counted_load):
+        threads = [threading.Thread(target=request_year, args=(2020 + index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(loads) == 1
+
+
+def test_ordinals_match_holiday_list(db_client):
+    """Prueba que los ordinales coincidan con la lista que devuelve la API."""
+    holidays = firestore_manager.get_all_holidays_for_year(2025)
+    ordinals = firestore_manager.get_holiday_ordinals(2025)
+
+    assert len(ordinals) == len(holidays)
+    assert firestore_manager.is_holiday(date(2025, 1, 1))
+    assert firestore_manager.is_holiday(date(2025, 4, 18))  # Viernes Santo
+    assert not firestore_manager.is_holiday(date(2025, 1, 2))
+
+
+def test_out_of_range_year_is_rejected(db_client):
+    """Prueba que un año fuera de rango responda 400 sin cachearse."""
+    response = app.test_client().get('/api/getHolidays', query_string={'year': '99999'})
+
+    assert response.status_code == 400
+    assert not firestore_manager.holiday_cache.contains(99999)
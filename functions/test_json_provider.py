@@ -0,0 +1,65 @@
+"""Tests for the fast JSON provider."""
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest.mock import patch
+
+import json_provider
+from main import app
+
+
+PLAN = {
+    "montosAsignados": {"02/01/2025": 50.5, "01/01/2025": 49.5},
+    "vencimiento": date(2025, 1, 2),
+    "timestamp": datetime(2025, 1, 1, 12, 30, tzinfo=timezone.utc),
+    "montoOriginal": Decimal("100.00"),
+    "razonSocial": "Compañía Añil S.A.C.",
+}
+
+
+def test_dumps_bytes_handles_plan_types():
+    """Prueba que fechas y Decimal se serialicen y que se conserve el orden de las claves."""
+    decoded = json.loads(json_provider.dumps_bytes(PLAN))
+
+    assert decoded["vencimiento"] == "2025-01-02"
+    assert decoded["timestamp"] == "2025-01-01T12:30:00+00:00"
+    assert decoded["montoOriginal"] == 100.0
+    assert list(decoded["montosAsignados"]) == ["02/01/2025", "01/01/2025"]
+
+
+def test_stdlib_fallback_matches_fast_encoder():
+    """Prueba que sin orjson la salida sea idéntica byte a byte."""
+    fast = json_provider.dumps_bytes(PLAN)
+    with patch('json_provider.orjson', None):
+        fallback = json_provider.dumps_bytes(PLAN)
+    assert fast == fallback
+    assert "Compañía".encode('utf-8') in fallback
+
+
+def test_app_uses_fast_provider():
+    """Prueba que jsonify use el proveedor y genere JSON compacto en bytes."""
+    with app.test_request_context():
+        response = app.json.response(PLAN)
+    assert isinstance(app.json, json_provider.FastJSONProvider)
+    assert response.get_data().startswith(b'{"montosAsignados":{')
+
+
+def test_pretty_output_matches_stdlib_indent_4():
+    """Prueba que el respaldo indentado conserve el formato de json.dumps(indent=4)."""
+    plan = {key: value for key, value in PLAN.items() if key not in ("vencimiento", "timestamp", "montoOriginal")}
+    plan["fechas"] = [["01/01/2025", {"monto": 49.5}], []]
+
+    expected = json.dumps(plan, indent=4, ensure_ascii=False).encode('utf-8')
+    assert json_provider.dumps_bytes(plan, indent=4) == expected
+    with patch('json_provider.orjson', None):
+        assert json_provider.dumps_bytes(plan, indent=4) == expected
+
+
+def test_responses_keep_flask_date_and_decimal_format():
+    """Prueba que las respuestas de la API serialicen fechas y Decimal como el proveedor de Flask."""
+    with app.test_request_context():
+        decoded = json.loads(app.json.response(PLAN).get_data())
+
+    assert decoded["vencimiento"] == "Thu, 02 Jan 2025 00:00:00 GMT"
+    assert decoded["timestamp"] == "Wed, 01 Jan 2025 12:30:00 GMT"
+    assert decoded["montoOriginal"] == "100.00"
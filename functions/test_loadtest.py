@@ -0,0 +1,69 @@
+"""Tests for the load-test fakes and reporting helpers."""
+from datetime import datetime, timedelta, timezone
+
+import requests
+from firebase_admin import firestore
+
+from loadtest.fake_firestore import FakeFirestore
+from loadtest.fake_ruc_server import FakeRucConfig, FakeRucServer
+from loadtest.harness import percentile
+
+
+def test_fake_firestore_query_with_filter_order_and_cursor():
+    """Prueba que el fake respete filtros, orden, límite y cursores como Firestore."""
+    db = FakeFirestore()
+    now = datetime.now(timezone.utc)
+    db.seed('ruc_cache', {
+        str(i): {'ruc': str(i), 'timestamp': now - timedelta(days=i)} for i in range(1, 8)
+    })
+    query = (
+        db.collection('ruc_cache')
+        .where(filter=firestore.FieldFilter('timestamp', '<', now - timedelta(days=3)))
+        .order_by('timestamp')
+        .limit(2)
+    )
+
+    first_page = query.get()
+    second_page = query.start_after(first_page[-1]).get()
+
+    assert [doc.id for doc in first_page] == ['7', '6']
+    assert [doc.id for doc in second_page] == ['5', '4']
+
+
+def test_fake_firestore_batch_resolves_sentinels():
+    """Prueba que los batches apliquen SERVER_TIMESTAMP e Increment."""
+    db = FakeFirestore()
+    ref = db.collection('counters').document('a')
+    ref.set({'total': 1})
+
+    batch = db.batch()
+    batch.set(ref, {'total': firestore.Increment(2), 'updated': firestore.SERVER_TIMESTAMP}, merge=True)
+    batch.commit()
+
+    data = ref.get().to_dict()
+    assert data['total'] == 3
+    assert isinstance(data['updated'], datetime)
+
+
+def test_fake_ruc_server_failures_and_not_found():
+    """Prueba que el servidor RUC simulado devuelva datos, 404 y 503 según su configuración."""
+    config = FakeRucConfig(not_found={'20000000000'})
+    with FakeRucServer(config) as server:
+        ok = requests.get(server.url_template.format('20123456789'), timeout=5)
+        missing = requests.get(server.url_template.format('20000000000'), timeout=5)
+        config.error_rate = 1.0
+        failing = requests.get(server.url_template.format('20123456789'), timeout=5)
+
+    assert ok.status_code == 200
+    assert ok.json()['razonSocial'] == 'EMPRESA 20123456789 S.A.C.'
+    assert missing.status_code == 404
+    assert failing.status_code == 503
+    assert config.requests == 3
+
+
+def test_percentile_nearest_rank():
+    """Prueba el cálculo de percentiles usado en el informe."""
+    samples = [float(i) for i in range(1, 101)]
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 99) == 99.0
+    assert percentile([], 95) == 0.0
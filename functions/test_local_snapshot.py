@@ -0,0 +1,135 @@
+"""Tests for the local on-disk snapshot."""
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+import firestore_manager
+import local_snapshot
+
+FIXED_HOLIDAYS = {"01/01": "Año Nuevo", "25/12": "Navidad"}
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    """Activa el snapshot sobre un archivo temporal y limpia el caché de feriados."""
+    monkeypatch.setattr(local_snapshot, 'LOCAL_SNAPSHOT_ENABLED', True)
+    monkeypatch.setattr(local_snapshot, 'LOCAL_SNAPSHOT_PATH', str(tmp_path / 'snapshot.sqlite3'))
+    monkeypatch.setattr(local_snapshot, 'PACKAGED_SNAPSHOT_PATH', str(tmp_path / 'missing.sqlite3'))
+    monkeypatch.setattr(local_snapshot, 'EXPECTED_HOLIDAYS_VERSION', None)
+    monkeypatch.setattr(local_snapshot, '_disabled_reason', None)
+    monkeypatch.setattr(firestore_manager, 'holiday_cache', firestore_manager.HolidayCache())
+    monkeypatch.setattr(firestore_manager, '_holiday_sync_started', False)
+    return local_snapshot
+
+
+def test_fixed_holidays_round_trip_and_version_check(snapshot, monkeypatch):
+    """Prueba que los feriados se recuperen y que un sello de versión distinto invalide el snapshot."""
+    assert snapshot.load_fixed_holidays() is None
+
+    snapshot.save_fixed_holidays(FIXED_HOLIDAYS)
+    assert snapshot.load_fixed_holidays() == FIXED_HOLIDAYS
+
+    monkeypatch.setattr(local_snapshot, 'EXPECTED_HOLIDAYS_VERSION', 'otra-version')
+    assert snapshot.load_fixed_holidays() is None
+
+
+def test_cold_start_answers_from_snapshot_and_syncs_in_background(snapshot):
+    """
+    Prueba que una instancia nueva responda desde el snapshot sin esperar a
+    Firestore, y que la sincronización posterior aplique los cambios.
+    """
+    snapshot.save_fixed_holidays(FIXED_HOLIDAYS)
+    updated = {**FIXED_HOLIDAYS, "01/05": "Día del Trabajo"}
+    release_db = threading.Event()
+
+    def slow_db_read():
+        release_db.wait(timeout=5)
+        return updated
+
+    with patch('firestore_manager._get_fixed_holidays_from_db', side_effect=slow_db_read):
+        holidays = firestore_manager.get_all_holidays_for_year(2025)
+        assert {'date': '25/12/2025', 'name': 'Navidad'} in holidays
+        assert {'date': '01/05/2025', 'name': 'Día del Trabajo'} not in holidays
+
+        release_db.set()
+        for thread in threading.enumerate():
+            if thread.name == 'holiday-sync':
+                thread.join(timeout=5)
+
+    assert firestore_manager.holiday_cache.fixed_holidays == updated
+    assert {'date': '01/05/2025', 'name': 'Día del Trabajo'} in firestore_manager.get_all_holidays_for_year(2025)
+    assert snapshot.load_fixed_holidays() == updated
+
+
+def test_fresh_local_ruc_skips_firestore(snapshot):
+    """Prueba que una entrada de RUC vigente en el snapshot se sirva sin leer Firestore."""
+    data = {'ruc': '20123456789', 'razonSocial': 'EMPRESA LOCAL S.A.C.',
+            'timestamp': datetime.now(timezone.utc)}
+    snapshot.save_ruc('20123456789', data)
+
+    with patch('firestore_manager.get_db') as mock_get_db:
+        result = firestore_manager.get_ruc_from_cache('20123456789')
+
+    mock_get_db.assert_not_called()
+    assert result['razonSocial'] == 'EMPRESA LOCAL S.A.C.'
+    assert result['timestamp'] == data['timestamp']
+
+
+def test_unchanged_firestore_ruc_is_not_rewritten_locally(snapshot, monkeypatch):
+    """Prueba que una entrada vencida sin cambios en Firestore no se vuelva a escribir en el snapshot."""
+    from loadtest.fake_firestore import FakeFirestore
+
+    expired = datetime.now(timezone.utc) - timedelta(days=firestore_manager.RUC_CACHE_DAYS + 1)
+    db_client = FakeFirestore()
+    db_client.seed(firestore_manager.RUC_CACHE_COLLECTION,
+                   {'20123456789': {'ruc': '20123456789', 'timestamp': expired}})
+    monkeypatch.setattr(firestore_manager, 'DB_CLIENT', db_client)
+
+    with patch('local_snapshot.save_ruc', wraps=snapshot.save_ruc) as save_ruc:
+        firestore_manager.get_ruc_from_cache('20123456789')
+        firestore_manager.get_ruc_from_cache('20123456789')
+
+    save_ruc.assert_called_once()
+
+
+def test_ruc_prune_keeps_hottest_entries(snapshot):
+    """Prueba que el recorte conserve las entradas más consultadas."""
+    timestamp = datetime.now(timezone.utc) - timedelta(hours=1)
+    for ruc_number in ('1', '2', '3'):
+        snapshot.save_ruc(ruc_number, {'ruc': ruc_number, 'timestamp': timestamp})
+    for _ in range(3):
+        snapshot.get_ruc('2')
+    snapshot.get_ruc('3')
+
+    snapshot.prune_ruc_cache(max_entries=2)
+
+    assert snapshot.get_ruc('1') is None
+    assert snapshot.get_ruc('2') is not None
+    assert snapshot.get_ruc('3') is not None
+
+
+def test_ruc_hits_are_counted_in_memory_and_flushed_in_batches(snapshot, monkeypatch):
+    """Prueba que un acierto no escriba en SQLite hasta completar un lote."""
+    monkeypatch.setattr(local_snapshot, '_pending_hits', {})
+    monkeypatch.setattr(local_snapshot, '_RUC_HITS_FLUSH_INTERVAL', 3)
+    snapshot.save_ruc('1', {'ruc': '1', 'timestamp': datetime.now(timezone.utc)})
+
+    def stored_hits():
+        return snapshot._get_connection().execute("SELECT hits FROM ruc_cache WHERE ruc = '1'").fetchone()[0]
+
+    snapshot.get_ruc('1')
+    snapshot.get_ruc('1')
+    assert stored_hits() == 1
+    snapshot.get_ruc('1')
+    assert stored_hits() == 4
+
+
+def test_locked_database_does_not_disable_snapshot(snapshot):
+    """Prueba que un bloqueo transitorio de otro worker no desactive el snapshot."""
+    snapshot._disable(local_snapshot.sqlite3.OperationalError("database is locked"))
+    assert snapshot.is_enabled()
+
+    snapshot._disable(local_snapshot.sqlite3.DatabaseError("file is not a database"))
+    assert not snapshot.is_enabled()
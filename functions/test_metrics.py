@@ -0,0 +1,138 @@
+"""Tests for the metrics registry and the /api/metrics endpoint."""
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+import firestore_manager
+import metrics
+import services
+from loadtest.fake_firestore import FakeFirestore
+from loadtest.harness import FIXED_HOLIDAYS
+from main import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    db_client = FakeFirestore()
+    db_client.seed(firestore_manager.HOLIDAYS_COLLECTION, FIXED_HOLIDAYS)
+    monkeypatch.setattr(firestore_manager, 'DB_CLIENT', db_client)
+    monkeypatch.setattr(firestore_manager, 'holiday_cache', firestore_manager.HolidayCache())
+    monkeypatch.setattr(firestore_manager.local_snapshot, 'load_fixed_holidays', lambda: None)
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    """Prueba el formato de texto de contadores y histogramas con etiquetas."""
+    registry = metrics.Registry()
+    requests_total = registry.counter('demo_requests_total', 'Peticiones.', ('endpoint',))
+    latency = registry.histogram('demo_seconds', 'Duración.', buckets=(0.1, 1.0))
+    requests_total.inc(endpoint='a"b')
+    requests_total.inc(2, endpoint='a"b')
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    text = registry.render()
+
+    assert '# TYPE demo_requests_total counter' in text
+    assert 'demo_requests_total{endpoint="a\\"b"} 3' in text
+    assert 'demo_seconds_bucket{le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{le="1"} 2' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 2' in text
+    assert 'demo_seconds_count 2' in text
+    assert registry.counter('demo_requests_total', 'Peticiones.', ('endpoint',)) is requests_total
+    with pytest.raises(ValueError):
+        requests_total.inc(other='x')
+
+
+def test_firestore_reads_are_attributed_to_endpoint(client):
+    """Prueba que las lecturas de Firestore y los aciertos del caché de feriados se cuenten por endpoint."""
+    reads = firestore_manager.FIRESTORE_READS
+    hits = firestore_manager.HOLIDAY_CACHE_REQUESTS
+    reads_before = reads.value(endpoint='api.get_holidays')
+    hits_before, misses_before = hits.value(result='hit'), hits.value(result='miss')
+
+    client.get('/api/getHolidays', query_string={'year': '2025'})
+    client.get('/api/getHolidays', query_string={'year': '2025'})
+
+    assert reads.value(endpoint='api.get_holidays') - reads_before == len(FIXED_HOLIDAYS)
+    assert hits.value(result='miss') - misses_before == 1
+    assert hits.value(result='hit') - hits_before == 1
+
+
+def test_ruc_lookups_distinguish_cache_and_upstream(client, monkeypatch):
+    """Prueba que la primera consulta vaya a la API y la segunda se sirva desde el caché."""
+    lookups = services.RUC_LOOKUPS
+    fresh_before, miss_before = lookups.value(result='fresh'), lookups.value(result='miss')
+    monkeypatch.setenv('SUNAT_API_TOKEN', 'token')
+    response = type('Response', (), {
+        'status_code': 200, 'raise_for_status': lambda self: None,
+        'json': lambda self: {'razonSocial': 'EMPRESA S.A.C.'},
+    })()
+
+    with patch('ruc_client.hedged_get', return_value=response), \
+            patch('local_snapshot.get_ruc', return_value=None):
+        services.get_ruc_data('20100070970')
+        services.get_ruc_data('20100070970')
+
+    assert lookups.value(result='miss') - miss_before == 1
+    assert lookups.value(result='fresh') - fresh_before == 1
+
+
+def test_metrics_endpoint_requires_token(client, monkeypatch):
+    """Prueba que el endpoint exija METRICS_TOKEN y responda en formato Prometheus."""
+    monkeypatch.setenv('METRICS_TOKEN', 'secreto')
+
+    assert client.get('/api/metrics').status_code == 403
+    response = client.get('/api/metrics', headers={'X-Api-Token': 'secreto'})
+
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    assert '# TYPE excel_render_seconds histogram' in response.get_data(as_text=True)
+
+
+def test_metrics_endpoint_fails_closed_without_token(client, monkeypatch):
+    """Prueba que sin METRICS_TOKEN configurado no se expongan las métricas."""
+    monkeypatch.delenv('FUNCTIONS_EMULATOR', raising=False)
+    monkeypatch.delenv('ALLOW_INSECURE_ENDPOINTS', raising=False)
+
+    response = client.get('/api/metrics')
+
+    assert response.status_code == 503
+    assert '# TYPE' not in response.get_data(as_text=True)
+
+
+def test_multiprocess_render_sums_all_workers(tmp_path, monkeypatch):
+    """Prueba que bajo preforking el scrape sume los volcados de todos los workers, incluidos los reciclados."""
+    lookups = services.RUC_LOOKUPS
+    local_value = lookups.value(result='fresh')
+    other_worker = {
+        'ruc_lookups_total': [[['fresh'], 5]],
+        'excel_render_seconds': [[['plan', 'pool'], [[1] + [0] * 11, 0.004, 1]]],
+    }
+    (tmp_path / '999_dead.json').write_text(json.dumps(other_worker))
+    monkeypatch.setattr(metrics, '_multiprocess_dir', str(tmp_path))
+    monkeypatch.setattr(metrics, '_dump_path', str(tmp_path / f'{os.getpid()}_self.json'))
+
+    text = metrics.render()
+
+    assert f'ruc_lookups_total{{result="fresh"}} {metrics._format_value(local_value + 5)}' in text
+    assert 'excel_render_seconds_count{report="plan",mode="pool"} 1' in text
+    assert 'pid=' not in text
+    assert json.loads((tmp_path / f'{os.getpid()}_self.json').read_text())['ruc_lookups_total']
+
+
+def test_registry_merge_adds_histograms():
+    """Prueba que al combinar volcados se sumen buckets, suma y cantidad de los histogramas."""
+    registry = metrics.Registry()
+    latency = registry.histogram('demo_seconds', 'Duración.', buckets=(0.1, 1.0))
+    latency.observe(0.05)
+
+    text = registry.merged([registry.dump(), registry.dump()]).render()
+
+    assert 'demo_seconds_bucket{le="0.1"} 2' in text
+    assert 'demo_seconds_count 2' in text
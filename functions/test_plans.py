@@ -0,0 +1,290 @@
+"""Tests for plan persistence, due-date queries and portfolio rollups, against the in-memory Firestore."""
+from datetime import date
+
+import pytest
+
+import firestore_manager
+import plan_store
+from loadtest.fake_firestore import FakeFirestore
+from loadtest.harness import FIXED_HOLIDAYS
+from main import app
+
+
+@pytest.fixture
+def db_client(monkeypatch):
+    client = FakeFirestore()
+    client.seed(firestore_manager.HOLIDAYS_COLLECTION, FIXED_HOLIDAYS)
+    monkeypatch.setattr(firestore_manager, 'DB_CLIENT', client)
+    monkeypatch.setattr(firestore_manager, 'holiday_cache', firestore_manager.HolidayCache(window=0))
+    monkeypatch.setattr(firestore_manager.local_snapshot, 'load_fixed_holidays', lambda: None)
+    monkeypatch.setattr(firestore_manager.local_snapshot, 'save_fixed_holidays', lambda fixed: None)
+    return client
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('PLANS_API_TOKEN', 'secreto')
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        client.environ_base['HTTP_X_API_TOKEN'] = 'secreto'
+        yield client
+
+
+def _plan(ruc='20100070970', linea='viniball', pedido='P-001', fechas=('15/01/2025', '15/02/2025')):
+    return {
+        'ruc': ruc, 'razonSocial': f'EMPRESA {ruc}', 'linea': linea, 'pedido': pedido,
+        'montoOriginal': 100.0 * len(fechas),
+        'montosAsignados': {fecha: 100.0 for fecha in fechas},
+    }
+
+
+def test_save_plan_writes_one_document_per_installment(client, db_client):
+    """Prueba que se guarde la cabecera y una cuota por fecha, con id estable."""
+    response = client.post('/api/plans', json=_plan())
+
+    assert response.status_code == 201
+    plan_id = response.get_json()['id']
+    assert response.get_json()['numCuotas'] == 2
+    installments = db_client.dump(plan_store.INSTALLMENTS_COLLECTION)
+    assert sorted(installments) == [f'{plan_id}_20250115', f'{plan_id}_20250215']
+    assert installments[f'{plan_id}_20250115']['ruc'] == '20100070970'
+    assert db_client.dump(plan_store.PLANS_COLLECTION)[plan_id]['numCuotas'] == 2
+
+
+def test_save_plan_rejects_installments_on_holidays(client, db_client):
+    """Prueba que no se guarde un plan con cuotas en feriado y que se indiquen las fechas."""
+    response = client.post('/api/plans', json=_plan(fechas=('15/01/2025', '28/07/2025', '18/04/2025')))
+
+    assert response.status_code == 400
+    assert '18/04/2025, 28/07/2025' in response.get_json()['message']
+    assert db_client.dump(plan_store.INSTALLMENTS_COLLECTION) == {}
+
+
+def test_save_plan_normalizes_linea_case(client, db_client):
+    """Prueba que la línea se acepte sin importar mayúsculas y se guarde en minúsculas."""
+    response = client.post('/api/plans', json=_plan(linea='Viniball'))
+
+    assert response.status_code == 201
+    plan_id = response.get_json()['id']
+    assert plan_id == '20100070970_viniball_P-001'
+    assert db_client.dump(plan_store.PLANS_COLLECTION)[plan_id]['linea'] == 'viniball'
+
+
+def test_saving_same_plan_replaces_removed_installments(client, db_client):
+    """Prueba que al actualizar un plan se eliminen las cuotas que ya no existen."""
+    client.post('/api/plans', json=_plan(fechas=('15/01/2025', '15/02/2025')))
+    client.post('/api/plans', json=_plan(fechas=('15/02/2025', '15/03/2025')))
+
+    dates = sorted(doc['month'] for doc in db_client.dump(plan_store.INSTALLMENTS_COLLECTION).values())
+    assert dates == ['2025-02', '2025-03']
+    assert len(db_client.dump(plan_store.PLANS_COLLECTION)) == 1
+
+
+def test_due_dates_filters_and_paginates_with_cursor(client, db_client):
+    """Prueba el filtro por rango y línea y la paginación por cursor sin repetir cuotas."""
+    client.post('/api/plans', json=_plan(pedido='A', fechas=('10/01/2025', '20/01/2025', '10/03/2025')))
+    client.post('/api/plans', json=_plan(ruc='20200000001', pedido='B', fechas=('20/01/2025', '25/01/2025')))
+    client.post('/api/plans', json=_plan(linea='vinifan', pedido='C', fechas=('15/01/2025',)))
+
+    seen, cursor = [], None
+    reads_before = db_client.reads
+    while True:
+        params = {'desde': '01/01/2025', 'hasta': '31/01/2025', 'linea': 'viniball', 'limit': '2'}
+        if cursor:
+            params['cursor'] = cursor
+        page = client.get('/api/due-dates', query_string=params).get_json()
+        seen.extend((item['fecha'], item['pedido']) for item in page['items'])
+        cursor = page['nextCursor']
+        if not cursor:
+            break
+
+    assert seen == [('10/01/2025', 'A'), ('20/01/2025', 'A'), ('20/01/2025', 'B'), ('25/01/2025', 'B')]
+    # Cada página lee solo las cuotas devueltas.
+    assert db_client.reads - reads_before <= len(seen) + 1
+
+
+def test_due_dates_by_client(client, db_client):
+    """Prueba el filtro por RUC."""
+    client.post('/api/plans', json=_plan(pedido='A'))
+    client.post('/api/plans', json=_plan(ruc='20200000001', pedido='B'))
+
+    page = client.get('/api/due-dates', query_string={
+        'desde': '01/01/2025', 'hasta': '31/12/2025', 'ruc': '20200000001',
+    }).get_json()
+
+    assert {item['ruc'] for item in page['items']} == {'20200000001'}
+    assert page['nextCursor'] is None
+
+
+def test_delete_plan_removes_installments(client, db_client):
+    """Prueba que al eliminar un plan se eliminen también sus cuotas."""
+    plan_id = client.post('/api/plans', json=_plan()).get_json()['id']
+
+    assert client.delete(f'/api/plans/{plan_id}').status_code == 204
+    assert db_client.dump(plan_store.INSTALLMENTS_COLLECTION) == {}
+    assert client.delete(f'/api/plans/{plan_id}').status_code == 404
+
+
+def test_invalid_requests_are_rejected(client, db_client, monkeypatch):
+    """Prueba la validación de línea, rango de fechas, cursor y token."""
+    assert client.post('/api/plans', json=_plan(linea='otra')).status_code == 400
+    assert client.get('/api/due-dates', query_string={'desde': '31/01/2025', 'hasta': '01/01/2025'}).status_code == 400
+    assert client.get('/api/due-dates', query_string={
+        'desde': '01/01/2025', 'hasta': '31/01/2025', 'cursor': 'no-es-un-cursor',
+    }).status_code == 400
+
+    assert client.post('/api/plans', json=_plan(), headers={'X-Api-Token': 'otro'}).status_code == 403
+    assert client.post('/api/plans', json=_plan()).status_code == 201
+
+
+def test_plan_endpoints_fail_closed_without_token(client, db_client, monkeypatch):
+    """Prueba que sin PLANS_API_TOKEN configurado no se pueda escribir, borrar ni listar."""
+    monkeypatch.delenv('PLANS_API_TOKEN')
+    monkeypatch.delenv('FUNCTIONS_EMULATOR', raising=False)
+    monkeypatch.delenv('ALLOW_INSECURE_ENDPOINTS', raising=False)
+
+    assert client.post('/api/plans', json=_plan()).status_code == 503
+    assert client.delete('/api/plans/cualquiera').status_code == 503
+    assert client.get('/api/due-dates', query_string={'desde': '01/01/2025', 'hasta': '31/01/2025'}).status_code == 503
+    assert db_client.dump(plan_store.PLANS_COLLECTION) == {}
+
+    monkeypatch.setenv('FUNCTIONS_EMULATOR', 'true')
+    assert client.post('/api/plans', json=_plan()).status_code == 201
+
+
+def test_portfolio_rollups_follow_save_update_and_delete(client, db_client):
+    """Prueba que los contadores reflejen altas, cambios de línea/fechas y bajas de planes."""
+    client.post('/api/plans', json=_plan(pedido='A', fechas=('15/01/2025', '15/02/2025')))
+    client.post('/api/plans', json=_plan(linea='vinifan', pedido='B', fechas=('20/01/2025',)))
+
+    summary = client.get('/api/portfolio-summary').get_json()
+    assert summary['meses'][0] == {'mes': '2025-01', 'montos': {'viniball': 100.0, 'vinifan': 100.0}, 'total': 200.0}
+    assert summary['total'] == 300.0
+
+    # Mismo pedido A con otras fechas y montos: se descuenta la versión anterior.
+    plan_a = _plan(pedido='A', fechas=('15/03/2025',))
+    plan_a['montosAsignados'] = {'15/03/2025': 50.25}
+    client.post('/api/plans', json=plan_a)
+    summary = client.get('/api/portfolio-summary').get_json()
+    assert [mes['mes'] for mes in summary['meses']] == ['2025-01', '2025-03']
+    assert summary['totalesPorLinea'] == {'viniball': 50.25, 'vinifan': 100.0, 'otros': 0.0}
+
+    plan_id = client.post('/api/plans', json=plan_a).get_json()['id']
+    client.delete(f'/api/plans/{plan_id}')
+    summary = client.get('/api/portfolio-summary', query_string={'desde': '2025-01', 'hasta': '2025-12'}).get_json()
+    assert summary['total'] == 100.0
+
+
+def _seed_legacy_plan(db_client, plan_id='LEGACY', linea='viniball', montos=None):
+    """Guarda un plan con el formato anterior a los contadores: sin monthlyTotals ni rollups."""
+    montos = montos or {date(2025, 1, 15): 100.0, date(2025, 2, 15): 100.0}
+    db_client.seed(plan_store.PLANS_COLLECTION, {plan_id: {'ruc': '20100070970', 'linea': linea, 'pedido': plan_id}})
+    db_client.seed(plan_store.INSTALLMENTS_COLLECTION, {
+        plan_store.installment_id(plan_id, due_date): {
+            'planId': plan_id, 'linea': linea, 'dueDate': plan_store.due_date_to_timestamp(due_date),
+            'month': due_date.strftime('%Y-%m'), 'monto': monto,
+        }
+        for due_date, monto in montos.items()
+    })
+
+
+def test_updating_legacy_plan_before_backfill_keeps_rollups_consistent(db_client):
+    """Prueba que actualizar un plan sin monthlyTotals no descuente montos que nunca se sumaron."""
+    import services
+
+    _seed_legacy_plan(db_client)
+    plan_store.save_plan('LEGACY', {'linea': 'viniball'}, {date(2025, 3, 15): 50.0})
+
+    summary = services.get_portfolio_summary_service()
+    assert [mes['mes'] for mes in summary['meses']] == ['2025-03']
+    assert summary['total'] == 50.0
+    assert plan_store.backfill_portfolio_rollups() == 0
+
+
+def test_backfill_adds_legacy_plans_once_and_updates_subtract_them(db_client):
+    """Prueba que el backfill sume los planes antiguos desde sus cuotas una sola vez."""
+    import services
+
+    _seed_legacy_plan(db_client)
+    _seed_legacy_plan(db_client, plan_id='OTRO', linea='vinifan', montos={date(2025, 1, 20): 30.0})
+
+    assert plan_store.backfill_portfolio_rollups() == 2
+    assert plan_store.backfill_portfolio_rollups() == 0
+    summary = services.get_portfolio_summary_service()
+    assert summary['totalesPorLinea'] == {'viniball': 200.0, 'vinifan': 30.0, 'otros': 0.0}
+
+    plan_store.save_plan('LEGACY', {'linea': 'viniball'}, {date(2025, 3, 15): 50.0})
+    summary = services.get_portfolio_summary_service()
+    assert summary['totalesPorLinea'] == {'viniball': 50.0, 'vinifan': 30.0, 'otros': 0.0}
+    assert [mes['mes'] for mes in summary['meses']] == ['2025-01', '2025-03']
+
+
+def test_portfolio_summary_reads_only_rollups(client, db_client):
+    """Prueba que el resumen no lea planes ni cuotas, solo los contadores."""
+    for index in range(5):
+        client.post('/api/plans', json=_plan(pedido=f'P{index}', fechas=('15/01/2025', '15/02/2025', '15/03/2025')))
+    rollup_docs = len(db_client.dump(plan_store.ROLLUPS_COLLECTION))
+    reads_before = db_client.reads
+
+    client.get('/api/portfolio-summary')
+
+    assert db_client.reads - reads_before == rollup_docs
+    assert rollup_docs <= 3 * plan_store.PORTFOLIO_ROLLUP_SHARDS
+
+
+def test_concurrent_saves_keep_rollups_consistent(db_client):
+    """Prueba que las transacciones mantengan los totales con guardados concurrentes."""
+    import threading
+
+    import services
+
+    def _save(index):
+        services.save_plan_service(_plan(pedido=f'P{index}', fechas=('15/01/2025',)))
+
+    threads = [threading.Thread(target=_save, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert services.get_portfolio_summary_service()['total'] == 800.0
+
+
+def test_retried_transaction_records_usage_once(db_client, monkeypatch):
+    """Prueba que un reintento por contención no infle las lecturas y escrituras registradas."""
+    apply_rollup_deltas = plan_store._apply_rollup_deltas
+    attempts = []
+
+    def _contended(transaction, deltas):
+        attempts.append(deltas)
+        if len(attempts) == 1:
+            # Otro proceso modifica el plan entre la lectura y el commit.
+            db_client._versions['plans/P1'] = db_client._versions.get('plans/P1', 0) + 1
+        apply_rollup_deltas(transaction, deltas)
+
+    monkeypatch.setattr(plan_store, '_apply_rollup_deltas', _contended)
+    reads, writes = firestore_manager.FIRESTORE_READS, firestore_manager.FIRESTORE_WRITES
+    reads_before, writes_before = reads.value(endpoint='background'), writes.value(endpoint='background')
+
+    plan_store.save_plan('P1', {'linea': 'viniball'}, {date(2025, 1, 15): 100.0, date(2025, 2, 15): 100.0})
+
+    assert len(attempts) == 2
+    # Cabecera + consulta de cuotas existentes; dos contadores + cabecera + dos cuotas.
+    assert reads.value(endpoint='background') - reads_before == 2
+    assert writes.value(endpoint='background') - writes_before == 5
+
+
+def test_portfolio_summary_exports_xlsx(client, db_client):
+    """Prueba la exportación del resumen a Excel con una columna por línea."""
+    from io import BytesIO
+
+    import openpyxl
+
+    client.post('/api/plans', json=_plan())
+    response = client.get('/api/portfolio-summary', query_string={'format': 'xlsx'})
+
+    assert response.status_code == 200
+    ws = openpyxl.load_workbook(BytesIO(response.data)).active
+    assert [cell.value for cell in ws[3]] == ['Mes', 'Viniball', 'Vinifan', 'Otros', 'Total']
+    assert ws['A4'].value == 'Enero 2025'
+    assert ws['E6'].value == '=SUM(E4:E5)'
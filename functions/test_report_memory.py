@@ -0,0 +1,93 @@
+"""Tests for report memory budgeting and the streaming Excel path."""
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+from openpyxl import load_workbook
+
+import report_memory
+from main import app
+from services import perform_calculation
+
+FECHAS = ["15/08/2024", "16/08/2024", "02/09/2024", "03/10/2024"]
+
+
+def _report_data():
+    data = perform_calculation(1000.0, FECHAS)
+    data.update({
+        "montoOriginal": 1000.0,
+        "fechasOrdenadas": FECHAS,
+        "razonSocial": "Empresa S.A.C.",
+        "linea": "vinifan",
+        "pedido": "PED-1",
+    })
+    return data
+
+
+@pytest.fixture
+def client():
+    """Configura un cliente de prueba para la aplicación Flask."""
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+def test_choose_report_mode_falls_back_by_budget():
+    """Prueba que el modo baje a streaming y luego a rechazo según el presupuesto."""
+    data = _report_data()
+    estimates = report_memory.estimate_report_memory(data)
+    assert estimates[report_memory.MODE_STREAMING] < estimates[report_memory.MODE_FULL]
+
+    assert report_memory.choose_report_mode(data, estimates['full'])[0] == report_memory.MODE_FULL
+    assert report_memory.choose_report_mode(data, estimates['full'] - 1)[0] == report_memory.MODE_STREAMING
+    assert report_memory.choose_report_mode(data, estimates['streaming'] - 1)[0] is None
+
+
+def test_track_peak_memory_with_tracing():
+    """Prueba que el trazado mida el pico de las asignaciones del bloque."""
+    with report_memory.track_peak_memory(trace=True) as usage:
+        buffer = bytearray(4 * 1024 * 1024)
+        del buffer
+    assert usage.traced_peak >= 4 * 1024 * 1024
+    assert usage.process_max_rss > 0
+
+
+def test_track_peak_memory_reports_per_request_rss_without_tracing():
+    """Prueba que sin trazado se mida el RSS actual del bloque y no solo el máximo del proceso."""
+    with report_memory.track_peak_memory(trace=False) as usage:
+        retained = bytearray(16 * 1024 * 1024)
+        retained[::4096] = b'x' * len(retained[::4096])
+
+    assert usage.traced_peak is None
+    if report_memory._current_rss_bytes():
+        assert usage.rss_delta >= 8 * 1024 * 1024
+    del retained
+
+
+def test_generate_excel_uses_streaming_when_over_budget(client):
+    """Prueba que, sin presupuesto para el reporte completo, se genere el compacto."""
+    data = _report_data()
+    budget = report_memory.estimate_report_memory(data)['streaming']
+
+    with patch('report_memory.REPORT_MEMORY_BUDGET_BYTES', budget):
+        response = client.post('/api/generate-excel', json=data)
+
+    assert response.status_code == 200
+    assert 'attachment' in response.headers['Content-Disposition']
+    workbook = load_workbook(BytesIO(response.data))
+    assert workbook.sheetnames == ["Reporte"]
+    sheet = workbook["Reporte"]
+    labels = [row[0] for row in sheet.iter_rows(values_only=True)]
+    fechas = [row[1] for row in sheet.iter_rows(values_only=True) if isinstance(row[0], int)]
+    assert "Resumen Mensual" in labels
+    assert labels[-1] == "Monto Total"
+    assert fechas == FECHAS
+
+
+def test_generate_excel_rejects_with_413_when_nothing_fits(client):
+    """Prueba que un reporte que no cabe en ningún modo se rechace con 413."""
+    with patch('report_memory.REPORT_MEMORY_BUDGET_BYTES', 1):
+        response = client.post('/api/generate-excel', json=_report_data())
+
+    assert response.status_code == 413
+    assert "demasiado grande" in response.get_json()['message']
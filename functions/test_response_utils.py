@@ -0,0 +1,110 @@
+"""Tests for response compression and conditional responses."""
+import gzip
+import json
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import pytest
+from flask import make_response
+
+from main import app
+from response_utils import finalize_response
+from services import perform_calculation
+
+
+def _large_plan(num_dates: int = 2000) -> dict:
+    """Construye un plan con muchas fechas, como el que enviaría el frontend."""
+    start = date(2025, 1, 1)
+    fechas = [(start + timedelta(days=i)).strftime("%d/%m/%Y") for i in range(num_dates)]
+    plan = perform_calculation(1234567.89, fechas)
+    plan.update({
+        "montoOriginal": 1234567.89,
+        "fechasOrdenadas": fechas,
+        "razonSocial": "Empresa Grande S.A.C.",
+        "linea": "viniball",
+        "pedido": "PED-999",
+    })
+    return plan
+
+
+@pytest.fixture
+def client():
+    """Configura un cliente de prueba para la aplicación Flask."""
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+def test_calculate_large_plan_is_gzipped(client):
+    """Prueba que una respuesta grande se comprima y se reduzca considerablemente."""
+    plan = _large_plan()
+    payload = {"montoTotal": plan["montoOriginal"], "fechasValidas": plan["fechasOrdenadas"]}
+
+    plain = client.post('/api/calculate', json=payload)
+    compressed = client.post('/api/calculate', json=payload, headers={'Accept-Encoding': 'gzip'})
+
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert len(compressed.data) < len(plain.data) / 4
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+
+def test_calculate_small_response_is_not_compressed(client):
+    """Prueba que las respuestas por debajo del umbral se envíen sin comprimir."""
+    payload = {"montoTotal": 100, "fechasValidas": ["10/10/2025"]}
+    response = client.post('/api/calculate', json=payload, headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_get_if_none_match_returns_304(client):
+    """Prueba que repetir un GET con el ETag recibido devuelva 304 sin cuerpo."""
+    with patch('services.get_holidays_for_year', return_value=[{'fecha': '2025-01-01'}]):
+        first = client.get('/api/getHolidays?year=2025')
+        etag = first.headers['ETag']
+
+        second = client.get('/api/getHolidays?year=2025', headers={'If-None-Match': etag})
+
+    assert second.status_code == 304
+    assert second.data == b''
+
+
+def test_post_if_none_match_returns_full_response(client):
+    """Prueba que un POST con un ETag coincidente reciba la respuesta completa (RFC 9110)."""
+    payload = {"montoTotal": 500, "fechasValidas": ["10/10/2025", "11/10/2025"]}
+    first = client.post('/api/calculate', json=payload)
+    etag = first.headers['ETag']
+
+    second = client.post('/api/calculate', json=payload, headers={'If-None-Match': etag})
+
+    assert second.status_code == 200
+    assert second.headers['ETag'] == etag
+    assert second.get_json() == first.get_json()
+
+
+def test_etag_depends_on_download_filename():
+    """Prueba que el mismo cuerpo con otro nombre de archivo tenga otro ETag."""
+    with app.test_request_context('/', method='GET'):
+        responses = []
+        for filename in ('plan_a.json', 'plan_b.json'):
+            response = make_response(b'{}')
+            response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+            responses.append(finalize_response(response))
+
+    assert responses[0].headers['ETag'] != responses[1].headers['ETag']
+
+
+def test_generate_json_minified_is_smaller(client):
+    """Prueba que el modo minificado reduzca el tamaño del respaldo de un plan grande."""
+    plan = _large_plan()
+
+    pretty = client.post('/api/generate-json', json=plan)
+    minified = client.post('/api/generate-json?minify=1', json=plan)
+
+    assert pretty.status_code == 200
+    assert minified.status_code == 200
+    assert len(minified.data) < len(pretty.data) * 0.7
+    assert json.loads(minified.data) == json.loads(pretty.data)
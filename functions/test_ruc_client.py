@@ -0,0 +1,226 @@
+"""Tests for the RUC API circuit breaker and hedged requests against a local fake server."""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+import requests
+
+import firestore_manager
+import ruc_client
+import services
+from loadtest.fake_ruc_server import FakeRucConfig, FakeRucServer
+from services import ApiError
+
+
+@pytest.fixture(autouse=True)
+def reset_breaker():
+    ruc_client.breaker.reset()
+    yield
+    ruc_client.breaker.reset()
+
+
+@pytest.fixture
+def ruc_server(monkeypatch):
+    with FakeRucServer(FakeRucConfig()) as server:
+        monkeypatch.setattr(services, 'RUC_API_URL', server.url_template)
+        monkeypatch.setattr(services, '_http_session', None)
+        monkeypatch.setenv('SUNAT_API_TOKEN', 'fake_token')
+        yield server
+
+
+def _first_request_slow(delay):
+    """Latencia para FakeRucConfig: solo la primera petición es lenta."""
+    calls = []
+    lock = threading.Lock()
+
+    def latency():
+        with lock:
+            calls.append(1)
+            return delay if len(calls) == 1 else 0.0
+    return latency
+
+
+def test_hedged_request_wins_over_slow_attempt(ruc_server):
+    """Prueba que un intento lento se cubra con uno paralelo y gane la respuesta rápida."""
+    ruc_server.config.latency = _first_request_slow(1.0)
+    url = ruc_server.url_template.format('20100070970')
+
+    started = time.monotonic()
+    response = ruc_client.hedged_get(services._get_http_session(), url, attempt_timeout=2,
+                                     deadline=3, max_attempts=2, hedge_after=0.1)
+
+    assert response.status_code == 200
+    assert time.monotonic() - started < 0.8
+    assert ruc_server.config.requests == 2
+
+
+def test_failed_attempt_is_retried(ruc_server):
+    """Prueba que un 503 del primer intento se reintente dentro del plazo."""
+    ruc_server.config.fail_next = 1
+    url = ruc_server.url_template.format('20100070970')
+
+    response = ruc_client.hedged_get(services._get_http_session(), url, attempt_timeout=1,
+                                     deadline=2, max_attempts=2, hedge_after=0)
+
+    assert response.status_code == 200
+    assert ruc_server.config.requests == 2
+
+
+def test_retry_waits_with_jitter(ruc_server, monkeypatch):
+    """Prueba que el reintento tras un fallo espere un tiempo con jitter y no se lance de inmediato."""
+    ruc_server.config.fail_next = 1
+    monkeypatch.setattr(ruc_client, 'RUC_RETRY_BACKOFF_SECONDS', 0.3)
+    url = ruc_server.url_template.format('20100070970')
+
+    started = time.monotonic()
+    response = ruc_client.hedged_get(services._get_http_session(), url, attempt_timeout=1,
+                                     deadline=2, max_attempts=2, hedge_after=0)
+
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 0.15
+
+
+def test_attempt_timeout_bounds_slow_upstream(ruc_server):
+    """Prueba que un upstream lento falle con el timeout por intento y no con el de 10 s."""
+    ruc_server.config.latency = 1.5
+    url = ruc_server.url_template.format('20100070970')
+
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        ruc_client.hedged_get(services._get_http_session(), url, attempt_timeout=0.2,
+                              deadline=0.5, max_attempts=2, hedge_after=0)
+
+    assert time.monotonic() - started < 1.0
+
+
+@patch('services.firestore_manager.get_db')
+@patch('services.firestore_manager.get_ruc_from_cache', return_value=None)
+def test_open_circuit_fails_fast_without_calling_upstream(mock_get_from_cache, mock_get_db, ruc_server):
+    """Prueba que tras varios fallos el circuito se abra y no se vuelva a llamar a la API."""
+    ruc_server.config.error_rate = 1.0
+    with patch.object(ruc_client, 'RUC_MAX_ATTEMPTS', 1):
+        for _ in range(ruc_client.breaker.min_calls):
+            with pytest.raises(ApiError):
+                services.get_ruc_data('20100070970')
+        requests_before = ruc_server.config.requests
+
+        with pytest.raises(ApiError) as exc_info:
+            services.get_ruc_data('20100070970')
+
+    assert ruc_client.breaker.state == ruc_client.STATE_OPEN
+    assert exc_info.value.status_code == 503
+    assert 1 <= int(exc_info.value.headers['Retry-After']) <= ruc_client.breaker.open_seconds
+    assert ruc_server.config.requests == requests_before
+
+
+@patch('services.firestore_manager.get_ruc_from_cache')
+def test_open_circuit_serves_old_cache_entry(mock_get_from_cache, ruc_server):
+    """Prueba que con el circuito abierto se devuelva la entrada antigua del caché."""
+    old_entry = {'ruc': '20100070970', 'razonSocial': 'EMPRESA ANTIGUA',
+                 'timestamp': datetime(2000, 1, 1, tzinfo=timezone.utc)}
+    mock_get_from_cache.return_value = old_entry
+    for _ in range(ruc_client.breaker.min_calls):
+        ruc_client.breaker.record_failure()
+
+    result = services.get_ruc_data('20100070970')
+
+    assert result == old_entry
+    assert ruc_server.config.requests == 0
+
+
+def test_breaker_half_open_probe_closes_or_reopens():
+    """Prueba el ciclo abierto -> half-open -> cerrado/abierto con un reloj simulado."""
+    now = [0.0]
+    breaker = ruc_client.CircuitBreaker(window=4, min_calls=2, failure_ratio=0.5,
+                                        open_seconds=10, clock=lambda: now[0])
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow_request() is False
+
+    now[0] = 10.0
+    assert breaker.allow_request() is True   # consulta de prueba
+    assert breaker.allow_request() is False  # solo una a la vez
+    breaker.record_failure()
+    assert breaker.state == ruc_client.STATE_OPEN
+
+    now[0] = 20.0
+    assert breaker.allow_request() is True
+    breaker.record_success()
+    assert breaker.state == ruc_client.STATE_CLOSED
+    assert breaker.allow_request() is True
+
+
+@pytest.fixture
+def ruc_cache(monkeypatch):
+    """Firestore en memoria para el caché de RUC."""
+    from loadtest.fake_firestore import FakeFirestore
+
+    db_client = FakeFirestore()
+    monkeypatch.setattr(firestore_manager, 'DB_CLIENT', db_client)
+    return db_client
+
+
+def _cache_entry(db_client, ruc_number, age_days):
+    db_client.seed(firestore_manager.RUC_CACHE_COLLECTION, {ruc_number: {
+        'ruc': ruc_number, 'razonSocial': 'EMPRESA DADA DE BAJA',
+        'timestamp': datetime.now(timezone.utc) - timedelta(days=age_days),
+    }})
+
+
+def test_unknown_ruc_returns_404(ruc_server, ruc_cache):
+    """Prueba que un 404 de la API se propague como 404 y no como error de conexión."""
+    ruc_server.config.not_found.add('20999999999')
+
+    with pytest.raises(ApiError) as exc_info:
+        services.get_ruc_data('20999999999')
+
+    assert exc_info.value.status_code == 404
+    assert ruc_client.breaker.state == ruc_client.STATE_CLOSED
+
+
+def test_ruc_removed_upstream_is_not_served_from_cache(ruc_server, ruc_cache):
+    """Prueba que un RUC eliminado en la API no se siga sirviendo desde un caché vencido."""
+    ruc_server.config.not_found.update({'20111111111', '20222222222'})
+    _cache_entry(ruc_cache, '20111111111', age_days=firestore_manager.RUC_CACHE_MAX_STALE_DAYS + 1)
+    _cache_entry(ruc_cache, '20222222222', age_days=firestore_manager.RUC_CACHE_DAYS + 1)
+
+    # Entrada demasiado antigua: se consulta la API y el 404 no cae al respaldo.
+    with pytest.raises(ApiError) as exc_info:
+        services.get_ruc_data('20111111111')
+    assert exc_info.value.status_code == 404
+
+    # Entrada vencida servible: se devuelve una vez y la revalidación la elimina.
+    assert services.get_ruc_data('20222222222')['razonSocial'] == 'EMPRESA DADA DE BAJA'
+    deadline = time.monotonic() + 5
+    while '20222222222' in ruc_cache.dump(firestore_manager.RUC_CACHE_COLLECTION) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(ApiError) as exc_info:
+        services.get_ruc_data('20222222222')
+    assert exc_info.value.status_code == 404
+    assert ruc_cache.dump(firestore_manager.RUC_CACHE_COLLECTION) == {}
+
+
+def test_refresh_sweep_deletes_rucs_removed_upstream(ruc_server, ruc_cache):
+    """Prueba que el barrido con refresh elimine los RUC que la API ya no reconoce."""
+    ruc_server.config.not_found.add('20333333333')
+    _cache_entry(ruc_cache, '20333333333', age_days=firestore_manager.RUC_CACHE_DAYS + 1)
+    _cache_entry(ruc_cache, '20100070970', age_days=firestore_manager.RUC_CACHE_DAYS + 1)
+
+    stats = services.sweep_expired_ruc_cache(refresh=True)
+
+    assert stats == {'scanned': 2, 'deleted': 1, 'refreshed': 1, 'failed': 0}
+    assert list(ruc_cache.dump(firestore_manager.RUC_CACHE_COLLECTION)) == ['20100070970']
+
+
+def test_delete_sweep_keeps_entries_still_usable_as_fallback(ruc_server, ruc_cache):
+    """Prueba que el barrido por defecto conserve las entradas que aún sirven de respaldo."""
+    _cache_entry(ruc_cache, '20100070970', age_days=firestore_manager.RUC_CACHE_DAYS + 1)
+    _cache_entry(ruc_cache, '20200000001', age_days=firestore_manager.RUC_CACHE_MAX_STALE_DAYS + 1)
+    _cache_entry(ruc_cache, '20300000002', age_days=firestore_manager.RUC_CACHE_RETENTION_DAYS + 1)
+
+    stats = services.sweep_expired_ruc_cache()
+
+    assert stats['deleted'] == 1
+    assert sorted(ruc_cache.dump(firestore_manager.RUC_CACHE_COLLECTION)) == ['20100070970', '20200000001']
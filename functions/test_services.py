@@ -1,11 +1,14 @@
 """Tests for the services layer."""
 import json
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch, MagicMock
 
 import pytest
 
 # Importar las funciones y clases a probar desde el módulo de servicios
-from services import get_ruc_data, perform_calculation, ApiError, generate_json_service
+from services import (
+    get_ruc_data, perform_calculation, ApiError, generate_json_service, sweep_expired_ruc_cache
+)
 
 # --- Pruebas para el Servicio de Consulta de RUC ---
 
@@ -16,7 +19,11 @@ def test_get_ruc_data_from_cache(mock_get_from_cache):
     sin llamar a la API externa, optimizando el rendimiento.
     """
     # 1. Configurar el mock del caché para que devuelva datos simulados
-    cached_data = {'ruc': '20123456789', 'razonSocial': 'EMPRESA CACHEADA S.A.C.'}
+    cached_data = {
+        'ruc': '20123456789',
+        'razonSocial': 'EMPRESA CACHEADA S.A.C.',
+        'timestamp': datetime.now(timezone.utc)
+    }
     mock_get_from_cache.return_value = cached_data
 
     # 2. Llamar a la función del servicio
@@ -29,10 +36,10 @@ def test_get_ruc_data_from_cache(mock_get_from_cache):
 @patch(
     'services.firestore_manager.get_ruc_from_cache', return_value=None
 )
-@patch('services.requests.get')
+@patch('services._get_http_session')
 @patch('services.firestore_manager.get_db')
 @patch.dict('os.environ', {'SUNAT_API_TOKEN': 'fake_token'})
-def test_get_ruc_data_from_api_and_caches_it(mock_get_db, mock_requests_get, mock_get_from_cache):
+def test_get_ruc_data_from_api_and_caches_it(mock_get_db, mock_get_http_session, mock_get_from_cache):
     """
     Prueba que si el RUC no está en caché, se llama a la API externa
     y el nuevo resultado se guarda en el caché para futuras consultas.
@@ -41,6 +48,7 @@ def test_get_ruc_data_from_api_and_caches_it(mock_get_db, mock_requests_get, moc
     api_response_mock = MagicMock()
     api_response_mock.status_code = 200
     api_response_mock.json.return_value = {'ruc': '20987654321', 'razonSocial': 'EMPRESA NUEVA S.A.'}
+    mock_requests_get = mock_get_http_session.return_value.get
     mock_requests_get.return_value = api_response_mock
 
     mock_doc = MagicMock()
@@ -55,6 +63,78 @@ def test_get_ruc_data_from_api_and_caches_it(mock_get_db, mock_requests_get, moc
     mock_doc.set.assert_called_once()
     assert result['razonSocial'] == 'EMPRESA NUEVA S.A.'
 
+@patch('services._refresh_ruc_in_background')
+@patch('services._fetch_ruc_from_api')
+@patch('services.firestore_manager.get_ruc_from_cache')
+def test_get_ruc_data_stale_is_served_and_revalidated(mock_get_from_cache, mock_fetch, mock_refresh):
+    """
+    Prueba que una entrada vencida se devuelva de inmediato y se programe
+    su revalidación en segundo plano, sin esperar a la API externa.
+    """
+    stale_data = {
+        'ruc': '20123456789',
+        'razonSocial': 'EMPRESA ANTIGUA S.A.C.',
+        'timestamp': datetime.now(timezone.utc) - timedelta(days=10)
+    }
+    mock_get_from_cache.return_value = stale_data
+
+    result = get_ruc_data('20123456789')
+
+    assert result == stale_data
+    mock_refresh.assert_called_once_with('20123456789')
+    mock_fetch.assert_not_called()
+
+@patch('services._fetch_ruc_from_api')
+@patch('services.firestore_manager.get_ruc_from_cache')
+def test_get_ruc_data_falls_back_to_stale_when_api_fails(mock_get_from_cache, mock_fetch):
+    """
+    Prueba que, si la entrada es demasiado antigua para servirse directamente
+    y la API externa falla, se devuelva la entrada antigua en lugar de un 503.
+    """
+    old_data = {
+        'ruc': '20123456789',
+        'razonSocial': 'EMPRESA MUY ANTIGUA S.A.C.',
+        'timestamp': datetime.now(timezone.utc) - timedelta(days=90)
+    }
+    mock_get_from_cache.return_value = old_data
+    mock_fetch.side_effect = ApiError("Could not connect to the RUC consultation service.", 503)
+
+    assert get_ruc_data('20123456789') == old_data
+
+@patch('services._fetch_ruc_from_api')
+@patch('services.firestore_manager.get_ruc_from_cache', return_value=None)
+def test_get_ruc_data_not_found_is_not_masked(mock_get_from_cache, mock_fetch):
+    """Prueba que un 404 de la API se propague sin convertirse en un error 500."""
+    mock_fetch.side_effect = ApiError("RUC not found.", 404)
+
+    with pytest.raises(ApiError) as excinfo:
+        get_ruc_data('20000000000')
+    assert excinfo.value.status_code == 404
+
+@patch('services.firestore_manager.delete_ruc_cache_entries')
+@patch('services.firestore_manager.get_expired_ruc_cache_page')
+def test_sweep_expired_ruc_cache_deletes_in_pages(mock_get_page, mock_delete):
+    """Prueba que el barrido procese el caché vencido por páginas y borre cada una en batch."""
+    def make_docs(ids):
+        docs = []
+        for doc_id in ids:
+            doc = MagicMock()
+            doc.id = doc_id
+            docs.append(doc)
+        return docs
+
+    first_page = make_docs(['1', '2'])
+    second_page = make_docs(['3'])
+    mock_get_page.side_effect = [first_page, second_page]
+
+    stats = sweep_expired_ruc_cache(page_size=2)
+
+    assert stats['scanned'] == 3
+    assert stats['deleted'] == 3
+    assert mock_get_page.call_args_list[1].kwargs['start_after'] is first_page[-1]
+    mock_delete.assert_any_call(['1', '2'])
+    mock_delete.assert_any_call(['3'])
+
 # --- Pruebas para el Servicio de Cálculo ---
 
 def test_perform_calculation_single_date():
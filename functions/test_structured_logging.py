@@ -0,0 +1,101 @@
+"""Tests for the non-blocking structured logging layer."""
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+
+import metrics
+import structured_logging
+from main import app
+
+
+def _make_record(msg, *args, level=logging.INFO, **extra):
+    record = logging.LogRecord('test', level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_request_id_and_extra_fields():
+    """Prueba que cada registro sea una línea JSON con severidad, request id y campos extra."""
+    handler = structured_logging.NonBlockingQueueHandler(queue.Queue())
+    token = structured_logging.set_request_id('abc123')
+    try:
+        record = handler.prepare(_make_record("RUC %s from cache", '20100070970', ruc='20100070970'))
+    finally:
+        structured_logging.reset_request_id(token)
+
+    entry = json.loads(structured_logging.JsonFormatter().format(record))
+
+    assert entry['severity'] == 'INFO'
+    assert entry['message'] == 'RUC 20100070970 from cache'
+    assert entry['requestId'] == 'abc123'
+    assert entry['ruc'] == '20100070970'
+
+
+def test_sampling_filter_drops_configured_levels_only():
+    """Prueba que el muestreo afecte solo a los niveles configurados."""
+    sampling = structured_logging.SamplingFilter(structured_logging.parse_sample_rates("DEBUG=0"))
+    hit, miss = _make_record("hit", level=logging.DEBUG), _make_record("miss", level=logging.INFO)
+    hit.name = miss.name = 'sampled.services'
+
+    assert sampling.filter(hit) is False
+    assert sampling.filter(miss) is True
+
+
+def test_sampling_applies_only_to_sampled_loggers():
+    """Prueba que el muestreo no afecte a los loggers normales, aunque emitan en un nivel muestreado."""
+    sampling = structured_logging.SamplingFilter(structured_logging.parse_sample_rates("DEBUG=0"))
+    library_record = _make_record("urllib3 debug", level=logging.DEBUG)
+    library_record.name = 'urllib3.connectionpool'
+
+    assert sampling.filter(library_record) is True
+
+
+def test_sampled_logger_emits_debug_with_info_root_level():
+    """Prueba que los aciertos de caché (DEBUG muestreado) lleguen al handler con LOG_LEVEL=INFO."""
+    structured_logging.configure_logging()
+    root = logging.getLogger()
+    assert root.level == logging.INFO
+    assert structured_logging.get_sampled_logger('services').isEnabledFor(logging.DEBUG)
+    assert not logging.getLogger('urllib3').isEnabledFor(logging.DEBUG)
+
+
+def test_queue_handler_drops_records_instead_of_blocking():
+    """Prueba que con la cola llena el registro se descarte sin bloquear al llamador."""
+    handler = structured_logging.NonBlockingQueueHandler(queue.Queue(maxsize=1))
+
+    handler.handle(_make_record("first"))
+    handler.handle(_make_record("second"))
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+    assert 'log_records_dropped_total' in metrics.render()
+
+
+def test_request_id_is_propagated_to_response():
+    """Prueba que se reutilice el X-Request-Id recibido o el trace de Cloud Run."""
+    client = app.test_client()
+
+    response = client.get('/api/getHolidays', headers={'X-Request-Id': 'req-42'})
+    traced = client.get('/api/getHolidays', headers={'X-Cloud-Trace-Context': 'trace123/1;o=1'})
+
+    assert response.headers['X-Request-Id'] == 'req-42'
+    assert traced.headers['X-Request-Id'] == 'trace123'
+    assert structured_logging.request_id_var.get() is None
+
+
+def test_importing_modules_does_not_configure_root_logger():
+    """Prueba que importar un módulo con logger no instale handlers; solo lo hace el punto de entrada."""
+    code = (
+        "import logging, firestore_manager, structured_logging\n"
+        "assert not logging.getLogger().handlers\n"
+        "assert structured_logging._listener is None\n"
+        "import main\n"
+        "assert structured_logging._listener is not None\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, timeout=60,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    assert result.returncode == 0, result.stderr
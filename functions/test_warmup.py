@@ -0,0 +1,87 @@
+"""Tests for the instance warm-up hook."""
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+import firestore_manager
+import services
+import warmup
+from loadtest.fake_firestore import FakeFirestore
+from loadtest.fake_ruc_server import FakeRucServer
+from loadtest.harness import FIXED_HOLIDAYS
+from main import app
+
+
+@pytest.fixture
+def fake_backends(monkeypatch):
+    """Usa un Firestore en memoria y un servidor RUC local con cachés vacíos."""
+    db_client = FakeFirestore()
+    db_client.seed(firestore_manager.HOLIDAYS_COLLECTION, FIXED_HOLIDAYS)
+    monkeypatch.setattr(firestore_manager, 'DB_CLIENT', db_client)
+    monkeypatch.setattr(firestore_manager, 'holiday_cache', firestore_manager.HolidayCache())
+    with FakeRucServer() as ruc_server:
+        monkeypatch.setattr(services, 'RUC_API_URL', ruc_server.url_template)
+        monkeypatch.setattr(services, '_http_session', None)
+        yield db_client, ruc_server
+
+
+def test_run_warmup_primes_caches_and_reports_timings(fake_backends):
+    """Prueba que el warm-up cargue los feriados, abra la conexión RUC y mida cada paso."""
+    db_client, ruc_server = fake_backends
+
+    report = warmup.run_warmup()
+
+    assert report['ok'] is True
+    assert [step['step'] for step in report['steps']][0] == 'firestore_client'
+    assert all('seconds' in step for step in report['steps'])
+    current_year = datetime.now(timezone.utc).year
+    assert firestore_manager.holiday_cache.contains(current_year)
+    assert firestore_manager.holiday_cache.contains(current_year + 1)
+    ruc_step = next(step for step in report['steps'] if step['step'] == 'ruc_connection')
+    assert isinstance(ruc_step['result'], int)
+
+    reads_after_warmup = db_client.reads
+    firestore_manager.get_all_holidays_for_year(current_year)
+    assert db_client.reads == reads_after_warmup
+
+
+def test_run_warmup_reports_failed_step_without_aborting(fake_backends):
+    """Prueba que un paso fallido quede registrado sin impedir el resto."""
+    with patch('services.warm_ruc_connection', side_effect=RuntimeError("sin red")):
+        report = warmup.run_warmup()
+
+    failed = [step for step in report['steps'] if not step['ok']]
+    assert report['ok'] is False
+    assert failed[0]['step'] == 'ruc_connection'
+    # El mensaje de la excepción no se expone al cliente.
+    assert 'error' not in failed[0]
+    assert firestore_manager.holiday_cache.fixed_holidays is not None
+
+
+@patch.dict('os.environ', {'WARMUP_TOKEN': 'secreto'})
+@patch('warmup.run_warmup', return_value={'ok': True, 'total_seconds': 0.1, 'steps': []})
+def test_warmup_endpoint_requires_token(mock_run_warmup):
+    """Prueba que el endpoint exija el token configurado."""
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        denied = client.get('/api/warmup')
+        allowed = client.get('/api/warmup', headers={'X-Warmup-Token': 'secreto'})
+
+    assert denied.status_code == 403
+    assert allowed.status_code == 200
+    assert allowed.get_json()['ok'] is True
+    mock_run_warmup.assert_called_once()
+
+
+@patch('warmup.run_warmup')
+def test_warmup_endpoint_fails_closed_without_token(mock_run_warmup, monkeypatch):
+    """Prueba que sin WARMUP_TOKEN configurado el endpoint no ejecute el warm-up."""
+    for name in ('WARMUP_TOKEN', 'FUNCTIONS_EMULATOR', 'ALLOW_INSECURE_ENDPOINTS'):
+        monkeypatch.delenv(name, raising=False)
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        response = client.get('/api/warmup')
+
+    assert response.status_code == 503
+    mock_run_warmup.assert_not_called()
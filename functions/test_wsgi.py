@@ -0,0 +1,76 @@
+"""Tests for the standalone prefork server entry point."""
+import importlib
+import os
+import runpy
+
+import firebase_admin
+import pytest
+from firebase_admin import credentials
+from google.auth.credentials import AnonymousCredentials
+
+import admission
+import firestore_manager
+import ruc_client
+import services
+import structured_logging
+
+
+@pytest.fixture
+def wsgi(monkeypatch):
+    """Importa wsgi sin dejar PREFORK_SERVER definido para el resto de la sesión."""
+    monkeypatch.setenv('PREFORK_SERVER', '1')
+    return importlib.import_module('wsgi')
+
+
+def test_config_preloads_app_and_initializes_workers(wsgi):
+    """Prueba que la configuración cargue la app en el maestro y prepare cada worker."""
+    config = runpy.run_path(wsgi.CONFIG_PATH)
+
+    assert config['preload_app'] is True
+    assert config['worker_class'] == 'gthread'
+    assert callable(config['post_fork'])
+
+
+def test_init_worker_recreates_per_process_state(wsgi, monkeypatch):
+    """Prueba que un worker recién creado no reutilice clientes, pools ni hilos del maestro."""
+    services._get_http_session()
+    monkeypatch.setattr(firestore_manager, 'DB_CLIENT', object())
+    parent_state = (services._http_session, ruc_client.breaker, admission.get_limiter())
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            wsgi.init_worker()
+            listener = structured_logging._listener
+            if (firestore_manager.DB_CLIENT is None
+                    and services._http_session is None
+                    and ruc_client.breaker is not parent_state[1]
+                    and admission.get_limiter() is not parent_state[2]
+                    and listener is not None and listener._thread.is_alive()):
+                code = 0
+        finally:
+            os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    # El maestro conserva su propio estado.
+    assert services._http_session is parent_state[0]
+
+
+class _AnonymousCredential(credentials.Base):
+    def get_credential(self):
+        return AnonymousCredentials()
+
+
+def test_firestore_client_is_not_cached_on_the_firebase_app(monkeypatch):
+    """Prueba que get_db cree el cliente del proceso sin guardarlo en la App compartida."""
+    app = firebase_admin.initialize_app(_AnonymousCredential(), {'projectId': 'demo-project'}, name='test-wsgi')
+    monkeypatch.setattr(firebase_admin, 'get_app', lambda: app)
+    monkeypatch.setattr(firestore_manager, 'DB_CLIENT', None)
+    try:
+        client = firestore_manager.get_db()
+        assert client.project == 'demo-project'
+        assert not hasattr(app, '_firestore')
+    finally:
+        firebase_admin.delete_app(app)
@@ -0,0 +1,70 @@
+"""
+Instance warm-up: primes caches and connections before real traffic arrives.
+
+Se puede invocar al arrancar la instancia (WARMUP_ON_STARTUP=true) o
+periódicamente desde Cloud Scheduler a través de GET /api/warmup.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import excel_pool
+import firestore_manager
+import services
+import structured_logging
+
+logger = structured_logging.get_logger(__name__)
+
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "").lower() in ("1", "true")
+
+def _timed_step(name: str, func: Callable[[], Any]) -> Dict[str, Any]:
+    """Ejecuta un paso y devuelve su duración; los errores se registran sin interrumpir el resto."""
+    started = time.perf_counter()
+    step: Dict[str, Any] = {'step': name, 'ok': True}
+    try:
+        result = func()
+        # Solo se incluyen resultados simples (ej. número de feriados, código HTTP).
+        if isinstance(result, (int, float, str)):
+            step['result'] = result
+    except Exception:
+        # El detalle (hosts, errores de credenciales) solo va al log, no a la respuesta.
+        logger.exception("Warm-up step %s failed", name, extra={'step': name})
+        step['ok'] = False
+    step['seconds'] = round(time.perf_counter() - started, 4)
+    return step
+
+def run_warmup() -> Dict[str, Any]:
+    """
+    Inicializa el cliente de Firestore, precarga los feriados del año actual y el
+    siguiente, abre una conexión al API de RUC y arranca el pool de Excel si está activo.
+
+    Returns:
+        Duración de cada paso y el total, en segundos.
+    """
+    current_year = datetime.now().year
+    steps: List[Dict[str, Any]] = [
+        _timed_step('firestore_client', firestore_manager.get_db),
+        _timed_step(f'holidays_{current_year}',
+                    lambda: len(firestore_manager.get_all_holidays_for_year(current_year))),
+        _timed_step(f'holidays_{current_year + 1}',
+                    lambda: len(firestore_manager.get_all_holidays_for_year(current_year + 1))),
+        _timed_step('ruc_connection', services.warm_ruc_connection),
+    ]
+    if excel_pool.is_enabled():
+        steps.append(_timed_step('excel_pool', excel_pool.start_pool))
+
+    report = {
+        'ok': all(step['ok'] for step in steps),
+        'total_seconds': round(sum(step['seconds'] for step in steps), 4),
+        'steps': steps,
+    }
+    logger.info("Warm-up finished in %.3fs", report['total_seconds'], extra={'warmup': report})
+    return report
+
+def start_background_warmup() -> threading.Thread:
+    """Ejecuta el warm-up en un hilo para no retrasar la carga de la app."""
+    thread = threading.Thread(target=run_warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,70 @@
+"""
+Standalone WSGI entry point for running the API under gunicorn (outside Cloud Functions).
+
+La app se importa una sola vez en el proceso maestro (`preload_app`) y los
+workers la heredan ya cargada. Todo lo que no puede compartirse entre procesos
+(cliente de Firestore/gRPC, sesión HTTP, hilos de logging y pools) se crea de
+nuevo en cada worker desde el hook `post_fork` de gunicorn.conf.py.
+
+Uso (desde la carpeta functions):
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python wsgi.py                      # equivalente
+"""
+import os
+import runpy
+import tempfile
+
+# Debe definirse antes de importar main: la app no arranca el pool de Excel ni el
+# warm-up en el proceso maestro (ver main.start_instance_services).
+os.environ["PREFORK_SERVER"] = "1"
+
+import admission  # noqa: E402
+import excel_pool  # noqa: E402
+import firestore_manager  # noqa: E402
+import main  # noqa: E402
+import metrics  # noqa: E402
+import ruc_client  # noqa: E402
+import services  # noqa: E402
+import structured_logging  # noqa: E402
+
+app = main.app
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+# Directorio donde cada worker vuelca sus métricas para que /api/metrics las sume.
+METRICS_MULTIPROCESS_DIR = os.environ.get(
+    "METRICS_MULTIPROCESS_DIR", os.path.join(tempfile.gettempdir(), "planificador_metrics")
+)
+
+def init_master() -> None:
+    """Prepara el proceso maestro antes de crear los workers."""
+    metrics.enable_multiprocess(METRICS_MULTIPROCESS_DIR)
+
+def init_worker() -> None:
+    """Prepara un worker recién creado: estado propio por proceso y recursos de la instancia."""
+    structured_logging.reset_after_fork()
+    metrics.reset_after_fork()
+    firestore_manager.reset_after_fork()
+    services.reset_after_fork()
+    ruc_client.reset_after_fork()
+    admission.reset_after_fork()
+    excel_pool.reset_after_fork()
+    main.start_instance_services()
+
+def run(options: dict = None, wsgi_app=None) -> None:
+    """Ejecuta gunicorn con gunicorn.conf.py; `options` sobrescribe valores de la configuración."""
+    from gunicorn.app.base import BaseApplication
+
+    class StandaloneApplication(BaseApplication):
+        def load_config(self):
+            config = runpy.run_path(CONFIG_PATH)
+            for key, value in {**config, **(options or {})}.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return wsgi_app or app
+
+    StandaloneApplication().run()
+
+if __name__ == '__main__':
+    run()